@@ -22,43 +22,1243 @@ import videodb
 from videodb import connect
 from google import genai
 from google.genai import types
-from PIL import Image
+from PIL import Image, ImageDraw
 import json
 import time
+import hashlib
+import numpy as np
 import tempfile
 import os
+import shutil
+import subprocess
+import wave
+import sqlite3
+import zlib
+import uuid
+import threading
+import multiprocessing
+import textwrap
+import re
+import math
+import random
+import itertools
+import http.client
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import OrderedDict, Counter, deque
+import contextvars
+from contextlib import contextmanager, closing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 from io import BytesIO
 import base64
 from videodb.asset import VideoAsset, AudioAsset, ImageAsset
 from videodb.timeline import Timeline
+from image_preprocess import OUTPUT_RESOLUTION, preprocess_image_for_upload, preprocess_image_safe as _preprocess_image_safe
+
+
+# Local working directory for traces, caches and other per-install data
+EDENTIC_DATA_DIR = os.environ.get("EDENTIC_DATA_DIR", os.path.join(os.path.expanduser("~"), ".edentic"))
+TRACE_EXPORT_DIR = os.path.join(EDENTIC_DATA_DIR, "traces")
+
+# Active trace / span for the current job (propagated into worker threads via contextvars)
+_active_trace = contextvars.ContextVar("edentic_active_trace", default=None)
+_active_span = contextvars.ContextVar("edentic_active_span", default=None)
+
+
+def start_trace(job_name):
+    """Start a new pipeline trace and make it the active trace for this job"""
+    trace = {
+        'trace_id': uuid.uuid4().hex,
+        'name': job_name,
+        'start_ns': time.time_ns(),
+        'end_ns': None,
+        'spans': [],
+        'lock': threading.Lock()
+    }
+    _active_trace.set(trace)
+    _active_span.set(None)
+    return trace
+
+
+def finish_trace(trace):
+    """Close the trace and detach it from the current job"""
+    trace['end_ns'] = time.time_ns()
+    if _active_trace.get() is trace:
+        _active_trace.set(None)
+        _active_span.set(None)
+    return trace
+
+
+@contextmanager
+def trace_span(name, **attributes):
+    """Time a pipeline stage or remote call as a span in the active trace.
+    
+    Yields the span dict so callers can attach payload sizes or results
+    (e.g. span['attributes']['bytes'] = ...). Exceptions mark the span as
+    failed and are re-raised unchanged.
+    """
+    trace = _active_trace.get()
+    parent = _active_span.get()
+    span = {
+        'span_id': uuid.uuid4().hex[:16],
+        'parent_id': parent['span_id'] if parent else None,
+        'name': name,
+        'start_ns': time.time_ns(),
+        'end_ns': None,
+        'attributes': dict(attributes),
+        'status': 'ok',
+        'error': None
+    }
+    token = _active_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span['status'] = 'error'
+        span['error'] = f"{type(e).__name__}: {str(e)[:200]}"
+        raise
+    finally:
+        span['end_ns'] = time.time_ns()
+        _active_span.reset(token)
+        if trace is not None:
+            with trace['lock']:
+                trace['spans'].append(span)
+
+
+def _otlp_attribute(key, value):
+    """Encode a span attribute in OpenTelemetry (OTLP/JSON) form"""
+    if isinstance(value, bool):
+        encoded = {'boolValue': value}
+    elif isinstance(value, int):
+        encoded = {'intValue': str(value)}
+    elif isinstance(value, float):
+        encoded = {'doubleValue': value}
+    else:
+        encoded = {'stringValue': str(value)}
+    return {'key': key, 'value': encoded}
+
+
+def export_trace(trace, path=None):
+    """Write the trace to a local OTLP/JSON file and return its path"""
+    if path is None:
+        os.makedirs(TRACE_EXPORT_DIR, exist_ok=True)
+        path = os.path.join(TRACE_EXPORT_DIR, f"{trace['trace_id']}.json")
+    
+    with trace['lock']:
+        spans = list(trace['spans'])
+    
+    otlp_spans = []
+    for span in spans:
+        otlp_span = {
+            'traceId': trace['trace_id'],
+            'spanId': span['span_id'],
+            'name': span['name'],
+            'kind': 1,  # SPAN_KIND_INTERNAL
+            'startTimeUnixNano': str(span['start_ns']),
+            'endTimeUnixNano': str(span['end_ns'] or span['start_ns']),
+            'attributes': [_otlp_attribute(k, v) for k, v in span['attributes'].items()],
+            'status': {'code': 2, 'message': span['error']} if span['status'] == 'error' else {'code': 1}
+        }
+        if span['parent_id']:
+            otlp_span['parentSpanId'] = span['parent_id']
+        otlp_spans.append(otlp_span)
+    
+    document = {
+        'resourceSpans': [{
+            'resource': {'attributes': [
+                _otlp_attribute('service.name', 'edentic'),
+                _otlp_attribute('edentic.job', trace['name'])
+            ]},
+            'scopeSpans': [{'scope': {'name': 'edentic.pipeline'}, 'spans': otlp_spans}]
+        }]
+    }
+    
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(document, f, indent=2)
+    return path
+
+
+def compute_critical_path(trace):
+    """Return the span ids on the critical path (latest-finishing chain from the root)"""
+    with trace['lock']:
+        spans = list(trace['spans'])
+    
+    children = {}
+    for span in spans:
+        children.setdefault(span['parent_id'], []).append(span)
+    
+    critical_path = []
+    candidates = children.get(None, [])
+    while candidates:
+        # The child that finishes last is the one that held up its parent
+        latest = max(candidates, key=lambda s: s['end_ns'] or s['start_ns'])
+        critical_path.append(latest['span_id'])
+        candidates = children.get(latest['span_id'], [])
+    return critical_path
+
+
+def render_trace_waterfall(trace):
+    """Show the trace as a waterfall chart with the critical path highlighted"""
+    with trace['lock']:
+        spans = sorted(trace['spans'], key=lambda s: s['start_ns'])
+    
+    if not spans:
+        st.info("ℹ️ No spans were recorded for this job")
+        return
+    
+    origin = min(span['start_ns'] for span in spans)
+    critical = set(compute_critical_path(trace))
+    depth = {}
+    rows = []
+    for span in spans:
+        depth[span['span_id']] = depth.get(span['parent_id'], -1) + 1
+        end_ns = span['end_ns'] or span['start_ns']
+        rows.append({
+            'span': ("  " * depth[span['span_id']]) + span['name'],
+            'start_s': (span['start_ns'] - origin) / 1e9,
+            'end_s': (end_ns - origin) / 1e9,
+            'duration_ms': round((end_ns - span['start_ns']) / 1e6, 1),
+            'status': span['status'],
+            'critical_path': span['span_id'] in critical,
+            'order': len(rows)
+        })
+    
+    st.vega_lite_chart({'values': rows}, {
+        'mark': {'type': 'bar', 'cornerRadius': 2},
+        'encoding': {
+            'y': {'field': 'span', 'type': 'nominal', 'sort': {'field': 'order'}, 'title': None},
+            'x': {'field': 'start_s', 'type': 'quantitative', 'title': 'seconds since job start'},
+            'x2': {'field': 'end_s'},
+            'color': {'field': 'critical_path', 'type': 'nominal', 'title': 'Critical path'},
+            'tooltip': [
+                {'field': 'span'}, {'field': 'duration_ms'}, {'field': 'status'}
+            ]
+        }
+    }, use_container_width=True)
+    
+    st.caption(f"⏱️ {len(rows)} spans recorded · critical path: " +
+               " → ".join(row['span'].strip() for row in rows if row['critical_path']))
+    st.dataframe(
+        [{k: row[k] for k in ('span', 'duration_ms', 'status', 'critical_path')} for row in rows],
+        use_container_width=True
+    )
+
+
+# Fair-share scheduling of remote capacity across the sessions sharing this process
+SCHEDULER_SLOTS = {'upload': 4, 'generate': 6, 'render': 2}
+SCHEDULER_EXPECTED_SECONDS = {'upload': 20.0, 'generate': 10.0, 'render': 30.0}  # Charged at grant, corrected at release
+HEAVY_JOB_FILES = 20
+HEAVY_JOB_SECONDS = 180
+HEAVY_JOB_WEIGHT = 0.5
+
+_active_tenant = contextvars.ContextVar("edentic_active_tenant", default=None)
+
+
+@st.cache_resource
+def _scheduler():
+    """Slot table shared by every session; a cached resource because each rerun re-executes this module"""
+    return {
+        'condition': threading.Condition(),
+        'state': {kind: {'in_use': 0, 'waiting': [], 'usage': {}, 'pending': {}, 'active': {}} for kind in SCHEDULER_SLOTS},
+        'tickets': itertools.count()
+    }
+
+
+def job_weight(file_count, target_duration):
+    """Scheduling weight for a job: large projects get a smaller share so they cannot starve small ones"""
+    if file_count > HEAVY_JOB_FILES or target_duration > HEAVY_JOB_SECONDS:
+        return HEAVY_JOB_WEIGHT
+    return 1.0
+
+
+@contextmanager
+def tenant_scope(tenant_id, weight=1.0):
+    """Attribute remote work in this context (and threads started with copy_context) to a tenant"""
+    token = _active_tenant.set({'id': tenant_id, 'weight': max(float(weight), 0.01)})
+    try:
+        yield
+    finally:
+        _active_tenant.reset(token)
+
+
+def _next_scheduled(state):
+    """Waiting ticket of the least-served tenant, oldest first within a tenant"""
+    return min(state['waiting'], key=lambda ticket: (state['usage'][ticket[1]], ticket[0]))
+
+
+@contextmanager
+def scheduler_slot(kind):
+    """Hold one of the process-wide `kind` slots, granted by weighted fair share across tenants.
+    
+    Usage is charged in slot-seconds divided by the tenant's weight. Work outside a
+    tenant scope (scripts, benchmarks) is not queued. Queue time is recorded on the
+    active span as queued_ms.
+    """
+    tenant = _active_tenant.get()
+    if tenant is None:
+        yield
+        return
+    
+    scheduler = _scheduler()
+    condition, state = scheduler['condition'], scheduler['state'][kind]
+    tenant_id, weight = tenant['id'], tenant['weight']
+    expected = SCHEDULER_EXPECTED_SECONDS[kind]
+    ticket = (next(scheduler['tickets']), tenant_id)
+    queued = time.perf_counter()
+    with condition:
+        if not state['active'].get(tenant_id):
+            # A tenant returning from idle starts level with the least-served active tenant, not with banked credit
+            # (measured without charges for slots still running, which have not been served yet)
+            floor = min((state['usage'][t] - state['pending'].get(t, 0.0) for t, n in state['active'].items() if n), default=0.0)
+            state['usage'][tenant_id] = max(state['usage'].get(tenant_id, 0.0), floor)
+        state['active'][tenant_id] = state['active'].get(tenant_id, 0) + 1
+        state['waiting'].append(ticket)
+        while state['in_use'] >= SCHEDULER_SLOTS[kind] or _next_scheduled(state) is not ticket:
+            condition.wait()
+        state['waiting'].remove(ticket)
+        state['in_use'] += 1
+        state['usage'][tenant_id] += expected / weight
+        state['pending'][tenant_id] = state['pending'].get(tenant_id, 0.0) + expected / weight
+        # More than one slot may be free; let the next waiter re-check
+        condition.notify_all()
+    
+    started = time.perf_counter()
+    span = _active_span.get()
+    if span is not None:
+        span['attributes']['queued_ms'] = round((started - queued) * 1000, 1)
+    try:
+        yield
+    finally:
+        with condition:
+            state['in_use'] -= 1
+            state['usage'][tenant_id] += (time.perf_counter() - started - expected) / weight
+            state['pending'][tenant_id] -= expected / weight
+            state['active'][tenant_id] -= 1
+            if not any(state['active'].values()):
+                # Everyone is idle: forget history so the tables do not grow with every session
+                state['usage'].clear()
+                state['pending'].clear()
+                state['active'].clear()
+            condition.notify_all()
+
+
+# Per-job resource metering; a job is refused calls that would take it over a budget (0 = unlimited)
+RESOURCE_BUDGETS = {
+    'llm_tokens': int(os.environ.get("EDENTIC_BUDGET_LLM_TOKENS", 500000)),
+    'voice_seconds': float(os.environ.get("EDENTIC_BUDGET_VOICE_SECONDS", 900)),
+    'video_seconds': float(os.environ.get("EDENTIC_BUDGET_VIDEO_SECONDS", 120)),
+    'upload_bytes': int(os.environ.get("EDENTIC_BUDGET_UPLOAD_BYTES", 8 * 1024 ** 3)),
+    'index_calls': int(os.environ.get("EDENTIC_BUDGET_INDEX_CALLS", 200)),
+    'renders': int(os.environ.get("EDENTIC_BUDGET_RENDERS", 4)),  # generate_stream() calls: previews and fallbacks count
+    'rendered_seconds': float(os.environ.get("EDENTIC_BUDGET_RENDERED_SECONDS", 3600)),
+}
+USAGE_LEDGER_PATH = os.path.join(EDENTIC_DATA_DIR, "usage.jsonl")
+
+_active_meter = contextvars.ContextVar("edentic_active_meter", default=None)
+
+
+class BudgetExceeded(RuntimeError):
+    """A remote call was refused because it would take the job over one of its resource budgets"""
+
+
+def start_meter(job_name, budgets=None):
+    """Fresh usage meter for one job"""
+    return {
+        'job': job_name,
+        'budgets': dict(RESOURCE_BUDGETS if budgets is None else budgets),
+        'usage': {},
+        'refused': {},
+        'lock': threading.Lock()
+    }
+
+
+@contextmanager
+def meter_scope(meter):
+    """Charge remote work in this context (and threads started with copy_context) to a job's meter"""
+    token = _active_meter.set(meter)
+    try:
+        yield meter
+    finally:
+        _active_meter.reset(token)
+
+
+def charge(enforce=True, **amounts):
+    """Charge resource amounts to the active job's meter and record them on the active span.
+    
+    With enforce, a charge that would exceed any budget charges nothing and raises
+    BudgetExceeded, so call it before the remote call. Amounts only known afterwards
+    (response tokens, measured voice length) are charged with enforce=False. Work
+    outside a job (scripts, benchmarks) is not metered.
+    """
+    meter = _active_meter.get()
+    if meter is None:
+        return
+    
+    with meter['lock']:
+        if enforce:
+            for resource, amount in amounts.items():
+                budget = meter['budgets'].get(resource)
+                used = meter['usage'].get(resource, 0)
+                if budget and used + amount > budget:
+                    meter['refused'][resource] = meter['refused'].get(resource, 0) + 1
+                    raise BudgetExceeded(f"this job's {resource} budget of {budget:g} is spent ({used:g} used)")
+        for resource, amount in amounts.items():
+            meter['usage'][resource] = meter['usage'].get(resource, 0) + amount
+    
+    span = _active_span.get()
+    if span is not None:
+        for resource, amount in amounts.items():
+            span['attributes'][f"usage.{resource}"] = span['attributes'].get(f"usage.{resource}", 0) + amount
+
+
+def budget_remaining(resource):
+    """How much of a resource the active job may still use (inf outside a job or without a budget)"""
+    meter = _active_meter.get()
+    if meter is None or not meter['budgets'].get(resource):
+        return math.inf
+    with meter['lock']:
+        return meter['budgets'][resource] - meter['usage'].get(resource, 0)
+
+
+def response_token_count(response):
+    """Output tokens Gemini reports for a response, estimated from its text when it reports none"""
+    count = getattr(getattr(response, 'usage_metadata', None), 'candidates_token_count', None)
+    if count:
+        return count
+    try:
+        return estimate_tokens(response.text or "")
+    except Exception:
+        return 0
+
+
+def usage_summary(meter, trace=None):
+    """JSON-ready record of what a job used, against its budgets"""
+    with meter['lock']:
+        usage = {resource: round(amount, 1) for resource, amount in meter['usage'].items()}
+        refused = dict(meter['refused'])
+    summary = {
+        'job': meter['job'],
+        'usage': usage,
+        'budgets': {resource: meter['budgets'][resource] for resource in usage if meter['budgets'].get(resource)},
+        'refused': refused
+    }
+    if trace is not None:
+        summary['trace_id'] = trace['trace_id']
+        summary['started'] = trace['start_ns'] // 1_000_000_000
+        summary['seconds'] = round(((trace['end_ns'] or time.time_ns()) - trace['start_ns']) / 1e9, 1)
+    return summary
+
+
+def export_usage(summary, path=None):
+    """Append a job's usage summary to the local JSON Lines ledger and return its path"""
+    path = path or USAGE_LEDGER_PATH
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(summary, separators=(',', ':')) + "\n")
+    return path
+
+
+def format_usage(usage):
+    """One-line human summary of a usage dict"""
+    parts = []
+    if usage.get('renders'):
+        parts.append(f"{usage['renders']:g} renders ({usage.get('rendered_seconds', 0):.0f}s)")
+    if usage.get('llm_tokens'):
+        parts.append(f"{usage['llm_tokens'] / 1000:.1f}k LLM tokens")
+    if usage.get('voice_seconds'):
+        parts.append(f"{usage['voice_seconds']:.0f}s voice")
+    if usage.get('video_seconds'):
+        parts.append(f"{usage['video_seconds']:.0f}s generated video")
+    if usage.get('upload_bytes'):
+        parts.append(f"{usage['upload_bytes'] / (1024 * 1024):.1f} MB uploaded")
+    if usage.get('index_calls'):
+        parts.append(f"{usage['index_calls']:g} index calls")
+    return ", ".join(parts) or "no remote work"
+
+
+# Background prewarming: the next session's API clients are built (TLS handshakes, collection
+# metadata) and the local stores opened while the landing page renders, before anyone clicks
+PREWARM_WAIT_SECONDS = 30.0  # Longest a session waits for clients still warming before building its own
+PREWARM_MODEL = "gemini-2.5-flash"
+
+
+@st.cache_resource
+def _prewarm_pool():
+    """Process-wide prewarm state, cached as a resource because the script module is re-executed on every rerun"""
+    return {
+        'lock': threading.Lock(),
+        'spare': None,
+        'local_ready': None,
+        'executor': ThreadPoolExecutor(max_workers=2, thread_name_prefix="edentic-prewarm")
+    }
+
+
+def read_api_keys():
+    """(VideoDB key, Google key) from Streamlit secrets; None for a missing key, both None without a secrets file"""
+    try:
+        return st.secrets.get("VIDEODB_API_KEY") or None, st.secrets.get("GOOGLE_API_KEY") or None
+    except Exception:
+        return None, None
+
+
+def require_api_keys():
+    """(VideoDB key, Google key) from Streamlit secrets; stops the script with an error if either is missing"""
+    videodb_api_key, google_api_key = read_api_keys()
+    if not videodb_api_key or not google_api_key:
+        st.error("⚠️ API keys not found in secrets. Please configure VIDEODB_API_KEY and GOOGLE_API_KEY in your Streamlit secrets.")
+        st.stop()
+    return videodb_api_key, google_api_key
+
+
+def build_clients(videodb_api_key, google_api_key, warm=False):
+    """Connect to VideoDB (fetching the collection) and create the GenAI client.
+    
+    With warm, one free metadata call opens the GenAI connection too, so the
+    first real request skips the TLS handshake. Returns (conn, collection, genai_client).
+    """
+    conn = connect(api_key=videodb_api_key)
+    collection = conn.get_collection()
+    # Pass the key directly: the process environment is shared by every session
+    genai_client = genai.Client(api_key=google_api_key)
+    if warm:
+        try:
+            genai_client.models.get(model=PREWARM_MODEL)
+        except Exception:
+            pass  # Best effort; the first real call reports real problems
+    return conn, collection, genai_client
+
+
+def prewarm_local():
+    """Open the local stores, register image codecs and sweep scratch space; returns the seconds taken"""
+    started = time.perf_counter()
+    Image.init()
+    with closing(_metadata_connect()):
+        pass
+    with closing(_shared_cache_connect()):
+        pass
+    sweep_scratch_once()
+    return time.perf_counter() - started
+
+
+def start_prewarm(videodb_api_key, google_api_key):
+    """Warm a spare set of clients, and once per process the local stores, in the background; returns at once"""
+    pool = _prewarm_pool()
+    keys = (videodb_api_key, google_api_key)
+    with pool['lock']:
+        if pool['local_ready'] is None:
+            pool['local_ready'] = pool['executor'].submit(prewarm_local)
+        if pool['spare'] is None or pool['spare']['keys'] != keys:
+            pool['spare'] = {'keys': keys, 'future': pool['executor'].submit(build_clients, videodb_api_key, google_api_key, True)}
+
+
+def prewarm_if_configured():
+    """Start prewarming when both API keys are configured; never raises or stops, so the landing page always renders"""
+    videodb_api_key, google_api_key = read_api_keys()
+    if not (videodb_api_key and google_api_key):
+        return False
+    try:
+        start_prewarm(videodb_api_key, google_api_key)
+    except Exception:
+        return False  # Best effort; init_clients() reports real problems when the user starts a job
+    return True
+
+
+def take_prewarmed_clients(videodb_api_key, google_api_key, wait=PREWARM_WAIT_SECONDS):
+    """Claim the spare clients for this session and start warming the next spare; None if there are none to claim"""
+    pool = _prewarm_pool()
+    with pool['lock']:
+        spare, pool['spare'] = pool['spare'], None
+    start_prewarm(videodb_api_key, google_api_key)
+    if spare is None or spare['keys'] != (videodb_api_key, google_api_key):
+        return None
+    try:
+        return spare['future'].result(timeout=wait)
+    except Exception:
+        return None
 
 
 def init_clients():
-    """Initialize VideoDB and Google GenAI clients"""
+    """Initialize VideoDB and Google GenAI clients, once per session, taking prewarmed ones when available"""
+    if 'clients' in st.session_state:
+        return st.session_state['clients']
+    
+    videodb_api_key, google_api_key = require_api_keys()
     try:
-        # Get API keys from Streamlit secrets
-        videodb_api_key = st.secrets.get("VIDEODB_API_KEY")
-        google_api_key = st.secrets.get("GOOGLE_API_KEY")
-        
-        if not videodb_api_key or not google_api_key:
-            st.error("⚠️ API keys not found in secrets. Please configure VIDEODB_API_KEY and GOOGLE_API_KEY in your Streamlit secrets.")
-            st.stop()
-        
-        # Initialize VideoDB connection (proper way according to docs)
-        conn = connect(api_key=videodb_api_key)
-        collection = conn.get_collection()
-        
-        # Set Google API key as environment variable for GenAI client
-        os.environ["GEMINI_API_KEY"] = google_api_key
-        genai_client = genai.Client()
-        
-        return conn, collection, genai_client
+        clients = take_prewarmed_clients(videodb_api_key, google_api_key)
+        if clients is None:
+            clients = build_clients(videodb_api_key, google_api_key)
+        st.session_state['clients'] = clients
+        return clients
         
     except Exception as e:
         st.error(f"❌ Failed to initialize clients: {str(e)}")
         st.stop()
 
 
+# Images are prepared before upload in worker processes running image_preprocess.py
+IMAGE_PREPROCESS_WORKERS = os.cpu_count() or 2
+
+VIDEO_EXTENSIONS = ['mp4', 'mov', 'avi', 'mkv', 'wmv']
+IMAGE_EXTENSIONS = ['jpg', 'jpeg', 'png', 'gif', 'bmp']
+AUDIO_EXTENSIONS = ['mp3', 'wav', 'aac', 'm4a']
+
+
+def detect_media_type(file_name):
+    """Return (file_extension, media_type) for an uploaded file name; media_type is None if unknown"""
+    file_extension = file_name.lower().split('.')[-1]
+    if file_extension in VIDEO_EXTENSIONS:
+        return file_extension, 'video'
+    if file_extension in IMAGE_EXTENSIONS:
+        return file_extension, 'image'
+    if file_extension in AUDIO_EXTENSIONS:
+        return file_extension, 'audio'
+    return file_extension, None
+
+
+def preprocess_images_for_upload(paths):
+    """Preprocess image files across a process pool; returns {original_path: (upload_path, before, after)}.
+    
+    Workers are spawned rather than forked (the Streamlit server is multi-threaded) and
+    run image_preprocess, which does not import this app. If the pool cannot start,
+    the images are prepared in this process and a warning says so.
+    """
+    if len(paths) <= 1:
+        return {path: _preprocess_image_safe(path) for path in paths}
+    
+    try:
+        with ProcessPoolExecutor(max_workers=min(IMAGE_PREPROCESS_WORKERS, len(paths)),
+                                 mp_context=multiprocessing.get_context("spawn")) as pool:
+            return dict(zip(paths, pool.map(_preprocess_image_safe, paths)))
+    except Exception as e:
+        st.warning(f"⚠️ Image worker processes unavailable ({type(e).__name__}: {str(e)}); preparing {len(paths)} images in this process")
+        return {path: _preprocess_image_safe(path) for path in paths}
+
+
+# Local metadata store: transcripts, scene indexes and index ids per VideoDB asset
+METADATA_DB_PATH = os.path.join(EDENTIC_DATA_DIR, "metadata.db")
+CONTENT_HASH_CHUNK_BYTES = 1 << 20
+
+_metadata_schema_ready = False
+_metadata_schema_lock = threading.Lock()
+
+
+def _metadata_connect():
+    """Open the metadata database, creating the schema on first use"""
+    global _metadata_schema_ready
+    os.makedirs(os.path.dirname(METADATA_DB_PATH), exist_ok=True)
+    db = sqlite3.connect(METADATA_DB_PATH, timeout=30)
+    db.row_factory = sqlite3.Row
+    if not _metadata_schema_ready:
+        with _metadata_schema_lock:
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS asset_metadata (
+                    asset_id TEXT PRIMARY KEY,
+                    collection_id TEXT,
+                    content_hash TEXT,
+                    media_type TEXT,
+                    duration REAL,
+                    spoken_indexed INTEGER DEFAULT 0,
+                    transcript BLOB,
+                    scene_index_id TEXT,
+                    scene_index BLOB,
+                    shots BLOB,
+                    updated_at REAL
+                )
+            """)
+            columns = {row['name'] for row in db.execute("PRAGMA table_info(asset_metadata)")}
+            if 'shots' not in columns:
+                db.execute("ALTER TABLE asset_metadata ADD COLUMN shots BLOB")
+            db.execute("CREATE INDEX IF NOT EXISTS asset_metadata_hash ON asset_metadata (content_hash, collection_id)")
+            db.commit()
+            _metadata_schema_ready = True
+    return db
+
+
+def _pack_blob(value):
+    """JSON-encode and compress a value for a BLOB column"""
+    return None if value is None else zlib.compress(json.dumps(value).encode('utf-8'))
+
+
+def _unpack_blob(blob):
+    """Inverse of _pack_blob"""
+    return None if blob is None else json.loads(zlib.decompress(blob).decode('utf-8'))
+
+
+def file_content_hash(path):
+    """sha256 of a file's bytes, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CONTENT_HASH_CHUNK_BYTES), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def upload_content_hash(uploaded_file):
+    """sha256 of an uploaded file's bytes, computed once per upload and remembered in the session by file id"""
+    file_id = getattr(uploaded_file, 'file_id', None)
+    hashes = st.session_state.setdefault('upload_hashes', {}) if file_id else {}
+    if file_id not in hashes:
+        hashes[file_id] = hashlib.sha256(uploaded_file.getvalue()).hexdigest()
+    return hashes[file_id]
+
+
+def load_asset_metadata(asset_id=None, content_hash=None, collection_id=None):
+    """Look up stored metadata by asset id, or by content hash within a collection; None if unknown"""
+    with closing(_metadata_connect()) as db:
+        if asset_id:
+            row = db.execute("SELECT * FROM asset_metadata WHERE asset_id = ?", (asset_id,)).fetchone()
+        else:
+            row = db.execute(
+                "SELECT * FROM asset_metadata WHERE content_hash = ? AND collection_id = ? ORDER BY updated_at DESC LIMIT 1",
+                (content_hash, collection_id)
+            ).fetchone()
+    if row is None:
+        return None
+    metadata = dict(row)
+    metadata['transcript'] = _unpack_blob(metadata['transcript'])
+    metadata['scene_index'] = _unpack_blob(metadata['scene_index'])
+    metadata['shots'] = _unpack_blob(metadata['shots'])
+    metadata['spoken_indexed'] = bool(metadata['spoken_indexed'])
+    return metadata
+
+
+def save_asset_metadata(asset_id, **fields):
+    """Insert or update an asset's metadata; only the given fields are changed"""
+    if 'transcript' in fields:
+        cache = _transcript_cache()
+        with cache['lock']:
+            cache['entries'].pop(asset_id, None)
+    for key in ('transcript', 'scene_index', 'shots'):
+        if key in fields:
+            fields[key] = _pack_blob(fields[key])
+    fields['updated_at'] = time.time()
+    columns = ", ".join(fields)
+    placeholders = ", ".join("?" for _ in fields)
+    updates = ", ".join(f"{column} = excluded.{column}" for column in fields)
+    with closing(_metadata_connect()) as db:
+        db.execute(
+            f"INSERT INTO asset_metadata (asset_id, {columns}) VALUES (?, {placeholders}) "
+            f"ON CONFLICT(asset_id) DO UPDATE SET {updates}",
+            (asset_id, *fields.values())
+        )
+        db.commit()
+
+
+def forget_asset_metadata(asset_id):
+    """Drop an asset whose remote copy no longer exists"""
+    with closing(_metadata_connect()) as db:
+        db.execute("DELETE FROM asset_metadata WHERE asset_id = ?", (asset_id,))
+        db.commit()
+    cache = _transcript_cache()
+    with cache['lock']:
+        cache['entries'].pop(asset_id, None)
+
+
+# Video transcripts live in the metadata store; records load them on access through a small shared LRU
+TRANSCRIPT_CACHE_ENTRIES = 64  # Decoded (text, index) pairs kept in memory for all sessions together
+
+
+@st.cache_resource
+def _transcript_cache():
+    """Recently used transcripts, shared by every session"""
+    return {'lock': threading.Lock(), 'entries': OrderedDict()}
+
+
+def load_stored_transcript(asset_id):
+    """(text, transcript index) of a video as saved in the metadata store; ("", empty index) if none was saved"""
+    cache = _transcript_cache()
+    with cache['lock']:
+        if asset_id in cache['entries']:
+            cache['entries'].move_to_end(asset_id)
+            return cache['entries'][asset_id]
+    
+    with closing(_metadata_connect()) as db:
+        row = db.execute("SELECT transcript FROM asset_metadata WHERE asset_id = ?", (asset_id,)).fetchone()
+    stored = (_unpack_blob(row['transcript']) if row else None) or {}
+    value = (stored.get('text') or "", build_transcript_index(stored.get('words') or []))
+    with cache['lock']:
+        cache['entries'][asset_id] = value
+        while len(cache['entries']) > TRANSCRIPT_CACHE_ENTRIES:
+            cache['entries'].popitem(last=False)
+    return value
+
+
+def load_scene_index(video):
+    """Scene index records for a video, fetched from VideoDB once and then served locally"""
+    metadata = load_asset_metadata(asset_id=video.id)
+    if not metadata or not metadata.get('scene_index_id'):
+        return None
+    if metadata.get('scene_index') is None:
+        with trace_span("get_scene_index", asset_id=video.id):
+            records = video.get_scene_index(metadata['scene_index_id'])
+        save_asset_metadata(video.id, scene_index=records)
+        return records
+    return metadata['scene_index']
+
+
+# Shared cache tier for memoized stage outputs, so replicas on one host (sharing the
+# data volume) reuse each other's work. SQLite WAL keeps readers from blocking the
+# writer; it needs a local filesystem, not a network mount.
+SHARED_CACHE_PATH = os.environ.get("EDENTIC_SHARED_CACHE_PATH", os.path.join(EDENTIC_DATA_DIR, "shared_cache.db"))
+SHARED_CACHE_MAX_BYTES = 512 * 1024 * 1024
+SHARED_CACHE_TOUCH_SECONDS = 60.0  # Reads refresh an entry's LRU time at most this often, to keep reads write-free
+
+_shared_cache_ready = set()
+_shared_cache_lock = threading.Lock()
+
+
+def _shared_cache_connect():
+    """Open the shared cache in WAL mode, creating the schema on first use in this process"""
+    path = SHARED_CACHE_PATH
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    db = sqlite3.connect(path, timeout=30, isolation_level=None)
+    if path not in _shared_cache_ready:
+        with _shared_cache_lock:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS cache_entries (
+                    namespace TEXT,
+                    key TEXT,
+                    value BLOB,
+                    size INTEGER,
+                    accessed_at REAL,
+                    PRIMARY KEY (namespace, key)
+                )
+            """)
+            db.execute("CREATE INDEX IF NOT EXISTS cache_entries_lru ON cache_entries (accessed_at)")
+            _shared_cache_ready.add(path)
+    db.execute("PRAGMA synchronous=NORMAL")
+    return db
+
+
+def shared_cache_get(namespace, key):
+    """Value stored under (namespace, key) by any process sharing the cache; None on a miss or cache error"""
+    try:
+        with closing(_shared_cache_connect()) as db:
+            row = db.execute("SELECT value, accessed_at FROM cache_entries WHERE namespace = ? AND key = ?",
+                             (namespace, key)).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            if now - row[1] > SHARED_CACHE_TOUCH_SECONDS:
+                db.execute("UPDATE cache_entries SET accessed_at = ? WHERE namespace = ? AND key = ?", (now, namespace, key))
+        return _unpack_blob(row[0])
+    except (sqlite3.Error, OSError):
+        return None
+
+
+def shared_cache_put(namespace, key, value):
+    """Store a JSON-able value atomically and evict least recently used entries beyond SHARED_CACHE_MAX_BYTES.
+
+    Returns False if the value was not stored (too large, or the cache is unavailable).
+    """
+    blob = _pack_blob(value)
+    if len(blob) > SHARED_CACHE_MAX_BYTES:
+        return False
+    try:
+        with closing(_shared_cache_connect()) as db:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                db.execute("INSERT OR REPLACE INTO cache_entries (namespace, key, value, size, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                           (namespace, key, blob, len(blob), time.time()))
+                excess = db.execute("SELECT COALESCE(SUM(size), 0) FROM cache_entries").fetchone()[0] - SHARED_CACHE_MAX_BYTES
+                if excess > 0:
+                    victims = []
+                    for rowid, size in db.execute("SELECT rowid, size FROM cache_entries ORDER BY accessed_at").fetchall():
+                        if excess <= 0:
+                            break
+                        victims.append((rowid,))
+                        excess -= size
+                    db.executemany("DELETE FROM cache_entries WHERE rowid = ?", victims)
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        return True
+    except (sqlite3.Error, OSError):
+        return False
+
+
+# Scratch space for spooled uploads and other working files: a directory per session under
+# one root, kept under a byte quota by evicting the least recently used files
+SCRATCH_ROOT = os.environ.get("EDENTIC_SCRATCH_DIR", os.path.join(tempfile.gettempdir(), "edentic-scratch"))
+SCRATCH_MAX_BYTES = int(os.environ.get("EDENTIC_SCRATCH_MAX_BYTES", 4 * 1024 ** 3))
+SCRATCH_IDLE_SECONDS = 24 * 3600  # Session directories untouched this long are removed by the startup sweep
+SCRATCH_GRACE_SECONDS = 60.0  # Files touched this recently are never evicted; another process may be using them
+
+
+@st.cache_resource
+def _scratch_state():
+    """Pin table and startup-sweep flag shared by every session; a cached resource because each rerun re-executes this module"""
+    return {'lock': threading.Lock(), 'pins': Counter(), 'swept': False}
+
+
+def scratch_dir(session_id=None):
+    """Scratch directory of a session (by default the active tenant's), created on demand"""
+    if session_id is None:
+        tenant = _active_tenant.get()
+        session_id = tenant['id'] if tenant else "shared"
+    path = os.path.join(SCRATCH_ROOT, session_id)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _scratch_files():
+    """(last used, size, path) of every complete file under the scratch root"""
+    entries = []
+    for directory, _, names in os.walk(SCRATCH_ROOT):
+        for name in names:
+            if name.endswith(".part"):
+                continue
+            path = os.path.join(directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue  # Removed by another process meanwhile
+            entries.append((stat.st_mtime, stat.st_size, path))
+    return entries
+
+
+def scratch_usage():
+    """Current scratch disk usage: bytes, files, session directories and the quota"""
+    entries = _scratch_files()
+    sessions = len({os.path.dirname(path) for _, _, path in entries})
+    return {'bytes': sum(size for _, size, _ in entries), 'files': len(entries), 'sessions': sessions,
+            'quota_bytes': SCRATCH_MAX_BYTES}
+
+
+def enforce_scratch_quota(incoming_bytes=0):
+    """Evict least recently used scratch files until incoming_bytes more fit under the quota; returns bytes freed.
+    
+    Pinned files and files touched within SCRATCH_GRACE_SECONDS are kept, even if
+    that leaves the quota exceeded for a while.
+    """
+    state = _scratch_state()
+    with state['lock']:
+        entries = sorted(_scratch_files())
+        total = sum(size for _, size, _ in entries)
+        freed = 0
+        now = time.time()
+        for used, size, path in entries:
+            if total + incoming_bytes <= SCRATCH_MAX_BYTES:
+                break
+            if state['pins'][path] or now - used < SCRATCH_GRACE_SECONDS:
+                continue
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            total -= size
+            freed += size
+    return freed
+
+
+def pin_scratch(paths):
+    """Protect files from eviction while a stage is using them; undo with unpin_scratch()"""
+    state = _scratch_state()
+    with state['lock']:
+        state['pins'].update(paths)
+
+
+def unpin_scratch(paths):
+    """Release pins taken by pin_scratch() or spool_upload()"""
+    state = _scratch_state()
+    with state['lock']:
+        for path in paths:
+            state['pins'][path] -= 1
+            if state['pins'][path] <= 0:
+                del state['pins'][path]
+
+
+def spool_upload(uploaded_file, session_id=None):
+    """Write an uploaded file to scratch space and pin it; a copy spooled earlier in the session is reused.
+    
+    Files are named by content hash, so every stage that gets the same upload reads
+    the same path. Release with unpin_scratch() when done; the file stays for reuse
+    until it is evicted.
+    """
+    data = uploaded_file.getvalue()
+    safe_name = re.sub(r'[^A-Za-z0-9._-]', '_', uploaded_file.name)[-80:]
+    path = os.path.join(scratch_dir(session_id), f"{upload_content_hash(uploaded_file)[:16]}_{safe_name}")
+    pin_scratch([path])
+    try:
+        if os.path.exists(path) and os.path.getsize(path) == len(data):
+            os.utime(path)
+            return path
+        enforce_scratch_quota(len(data))
+        with open(path + ".part", 'wb') as f:
+            f.write(data)
+        os.replace(path + ".part", path)
+    except BaseException:
+        unpin_scratch([path])
+        raise
+    return path
+
+
+def sweep_scratch(idle_seconds=SCRATCH_IDLE_SECONDS):
+    """Clear what crashed or abandoned sessions left behind: partial writes, idle session directories, then any excess over the quota"""
+    if not os.path.isdir(SCRATCH_ROOT):
+        return
+    now = time.time()
+    for entry in os.scandir(SCRATCH_ROOT):
+        if not entry.is_dir():
+            continue
+        files = [os.path.join(entry.path, name) for name in os.listdir(entry.path)]
+        last_used = max([entry.stat().st_mtime] + [os.path.getmtime(path) for path in files if os.path.exists(path)])
+        if now - last_used > idle_seconds:
+            shutil.rmtree(entry.path, ignore_errors=True)
+            continue
+        for path in files:
+            if path.endswith(".part") and os.path.exists(path) and now - os.path.getmtime(path) > SCRATCH_GRACE_SECONDS:
+                os.unlink(path)
+    enforce_scratch_quota()
+
+
+def sweep_scratch_once():
+    """Run the scratch sweep the first time the app starts in this process"""
+    state = _scratch_state()
+    with state['lock']:
+        if state['swept']:
+            return
+        state['swept'] = True
+    try:
+        sweep_scratch()
+    except OSError:
+        pass  # Best effort: a failed sweep must not stop the app from starting
+
+
+# Resumable chunked uploads through a chunk-accepting storage gateway. VideoDB then
+# ingests the assembled file by URL. Without a gateway, files go straight to VideoDB.
+UPLOAD_ENDPOINT = os.environ.get("EDENTIC_UPLOAD_ENDPOINT")
+UPLOAD_JOURNAL_DIR = os.path.join(EDENTIC_DATA_DIR, "uploads")
+UPLOAD_CHUNK_BYTES = 8 * 1024 * 1024
+RESUMABLE_UPLOAD_MIN_BYTES = 32 * 1024 * 1024
+UPLOAD_MAX_ATTEMPTS = 8
+UPLOAD_BACKOFF_SECONDS = 0.5
+UPLOAD_BACKOFF_MAX_SECONDS = 15.0
+
+# Transport failures worth retrying; HTTP 4xx responses other than 408/429 are not
+_RETRYABLE_UPLOAD_ERRORS = (urllib.error.URLError, http.client.HTTPException, ConnectionError, TimeoutError, OSError)
+
+
+def _upload_backoff(attempt):
+    """Exponential backoff with jitter between upload retries"""
+    delay = min(UPLOAD_BACKOFF_MAX_SECONDS, UPLOAD_BACKOFF_SECONDS * (2 ** attempt))
+    time.sleep(delay * (0.5 + random.random() / 2))
+
+
+def _upload_journal_path(content_hash):
+    return os.path.join(UPLOAD_JOURNAL_DIR, f"{content_hash}.json")
+
+
+def _load_upload_journal(content_hash, size, chunk_bytes, endpoint):
+    """Acknowledged chunks from an earlier attempt at the same file, or a fresh journal"""
+    fresh = {'content_hash': content_hash, 'size': size, 'chunk_bytes': chunk_bytes, 'endpoint': endpoint, 'acked': []}
+    try:
+        with open(_upload_journal_path(content_hash), 'r', encoding='utf-8') as f:
+            journal = json.load(f)
+    except (OSError, ValueError):
+        return fresh
+    if any(journal.get(key) != fresh[key] for key in ('size', 'chunk_bytes', 'endpoint')):
+        return fresh
+    return journal
+
+
+def _save_upload_journal(journal):
+    """Atomically persist the journal so a crash never leaves it half-written"""
+    os.makedirs(UPLOAD_JOURNAL_DIR, exist_ok=True)
+    path = _upload_journal_path(journal['content_hash'])
+    with open(path + ".part", 'w', encoding='utf-8') as f:
+        json.dump(journal, f)
+    os.replace(path + ".part", path)
+
+
+def _upload_request(url, method, data=None, headers=None, timeout=60):
+    """One HTTP request; returns (headers, body) and raises on transport errors or retryable statuses"""
+    request = urllib.request.Request(url, data=data, method=method, headers=headers or {})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.headers, response.read()
+    except urllib.error.HTTPError as e:
+        if e.code in (408, 429) or e.code >= 500:
+            raise ConnectionError(f"{method} {url} returned HTTP {e.code}") from e
+        raise
+
+
+def _is_retryable_upload_error(error):
+    """Transport failures, including ones wrapped by the VideoDB SDK, are retried; HTTP 4xx answers are not"""
+    if isinstance(error, urllib.error.HTTPError):
+        return False
+    cause = getattr(error, 'cause', None) or error.__cause__
+    return isinstance(error, _RETRYABLE_UPLOAD_ERRORS) or isinstance(cause, _RETRYABLE_UPLOAD_ERRORS)
+
+
+def _with_upload_retries(description, fn):
+    """Run fn, retrying transport failures with backoff"""
+    for attempt in range(UPLOAD_MAX_ATTEMPTS):
+        try:
+            return fn()
+        except Exception as e:
+            if not _is_retryable_upload_error(e):
+                raise
+            if attempt == UPLOAD_MAX_ATTEMPTS - 1:
+                raise ConnectionError(f"{description} failed after {UPLOAD_MAX_ATTEMPTS} attempts: {e}") from e
+            _upload_backoff(attempt)
+
+
+def resumable_upload(path, endpoint=UPLOAD_ENDPOINT, content_hash=None, chunk_bytes=UPLOAD_CHUNK_BYTES, progress=None):
+    """Upload a file in chunks, resuming from the local journal, and return the assembled file's URL.
+    
+    Protocol: PUT {endpoint}/{hash}/{index} for each chunk (the gateway echoes the chunk's
+    sha256 in X-Chunk-SHA256), then POST {endpoint}/{hash}/complete, which answers with
+    {"url": ..., "sha256": ...} for the assembled file.
+    """
+    content_hash = content_hash or file_content_hash(path)
+    size = os.path.getsize(path)
+    chunk_count = max(1, -(-size // chunk_bytes))
+    base_url = f"{endpoint.rstrip('/')}/{content_hash}"
+    journal = _load_upload_journal(content_hash, size, chunk_bytes, endpoint)
+    acked = set(journal['acked'])
+    
+    with open(path, 'rb') as f:
+        for index in range(chunk_count):
+            if index in acked:
+                continue
+            f.seek(index * chunk_bytes)
+            chunk = f.read(chunk_bytes)
+            chunk_hash = hashlib.sha256(chunk).hexdigest()
+            
+            def send_chunk():
+                headers, _ = _upload_request(f"{base_url}/{index}", 'PUT', data=chunk, headers={
+                    'Content-Type': 'application/octet-stream',
+                    'Content-Range': f"bytes {index * chunk_bytes}-{index * chunk_bytes + len(chunk) - 1}/{size}",
+                    'X-Chunk-SHA256': chunk_hash
+                })
+                if headers.get('X-Chunk-SHA256') != chunk_hash:
+                    raise ConnectionError(f"chunk {index} was not acknowledged intact")
+            
+            _with_upload_retries(f"Uploading chunk {index + 1}/{chunk_count}", send_chunk)
+            acked.add(index)
+            journal['acked'] = sorted(acked)
+            _save_upload_journal(journal)
+            if progress:
+                progress(len(acked) / chunk_count)
+    
+    def complete():
+        _, body = _upload_request(f"{base_url}/complete", 'POST', data=json.dumps({
+            'chunks': chunk_count, 'size': size, 'sha256': content_hash
+        }).encode('utf-8'), headers={'Content-Type': 'application/json'})
+        return json.loads(body.decode('utf-8'))
+    
+    result = _with_upload_retries("Completing upload", complete)
+    if result.get('sha256') != content_hash:
+        # The gateway assembled something else: start over next time rather than trust any chunk
+        os.unlink(_upload_journal_path(content_hash))
+        raise ValueError(f"Uploaded file hash mismatch for {os.path.basename(path)}")
+    
+    if os.path.exists(_upload_journal_path(content_hash)):
+        os.unlink(_upload_journal_path(content_hash))
+    return result['url']
+
+
+def upload_media_file(collection, path, media_type=None, content_hash=None, progress=None):
+    """Upload a spooled file to VideoDB, resumably for large files when a gateway is configured"""
+    name = os.path.splitext(os.path.basename(path))[0]
+    charge(upload_bytes=os.path.getsize(path))
+    if UPLOAD_ENDPOINT and os.path.getsize(path) >= RESUMABLE_UPLOAD_MIN_BYTES:
+        url = resumable_upload(path, content_hash=content_hash, progress=progress)
+        return _with_upload_retries("Registering upload", lambda: collection.upload(url=url, media_type=media_type, name=name))
+    return _with_upload_retries("Upload", lambda: collection.upload(file_path=path, media_type=media_type))
+
+
+# Compact, read-only media asset records; the pipeline reads them like dicts
+_RECORD_MISSING = object()
+_RECORD_STORED = object()  # Transcript and index are read from the metadata store on access
+
+
+class MediaAssetRecord:
+    """Immutable media asset with dict-style read access.
+    
+    Videos whose transcript is in the metadata store pass transcript=_RECORD_STORED
+    (and transcript_index=_RECORD_STORED), so neither is held per session; they are
+    loaded through load_stored_transcript() on access. Other transcripts are kept
+    zlib-compressed. The SDK handle is stored once and served under both 'asset'
+    and 'video_obj'.
+    """
+    __slots__ = ('name', 'asset_id', 'media_type', 'description', 'duration', 'file_extension', 'transcript_index',
+                 'shots', 'generated', 'generation_type', 'speech_start', 'speech_end', '_handle', '_transcript')
+    _PLAIN_KEYS = ('name', 'asset_id', 'media_type', 'description', 'duration', 'file_extension', 'transcript_index',
+                   'shots', 'generated', 'generation_type', 'speech_start', 'speech_end')
+    
+    def __init__(self, asset=_RECORD_MISSING, transcript=_RECORD_MISSING, video_obj=None, **fields):
+        unknown = set(fields) - set(self._PLAIN_KEYS)
+        if unknown:
+            raise TypeError(f"Unknown asset fields: {', '.join(sorted(unknown))}")
+        for key in self._PLAIN_KEYS:
+            object.__setattr__(self, key, fields.get(key, _RECORD_MISSING))
+        object.__setattr__(self, '_handle', asset)
+        if isinstance(transcript, str) and transcript:
+            transcript = zlib.compress(transcript.encode('utf-8'))
+        object.__setattr__(self, '_transcript', transcript)
+    
+    def __setattr__(self, key, value):
+        raise AttributeError("MediaAssetRecord is immutable; use replace()")
+    
+    def __delattr__(self, key):
+        raise AttributeError("MediaAssetRecord is immutable")
+    
+    def __getitem__(self, key):
+        if key == 'asset':
+            value = self._handle
+        elif key == 'video_obj':
+            value = _RECORD_MISSING if self._handle is _RECORD_MISSING else (self._handle if self.media_type == 'video' else None)
+        elif key == 'transcript':
+            value = self._transcript
+            if isinstance(value, bytes):
+                value = zlib.decompress(value).decode('utf-8')
+        elif key in self._PLAIN_KEYS:
+            value = getattr(self, key)
+        else:
+            raise KeyError(key)
+        if value is _RECORD_MISSING:
+            raise KeyError(key)
+        if value is _RECORD_STORED:
+            text, index = load_stored_transcript(self.asset_id)
+            value = text if key == 'transcript' else index
+        return value
+    
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+    
+    def __contains__(self, key):
+        return self.get(key, _RECORD_MISSING) is not _RECORD_MISSING
+    
+    def keys(self):
+        return [key for key in ('asset', 'video_obj', 'transcript') + self._PLAIN_KEYS if key in self]
+    
+    def __iter__(self):
+        return iter(self.keys())
+    
+    def __len__(self):
+        return len(self.keys())
+    
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+    
+    def replace(self, **changes):
+        """Copy of the record with some fields changed; stored and compressed fields are copied as they are"""
+        fields = {key: getattr(self, key) for key in self._PLAIN_KEYS}
+        fields.update(asset=self._handle, transcript=self._transcript)
+        fields.update(changes)
+        return MediaAssetRecord(**fields)
+    
+    def __repr__(self):
+        return f"MediaAssetRecord(name={self.get('name')!r}, asset_id={self.get('asset_id')!r}, media_type={self.get('media_type')!r})"
+
+
 def upload_and_analyze_mixed_media(collection, uploaded_files, file_descriptions, project_description):
     """Upload mixed media (videos, images, audio) and analyze with user descriptions"""
     media_assets = []
@@ -69,48 +1269,119 @@ def upload_and_analyze_mixed_media(collection, uploaded_files, file_descriptions
     # Track video durations for early validation
     total_video_duration = 0
     video_count = 0
+    reused_count = 0
     
-    for i, uploaded_file in enumerate(uploaded_files):
+    # Spool uploads into this session's scratch space (pinned until each file is processed)
+    spooled_paths = []
+    try:
+        for uploaded_file in uploaded_files:
+            spooled_paths.append(spool_upload(uploaded_file))
+        
+        # Downscale and re-encode all images in parallel before any upload starts
+        image_paths = [path for f, path in zip(uploaded_files, spooled_paths) if detect_media_type(f.name)[1] == 'image']
+        prepared_images = {}
+        if image_paths:
+            status_text.text(f"🖼️ Preparing {len(image_paths)} images for upload...")
+            with trace_span("images.preprocess", images=len(image_paths)) as span:
+                prepared_images = preprocess_images_for_upload(image_paths)
+                bytes_before = sum(before for _, before, _ in prepared_images.values())
+                bytes_after = sum(after for _, _, after in prepared_images.values())
+                span['attributes'].update(bytes_before=bytes_before, bytes_after=bytes_after)
+            if bytes_after < bytes_before:
+                st.info(f"🖼️ Prepared {len(image_paths)} images at {OUTPUT_RESOLUTION[0]}x{OUTPUT_RESOLUTION[1]}: "
+                        f"{bytes_before / 1e6:.1f} MB → {bytes_after / 1e6:.1f} MB to upload")
+        
+        # Shot detection reads the spooled videos in the background while they upload
+        shot_futures = start_shot_detection([path for f, path in zip(uploaded_files, spooled_paths)
+                                             if detect_media_type(f.name)[1] == 'video'])
+    except BaseException:
+        # No file was processed: release the pins taken so far, or the spools stay unevictable for the life of the process
+        unpin_scratch(spooled_paths)
+        raise
+    
+    for i, (uploaded_file, tmp_file_path) in enumerate(zip(uploaded_files, spooled_paths)):
         file_desc = file_descriptions.get(uploaded_file.name, "")
         status_text.text(f"📤 Uploading {uploaded_file.name}...")
-        
-        # Save uploaded file temporarily
-        with tempfile.NamedTemporaryFile(delete=False, suffix=f"_{uploaded_file.name}") as tmp_file:
-            tmp_file.write(uploaded_file.read())
-            tmp_file_path = tmp_file.name
+        upload_path = prepared_images.get(tmp_file_path, (tmp_file_path,))[0]
         
         try:
             # Determine media type
-            file_extension = uploaded_file.name.lower().split('.')[-1]
-            media_type = None
-            
-            if file_extension in ['mp4', 'mov', 'avi', 'mkv', 'wmv']:
-                media_type = 'video'
-            elif file_extension in ['jpg', 'jpeg', 'png', 'gif', 'bmp']:
-                media_type = 'image'
-            elif file_extension in ['mp3', 'wav', 'aac', 'm4a']:
-                media_type = 'audio'
+            file_extension, media_type = detect_media_type(uploaded_file.name)
             
             # Upload to VideoDB
+            upload_bytes = os.path.getsize(upload_path)
+            transcript_index = None
+            shots = None
             if media_type == 'video':
-                asset = collection.upload(file_path=tmp_file_path)
-                # Index for search capabilities
-                status_text.text(f"🧠 Analyzing {uploaded_file.name}...")
-                try:
-                    asset.index_spoken_words()
-                    asset.index_scenes(prompt=f"Analyze this video: {file_desc}")
-                    transcript = asset.get_transcript_text()
-                except:
-                    transcript = ""
+                # Reuse the copy uploaded and indexed in an earlier session, if it still exists
+                content_hash = upload_content_hash(uploaded_file)
+                stored = load_asset_metadata(content_hash=content_hash, collection_id=collection.id)
+                asset = None
+                if stored:
+                    try:
+                        with trace_span("collection.get_video", file=uploaded_file.name, asset_id=stored['asset_id']):
+                            asset = collection.get_video(stored['asset_id'])
+                    except Exception:
+                        forget_asset_metadata(stored['asset_id'])
+                        stored = None
+                if asset is None:
+                    with trace_span("collection.upload", file=uploaded_file.name, media_type='video', bytes=upload_bytes), scheduler_slot('upload'):
+                        asset = upload_media_file(collection, tmp_file_path, content_hash=content_hash,
+                                                  progress=lambda done: status_text.text(f"📤 Uploading {uploaded_file.name}... {done:.0%}"))
+                    save_asset_metadata(asset.id, collection_id=collection.id, content_hash=content_hash, media_type='video')
+                
+                if (stored and stored['spoken_indexed'] and stored['scene_index_id'] and stored['scene_index'] is not None
+                        and stored['transcript'] is not None):
+                    transcript = transcript_index = _RECORD_STORED
+                    reused_count += 1
+                else:
+                    # Index for search capabilities, skipping steps already recorded for this asset
+                    status_text.text(f"🧠 Analyzing {uploaded_file.name}...")
+                    try:
+                        if not (stored and stored['spoken_indexed']):
+                            with trace_span("index_spoken_words", file=uploaded_file.name), scheduler_slot('upload'):
+                                charge(index_calls=1)
+                                asset.index_spoken_words()
+                            save_asset_metadata(asset.id, spoken_indexed=1)
+                        scene_index_id = stored['scene_index_id'] if stored else None
+                        if not scene_index_id:
+                            with trace_span("index_scenes", file=uploaded_file.name), scheduler_slot('upload'):
+                                charge(index_calls=1)
+                                scene_index_id = asset.index_scenes(prompt=f"Analyze this video: {file_desc}")
+                            save_asset_metadata(asset.id, scene_index_id=scene_index_id)
+                        # Record the scene descriptions now, so later sessions read them from the store
+                        load_scene_index(asset)
+                        with trace_span("get_transcript_text", file=uploaded_file.name) as span:
+                            transcript = asset.get_transcript_text()
+                            span['attributes']['chars'] = len(transcript or "")
+                        # get_transcript_text already fetched word-level segments; the record indexes them on access
+                        words = getattr(asset, 'transcript', None) or []
+                        save_asset_metadata(asset.id, transcript={'text': transcript or "", 'words': words})
+                        transcript = transcript_index = _RECORD_STORED
+                    except:
+                        transcript = ""
+                        mark_degraded("indexing failed", name=uploaded_file.name)
+                
+                if stored and stored['shots']:
+                    shots = stored['shots']
+                    shot_futures[tmp_file_path].cancel()
+                else:
+                    # Usually finished already: detection started before the upload
+                    shots = shot_futures[tmp_file_path].result()
+                    if shots:
+                        save_asset_metadata(asset.id, shots=shots)
             elif media_type == 'image':
-                asset = collection.upload(file_path=tmp_file_path)
+                with trace_span("collection.upload", file=uploaded_file.name, media_type='image', bytes=upload_bytes), scheduler_slot('upload'):
+                    asset = upload_media_file(collection, upload_path)
                 transcript = ""
             elif media_type == 'audio':
-                asset = collection.upload(file_path=tmp_file_path, media_type=videodb.MediaType.audio)
+                with trace_span("collection.upload", file=uploaded_file.name, media_type='audio', bytes=upload_bytes), scheduler_slot('upload'):
+                    asset = upload_media_file(collection, tmp_file_path, media_type=videodb.MediaType.audio)
                 transcript = ""
             else:
                 # Try as video by default
-                asset = collection.upload(file_path=tmp_file_path)
+                with trace_span("collection.upload", file=uploaded_file.name, media_type='video', bytes=upload_bytes), scheduler_slot('upload'):
+                    asset = upload_media_file(collection, tmp_file_path)
                 transcript = ""
                 media_type = 'video'
             
@@ -139,28 +1410,37 @@ def upload_and_analyze_mixed_media(collection, uploaded_files, file_descriptions
                     if asset_duration == 0:
                         st.warning(f"⚠️ Could not detect duration for {uploaded_file.name}, using default 10s")
                         asset_duration = 10  # Default 10 seconds for unknown duration
+                        mark_degraded("duration unknown", name=uploaded_file.name)
                     
                     if asset_duration > 0:
                         total_video_duration += asset_duration
                         video_count += 1
                         st.info(f"📹 {uploaded_file.name}: {asset_duration}s duration")
+                        save_asset_metadata(asset.id, duration=asset_duration)
                 except Exception as e:
                     st.warning(f"⚠️ Duration detection failed for {uploaded_file.name}: {str(e)}, using default 10s")
                     asset_duration = 10  # Fallback duration
+                    mark_degraded("duration unknown", name=uploaded_file.name)
                     total_video_duration += asset_duration
                     video_count += 1
             
-            media_assets.append({
-                'asset': asset,
-                'video_obj': asset if media_type == 'video' else None,  # Store video object for direct access
-                'name': uploaded_file.name,
-                'asset_id': asset.id,
-                'media_type': media_type,
-                'description': file_desc,
-                'transcript': transcript,
-                'file_extension': file_extension,
-                'duration': max(asset_duration, 5) if media_type == 'video' else asset_duration  # Ensure minimum 5s for videos
-            })
+            # The record reads the transcript from the metadata store; drop the SDK's copies
+            if media_type == 'video':
+                asset.transcript = None
+                asset.transcript_text = None
+            
+            media_assets.append(MediaAssetRecord(
+                asset=asset,  # Also served as 'video_obj' for videos
+                name=uploaded_file.name,
+                asset_id=asset.id,
+                media_type=media_type,
+                description=file_desc,
+                transcript=transcript,
+                transcript_index=transcript_index,
+                shots=shots,
+                file_extension=file_extension,
+                duration=max(asset_duration, 5) if media_type == 'video' else asset_duration  # Ensure minimum 5s for videos
+            ))
             
             # Update progress
             progress_bar.progress((i + 1) / len(uploaded_files))
@@ -168,11 +1448,14 @@ def upload_and_analyze_mixed_media(collection, uploaded_files, file_descriptions
         except Exception as e:
             st.error(f"❌ Failed to upload {uploaded_file.name}: {str(e)}")
         finally:
-            # Clean up temporary file
-            if os.path.exists(tmp_file_path):
-                os.unlink(tmp_file_path)
+            # The spooled original stays in scratch space for reuse; the prepared copy is not needed again
+            unpin_scratch([tmp_file_path])
+            if upload_path != tmp_file_path and os.path.exists(upload_path):
+                os.unlink(upload_path)
     
     status_text.text("✅ All media uploaded and analyzed!")
+    if reused_count:
+        st.info(f"♻️ Reused indexes and transcripts for {reused_count} previously analyzed video(s) - no re-indexing needed")
     
     # Provide duration feedback to user
     if video_count > 0 and total_video_duration > 0:
@@ -189,6 +1472,115 @@ def upload_and_analyze_mixed_media(collection, uploaded_files, file_descriptions
     return media_assets
 
 
+# Voiceover silence analysis on decoded PCM, used to trim AudioAsset ranges exactly
+SPEECH_BLOCK_SECONDS = 0.02
+SPEECH_THRESHOLD_DB = -40.0  # Relative to the loudest block of the track
+SPEECH_MIN_SILENCE_SECONDS = 0.3  # Pauses shorter than this stay inside a speech span
+SPEECH_MIN_SPAN_SECONDS = 0.1
+SPEECH_TRIM_PADDING_SECONDS = 0.1
+ANALYSIS_SAMPLE_RATE = 16000
+RMS_CHUNK_BLOCKS = 1 << 16  # Blocks per vectorized pass, bounds temporary memory on long tracks
+
+
+def decode_wav_pcm(data):
+    """Decode WAV bytes to (mono float32 samples in [-1, 1], sample_rate)"""
+    with wave.open(BytesIO(data), 'rb') as wav:
+        channels, width, sample_rate = wav.getnchannels(), wav.getsampwidth(), wav.getframerate()
+        raw = wav.readframes(wav.getnframes())
+    
+    if width == 1:
+        samples = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif width == 2:
+        samples = np.frombuffer(raw, dtype='<i2').astype(np.float32) / 32768.0
+    elif width == 3:
+        packed = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        values = packed[:, 0] | (packed[:, 1] << 8) | (packed[:, 2] << 16)
+        samples = (np.where(values >= 1 << 23, values - (1 << 24), values)).astype(np.float32) / float(1 << 23)
+    elif width == 4:
+        samples = np.frombuffer(raw, dtype='<i4').astype(np.float32) / float(1 << 31)
+    else:
+        raise ValueError(f"Unsupported WAV sample width: {width} bytes")
+    
+    if channels > 1:
+        samples = samples[:len(samples) - len(samples) % channels].reshape(-1, channels).mean(axis=1)
+    return samples, sample_rate
+
+
+def decode_audio_pcm(data):
+    """Decode audio bytes to mono float32 PCM; non-WAV input needs ffmpeg on PATH"""
+    if data[:4] == b'RIFF' and data[8:12] == b'WAVE':
+        return decode_wav_pcm(data)
+    
+    ffmpeg = shutil.which('ffmpeg')
+    if not ffmpeg:
+        raise ValueError("Audio is not WAV and ffmpeg is not available to decode it")
+    result = subprocess.run(
+        [ffmpeg, '-v', 'error', '-i', 'pipe:0', '-f', 's16le', '-ac', '1', '-ar', str(ANALYSIS_SAMPLE_RATE), 'pipe:1'],
+        input=data, capture_output=True, check=True
+    )
+    return np.frombuffer(result.stdout, dtype='<i2').astype(np.float32) / 32768.0, ANALYSIS_SAMPLE_RATE
+
+
+def rms_envelope(samples, sample_rate, block_seconds=SPEECH_BLOCK_SECONDS):
+    """RMS level per fixed-size block; the trailing partial block is dropped"""
+    block = max(1, int(round(sample_rate * block_seconds)))
+    count = len(samples) // block
+    frames = samples[:count * block].reshape(count, block)
+    envelope = np.empty(count, dtype=np.float32)
+    for start in range(0, count, RMS_CHUNK_BLOCKS):
+        chunk = frames[start:start + RMS_CHUNK_BLOCKS]
+        envelope[start:start + len(chunk)] = np.einsum('ij,ij->i', chunk, chunk)
+    np.sqrt(envelope / block, out=envelope)
+    return envelope
+
+
+def detect_speech_spans(samples, sample_rate, threshold_db=SPEECH_THRESHOLD_DB, min_silence=SPEECH_MIN_SILENCE_SECONDS,
+                        min_span=SPEECH_MIN_SPAN_SECONDS, block_seconds=SPEECH_BLOCK_SECONDS):
+    """Return an (n, 2) array of [start, end) speech spans in seconds"""
+    envelope = rms_envelope(samples, sample_rate, block_seconds)
+    if len(envelope) == 0 or envelope.max() <= 0:
+        return np.empty((0, 2))
+    
+    active = envelope > envelope.max() * 10 ** (threshold_db / 20.0)
+    edges = np.diff(np.concatenate(([0], active.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    
+    # Bridge short pauses between words and sentences
+    keep = (starts[1:] - ends[:-1]) * block_seconds >= min_silence
+    starts = np.concatenate((starts[:1], starts[1:][keep]))
+    ends = np.concatenate((ends[:-1][keep], ends[-1:]))
+    
+    spans = np.stack((starts, ends), axis=1) * block_seconds
+    return spans[spans[:, 1] - spans[:, 0] >= min_span]
+
+
+def analyze_voiceover(samples, sample_rate, padding=SPEECH_TRIM_PADDING_SECONDS):
+    """Speech spans plus trim points that drop leading and trailing silence"""
+    duration = len(samples) / float(sample_rate) if sample_rate else 0.0
+    spans = detect_speech_spans(samples, sample_rate)
+    if len(spans) == 0:
+        return {'duration': duration, 'spans': spans, 'trim_start': 0.0, 'trim_end': duration, 'speech_seconds': 0.0}
+    return {
+        'duration': duration,
+        'spans': spans,
+        'trim_start': max(0.0, float(spans[0, 0]) - padding),
+        'trim_end': min(duration, float(spans[-1, 1]) + padding),
+        'speech_seconds': float((spans[:, 1] - spans[:, 0]).sum())
+    }
+
+
+def analyze_audio_asset(audio_asset):
+    """Download a VideoDB audio asset and analyze its speech spans locally"""
+    with trace_span("audio.analyze", asset_id=audio_asset.id) as span:
+        with urllib.request.urlopen(audio_asset.generate_url(), timeout=60) as response:
+            data = response.read()
+        samples, sample_rate = decode_audio_pcm(data)
+        analysis = analyze_voiceover(samples, sample_rate)
+        span['attributes'].update(bytes=len(data), seconds=round(analysis['duration'], 2), spans=len(analysis['spans']))
+    return analysis
+
+
 def generate_missing_content(collection, genai_client, content_plan, media_assets):
     """Generate missing content (images, videos, music, voiceovers) using AI"""
     
@@ -212,15 +1604,29 @@ def generate_missing_content(collection, genai_client, content_plan, media_asset
                 st.info("🎬 **Professional Editing**: Generating voiceover for cropped video segments (best portions of your videos)")
                 
                 # Generate voiceover using VideoDB
-                voice_asset = collection.generate_voice(
-                    text=request.get('script', description),
-                    voice_name=request.get('voice_style', 'Default')
-                )
+                script = request.get('script', description)
+                estimated_voice_seconds = len(script.split()) * 0.4  # ~150 words per minute, corrected once measured
+                with trace_span("generate_voice", chars=len(script), words=len(script.split())), scheduler_slot('generate'):
+                    charge(voice_seconds=estimated_voice_seconds)
+                    voice_asset = collection.generate_voice(
+                        text=script,
+                        voice_name=request.get('voice_style', 'Default')
+                    )
+                
+                # Measure speech spans locally so silence can be trimmed at assembly
+                speech = None
+                try:
+                    speech = analyze_audio_asset(voice_asset)
+                    silence = speech['duration'] - (speech['trim_end'] - speech['trim_start'])
+                    if silence >= 0.5:
+                        st.info(f"✂️ Voiceover has {silence:.1f}s of leading/trailing silence that will be trimmed")
+                except Exception as analysis_error:
+                    st.info(f"💡 Skipping voiceover silence analysis: {str(analysis_error)}")
                 
                 # Get duration for the generated voice asset
                 try:
                     # Try to get duration from the asset
-                    voice_duration = getattr(voice_asset, 'duration', 0)
+                    voice_duration = speech['duration'] if speech else getattr(voice_asset, 'length', 0) or getattr(voice_asset, 'duration', 0)
                     if voice_duration <= 0:
                         # Fallback: estimate duration based on text length (rough: ~150 words per minute)
                         text_length = len(request.get('script', description).split())
@@ -235,33 +1641,38 @@ def generate_missing_content(collection, genai_client, content_plan, media_asset
                 except Exception as dur_error:
                     voice_duration = 30  # Safe fallback
                     st.warning(f"⚠️ Could not get voice duration, using fallback: {voice_duration}s")
+                charge(enforce=False, voice_seconds=voice_duration - estimated_voice_seconds)
                 
-                generated_assets.append({
-                    'asset': voice_asset,
-                    'name': f"generated_voiceover_{i}.mp3",
-                    'asset_id': voice_asset.id,
-                    'media_type': 'audio',
-                    'description': description,
-                    'duration': voice_duration,  # CRITICAL: Add duration to asset info
-                    'generated': True,
-                    'generation_type': 'voiceover'
-                })
+                generated_assets.append(MediaAssetRecord(
+                    asset=voice_asset,
+                    name=f"generated_voiceover_{i}.mp3",
+                    asset_id=voice_asset.id,
+                    media_type='audio',
+                    description=description,
+                    duration=voice_duration,  # CRITICAL: Add duration to asset info
+                    speech_start=speech['trim_start'] if speech else None,
+                    speech_end=speech['trim_end'] if speech else None,
+                    generated=True,
+                    generation_type='voiceover'
+                ))
                 
             elif content_type == 'video_clip':
                 # Generate video using VideoDB
-                video_asset = collection.generate_video(
-                    prompt=description,
-                    duration=request.get('duration', 5)
-                )
-                generated_assets.append({
-                    'asset': video_asset,
-                    'name': f"generated_video_{i}.mp4",
-                    'asset_id': video_asset.id,
-                    'media_type': 'video',
-                    'description': description,
-                    'generated': True,
-                    'generation_type': 'video_clip'
-                })
+                with trace_span("generate_video", chars=len(description), seconds=request.get('duration', 5)), scheduler_slot('generate'):
+                    charge(video_seconds=request.get('duration', 5))
+                    video_asset = collection.generate_video(
+                        prompt=description,
+                        duration=request.get('duration', 5)
+                    )
+                generated_assets.append(MediaAssetRecord(
+                    asset=video_asset,
+                    name=f"generated_video_{i}.mp4",
+                    asset_id=video_asset.id,
+                    media_type='video',
+                    description=description,
+                    generated=True,
+                    generation_type='video_clip'
+                ))
                 
             else:
                 # Skip other content types (title_image, background_music, etc.)
@@ -269,6 +1680,7 @@ def generate_missing_content(collection, genai_client, content_plan, media_asset
                 continue
                 
         except Exception as e:
+            mark_degraded(f"{content_type} generation failed")
             st.warning(f"⚠️ Failed to generate {content_type}: {str(e)}")
         
         progress_bar.progress((i + 1) / len(generation_requests))
@@ -277,83 +1689,212 @@ def generate_missing_content(collection, genai_client, content_plan, media_asset
     return generated_assets
 
 
-def generate_title_image_with_gemini(genai_client, description):
-    """Generate title image using Gemini's native image generation"""
-    try:
+# Generated title images, cached on disk by (model, description)
+TITLE_IMAGE_MODEL = "gemini-2.0-flash-preview-image-generation"
+IMAGE_CACHE_DIR = os.path.join(EDENTIC_DATA_DIR, "image_cache")
+IMAGE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+IMAGE_GENERATION_WORKERS = 4
+# Formats VideoDB accepts as-is; anything else is re-encoded to PNG
+PASSTHROUGH_IMAGE_TYPES = {'image/png': '.png', 'image/jpeg': '.jpg', 'image/webp': '.webp'}
+
+_image_cache_lock = threading.Lock()
+
+
+def _image_cache_key(model, description):
+    """Stable cache key for a generated image"""
+    return hashlib.sha256(f"{model}\n{description}".encode('utf-8')).hexdigest()
+
+
+def _image_cache_lookup(key):
+    """Return the cached file for a key (marking it recently used), or None"""
+    with _image_cache_lock:
+        if not os.path.isdir(IMAGE_CACHE_DIR):
+            return None
+        for name in os.listdir(IMAGE_CACHE_DIR):
+            if name.startswith(key + "."):
+                path = os.path.join(IMAGE_CACHE_DIR, name)
+                os.utime(path)
+                return path
+    return None
+
+
+def _image_cache_store(key, data, extension):
+    """Write image bytes into the cache atomically and evict least recently used files over the size cap"""
+    os.makedirs(IMAGE_CACHE_DIR, exist_ok=True)
+    path = os.path.join(IMAGE_CACHE_DIR, key + extension)
+    fd, tmp_path = tempfile.mkstemp(dir=IMAGE_CACHE_DIR, suffix=".part")
+    with os.fdopen(fd, 'wb') as tmp_file:
+        tmp_file.write(data)
+    os.replace(tmp_path, path)
+    
+    with _image_cache_lock:
+        entries = []
+        for name in os.listdir(IMAGE_CACHE_DIR):
+            if name.endswith(".part"):
+                continue
+            stat = os.stat(os.path.join(IMAGE_CACHE_DIR, name))
+            entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= IMAGE_CACHE_MAX_BYTES:
+                break
+            if name == os.path.basename(path):
+                continue
+            os.unlink(os.path.join(IMAGE_CACHE_DIR, name))
+            total -= size
+    return path
+
+
+def _generate_image_file(genai_client, description, model=TITLE_IMAGE_MODEL):
+    """Generate (or reuse) an image for a description; raises on failure. Safe to call from worker threads."""
+    key = _image_cache_key(model, description)
+    cached_path = _image_cache_lookup(key)
+    if cached_path:
+        return {'file_path': cached_path, 'cached': True}
+    
+    with trace_span("gemini.generate_image", model=model, chars=len(description)), scheduler_slot('generate'):
+        charge(llm_tokens=estimate_tokens(description))
         response = genai_client.models.generate_content(
-            model="gemini-2.0-flash-preview-image-generation",
+            model=model,
             contents=description,
             config=types.GenerateContentConfig(
                 response_modalities=['TEXT', 'IMAGE']
             )
         )
-        
-        # Save generated image
-        for part in response.candidates[0].content.parts:
-            if part.inline_data is not None:
-                image = Image.open(BytesIO(part.inline_data.data))
-                
-                # Save to temporary file
-                temp_path = tempfile.mktemp(suffix='.png')
-                image.save(temp_path)
-                
-                return {
-                    'file_path': temp_path,
-                    'image': image
-                }
-        
-        return None
-        
+        charge(enforce=False, llm_tokens=response_token_count(response))
+    
+    for part in response.candidates[0].content.parts:
+        if part.inline_data is not None:
+            data = part.inline_data.data
+            extension = PASSTHROUGH_IMAGE_TYPES.get(part.inline_data.mime_type)
+            if extension is None:
+                # Unknown container: decode once and store as PNG
+                buffer = BytesIO()
+                Image.open(BytesIO(data)).save(buffer, format='PNG')
+                data, extension = buffer.getvalue(), '.png'
+            return {'file_path': _image_cache_store(key, data, extension), 'cached': False}
+    
+    raise ValueError("Gemini returned no image data")
+
+
+def generate_title_image_with_gemini(genai_client, description):
+    """Generate title image using Gemini's native image generation"""
+    try:
+        return _generate_image_file(genai_client, description)
     except Exception as e:
         st.warning(f"⚠️ Failed to generate image with Gemini: {str(e)}")
         return None
-def create_comprehensive_content_plan(genai_client, media_assets, project_description, target_duration):
-    """Create a comprehensive content plan based on available assets and project description"""
+
+
+def generate_title_images(genai_client, descriptions):
+    """Generate several title images concurrently; returns results in input order (None for failures)"""
+    results = [None] * len(descriptions)
+    if not descriptions:
+        return results
     
-    # Gather all available media information with cropping context
-    media_summary = []
-    video_assets = [asset for asset in media_assets if asset['media_type'] == 'video']
+    with ThreadPoolExecutor(max_workers=min(IMAGE_GENERATION_WORKERS, len(descriptions))) as pool:
+        futures = {
+            pool.submit(contextvars.copy_context().run, _generate_image_file, genai_client, description): i
+            for i, description in enumerate(descriptions)
+        }
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                results[i] = future.result()
+            except Exception as e:
+                st.warning(f"⚠️ Failed to generate image with Gemini: {str(e)}")
     
-    for asset in media_assets:
-        asset_info = f"Asset: {asset['name']} ({asset['media_type']})\n"
-        asset_info += f"Description: {asset['description']}\n"
-        
-        # For video assets, explain the cropping that will be applied
-        if asset['media_type'] == 'video' and asset.get('duration', 0) > 0:
-            source_duration = asset.get('duration', 10)
-            # Calculate the actual cropped segment that will be used
-            max_usable_duration = source_duration * 0.90  # Use up to 90% of source
-            start_offset = min(1, source_duration * 0.1)  # Start slightly into the video
-            
-            asset_info += f"Original Duration: {source_duration:.1f}s\n"
-            asset_info += f"IMPORTANT - Cropped Segment: Will use {max_usable_duration:.1f}s starting from {start_offset:.1f}s (skipping beginning/end)\n"
-            asset_info += f"Actual Content Window: {start_offset:.1f}s to {start_offset + max_usable_duration:.1f}s of the original video\n"
-        
-        if asset['transcript']:
-            # For video transcripts, note that content analysis is from full video but only portion will be used
-            if asset['media_type'] == 'video':
-                asset_info += f"Full Video Transcript (NOTE: Only middle portion will be used in final video): {asset['transcript'][:300]}...\n"
-            else:
-                asset_info += f"Content: {asset['transcript'][:200]}...\n"
-        media_summary.append(asset_info)
+    cached = sum(1 for result in results if result and result['cached'])
+    if cached:
+        st.info(f"♻️ Reused {cached} of {len(descriptions)} title images from cache")
+    return results
+
+
+# Prompt size budget for the planning call (~4 characters per token)
+PLAN_PROMPT_TOKEN_BUDGET = 6000
+PLAN_PROMPT_MIN_TRANSCRIPT_CHARS = 80
+PLAN_PROMPT_MAX_TRANSCRIPT_CHARS = 600
+PLAN_PROMPT_MAX_DESCRIPTION_CHARS = 300
+PLAN_PROMPT_HEADER_SHARE = 0.6  # Share of the asset budget for per-asset blocks; the rest is kept for transcripts
+
+
+def estimate_tokens(text):
+    """Rough token estimate for Gemini prompts (~4 characters per token)"""
+    return (len(text) + 3) // 4
+
+
+def _truncate_at_word(text, max_chars):
+    """Collapse whitespace and cut text at a word boundary"""
+    text = " ".join((text or "").split())
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind(" ", 0, max_chars)
+    return text[:cut if cut > max_chars // 2 else max_chars].rstrip(" ,.;:") + "…"
+
+
+def rank_assets_for_prompt(media_assets):
+    """Order assets by how much detail they are likely to contribute to the plan"""
+    def score(asset):
+        value = 3.0 if asset['media_type'] == 'video' else 1.0
+        if asset.get('transcript'):
+            value += 2.0
+        value += min(len(asset.get('description') or ""), 200) / 100.0
+        value += min(asset.get('duration', 0) or 0, 120) / 60.0
+        return value
+    
+    return sorted(media_assets, key=score, reverse=True)
+
+
+def usable_source_seconds(source_duration):
+    """Most seconds of a source video the editor will use, matching allocate_clip_durations"""
+    return source_duration * CLIP_USABLE_FRACTION
+
+
+def _asset_prompt_header(asset):
+    """Compact per-asset block without the transcript excerpt"""
+    asset_info = f"Asset: {asset['name']} ({asset['media_type']})\n"
+    if asset.get('description'):
+        asset_info += f"Description: {_truncate_at_word(asset['description'], PLAN_PROMPT_MAX_DESCRIPTION_CHARS)}\n"
+    
+    if asset['media_type'] == 'video' and asset.get('duration', 0) > 0:
+        source_duration = asset.get('duration', 10)
+        asset_info += f"Duration: {source_duration:.1f}s | Usable: up to {usable_source_seconds(source_duration):.1f}s\n"
+    return asset_info
+
+
+def _asset_prompt_oneliner(asset):
+    """Single-line summary for assets that do not fit the detailed budget"""
+    if asset['media_type'] == 'video' and asset.get('duration', 0) > 0:
+        return f"{asset['name']} (video, {asset['duration']:.0f}s)"
+    return f"{asset['name']} ({asset['media_type']})"
+
+
+def build_content_plan_prompt(media_assets, project_description, target_duration, token_budget=PLAN_PROMPT_TOKEN_BUDGET):
+    """Build the planning prompt within a token budget.
     
-    combined_media = "\n---\n".join(media_summary)
+    Assets are ranked; the highest-ranked ones get a detailed block and an
+    adaptively sized transcript excerpt, the rest are folded into one-line
+    summaries. The cropping rules are stated once instead of per asset.
+    Returns (prompt, stats).
+    """
+    word_target = int((target_duration / 60) * 160)
     
-    prompt = f"""You are an expert multimedia content creator and video editor. Based on the project description and available assets, create a comprehensive content plan focusing on professional video editing and sequencing.
+    def render(asset_blocks):
+        return f"""You are an expert multimedia content creator and video editor. Based on the project description and available assets, create a comprehensive content plan focusing on professional video editing and sequencing.
 
-CRITICAL: The videos will be CROPPED to use only the best portions (typically starting 10% into the video and using 90% of content, avoiding boring beginnings/endings). Your voiceover script must match the CROPPED content that will actually appear in the final video, NOT the full original videos.
+CRITICAL: The videos will be CROPPED to use only the best portions. Each clip takes at most {CLIP_USABLE_FRACTION:.0%} of its source, starting at the liveliest stretch of footage when shot data is available, with cuts moved onto sentence boundaries so speech is never clipped mid-sentence. Each video lists how many seconds of it can appear. Transcripts cover the FULL video, but only the cropped portions will appear. Your voiceover script must match the CROPPED content that will actually appear in the final video, NOT the full original videos.
 
 PROJECT DESCRIPTION:
 {project_description}
 
 TARGET DURATION: {target_duration} seconds
 
-AVAILABLE ASSETS (with cropping information):
-{combined_media}
+AVAILABLE ASSETS ({len(media_assets)} total):
+{asset_blocks}
 
 Create a detailed content plan that focuses on video editing and sequencing. DO NOT generate background music or title images. Focus on:
 1. Professional video editing: cropping, clipping, splitting, and sequencing the available video clips
-2. Voiceover generation that matches the CROPPED video segments (not the full original videos)
+2. Voiceover generation that matches the CROPPED video segments
 3. Timeline structure with optimal pacing and transitions
 4. Professional narrative flow using the available video assets
 
@@ -368,7 +1909,7 @@ Return a JSON response with this structure:
             "duration": 5,
             "placement": "beginning|middle|end",
             "voice_style": "friendly_female|professional_male|etc",
-            "script": "IMPORTANT: Write a complete voiceover script that will take approximately {target_duration} seconds to narrate at normal speaking pace. Focus ONLY on the cropped video segments that will actually be shown (middle portions of videos, not beginnings/endings). Include detailed narration for each CROPPED video segment. The script should be comprehensive enough to cover the entire video duration and match the actual content that viewers will see."
+            "script": "Complete voiceover script (see VOICEOVER RULES)"
         }}
     ],
     "timeline_structure": [
@@ -377,7 +1918,7 @@ Return a JSON response with this structure:
             "asset_name": "existing asset name or 'generated_X'",
             "start_time": 0,
             "end_time": 5,
-            "description": "What happens in this CROPPED segment (not the full video)",
+            "description": "What happens in this CROPPED segment",
             "editing_notes": "Crop, adjust, overlay instructions",
             "audio_overlay": "background_music|voiceover|none"
         }}
@@ -390,130 +1931,518 @@ Return a JSON response with this structure:
     }}
 }}
 
-Focus on creating engaging, professional content that matches the project description and makes optimal use of available assets.
-
-CRITICAL FOR VOICEOVERS: When generating voiceover content, ensure the script is long enough to cover the full {target_duration} second video AND matches the CROPPED video content (not the full original videos). The videos will be professionally edited to show only the best portions. A typical speaking pace is about 150-180 words per minute, so for {target_duration} seconds, you need approximately {int((target_duration/60) * 160)} words. Include:
+VOICEOVER RULES: The script must take approximately {target_duration} seconds to narrate (about {word_target} words at 150-180 words per minute) and describe ONLY what is visible in the cropped segments. Include:
 1. Opening introduction (10-15% of script) - introduce what viewers will see in the cropped segments
-2. Detailed narration for each CROPPED video segment (70-80% of script) - describe only what's visible in the edited clips  
+2. Detailed narration for each CROPPED video segment (70-80% of script) - describe only what's visible in the edited clips
 3. Closing summary (10-15% of script) - wrap up the content shown in the edited video
 
-Make sure the voiceover script provides continuous narration that matches the CROPPED video content throughout the entire duration. Do NOT reference content from the beginning or end of videos that will be cut out during professional editing."""
+Provide continuous narration for the entire duration. Do NOT reference content from the beginning or end of videos that will be cut out during professional editing."""
+    
+    ranked_assets = rank_assets_for_prompt(media_assets)
+    remaining = token_budget - estimate_tokens(render(""))
+    
+    # Decide which assets get a detailed block; demote the lowest-ranked ones to one-liners
+    headers = [_asset_prompt_header(asset) for asset in ranked_assets]
+    oneliners = [_asset_prompt_oneliner(asset) for asset in ranked_assets]
+    header_budget = remaining * PLAN_PROMPT_HEADER_SHARE if any(a.get('transcript') for a in ranked_assets) else remaining
+    summary_cap = header_budget * 0.3  # One-liners beyond this are folded into a count
+    header_costs = [0]
+    for header in headers:
+        header_costs.append(header_costs[-1] + estimate_tokens(header) + 2)
+    oneliner_chars = [0] * (len(oneliners) + 1)
+    for i in range(len(oneliners) - 1, -1, -1):
+        oneliner_chars[i] = oneliner_chars[i + 1] + len(oneliners[i]) + 2
+    
+    detailed_count = len(ranked_assets)
+    while detailed_count > 0:
+        summary_tokens = min(oneliner_chars[detailed_count] // 4 + 10, summary_cap)
+        if header_costs[detailed_count] + summary_tokens <= header_budget:
+            break
+        detailed_count -= 1
+    
+    detailed_assets = ranked_assets[:detailed_count]
+    summarized_assets = ranked_assets[detailed_count:]
+    
+    summary_line = ""
+    if summarized_assets:
+        # Fold one-liners into counts if even the compact listing does not fit
+        listed = []
+        listed_chars = 0
+        for oneliner in oneliners[detailed_count:]:
+            if (listed_chars + len(oneliner) + 2) // 4 + header_costs[detailed_count] + 20 > header_budget:
+                break
+            listed.append(oneliner)
+            listed_chars += len(oneliner) + 2
+        omitted = len(summarized_assets) - len(listed)
+        summary_line = "Additional assets (summarized): " + "; ".join(listed)
+        if omitted:
+            summary_line += f"{'; ' if listed else ''}and {omitted} more similar assets"
+        summary_line += "\n"
+    
+    # Spend whatever budget is left on transcript excerpts, weighted by rank
+    used_tokens = header_costs[detailed_count] + estimate_tokens(summary_line)
+    transcript_chars_budget = max(0, (remaining - used_tokens) * 4)
+    with_transcripts = [i for i, asset in enumerate(detailed_assets) if asset.get('transcript')]
+    rank_weights = {i: 1.0 / (1 + rank) for rank, i in enumerate(with_transcripts)}
+    total_weight = sum(rank_weights.values()) or 1.0
+    
+    blocks = []
+    transcript_chars = 0
+    for i, asset in enumerate(detailed_assets):
+        block = headers[i]
+        if i in rank_weights:
+            allowance = int(transcript_chars_budget * rank_weights[i] / total_weight) - 40
+            allowance = min(allowance, PLAN_PROMPT_MAX_TRANSCRIPT_CHARS)
+            if allowance >= PLAN_PROMPT_MIN_TRANSCRIPT_CHARS:
+                excerpt = _truncate_at_word(asset['transcript'], allowance)
+                label = "Transcript (full video)" if asset['media_type'] == 'video' else "Content"
+                block += f"{label}: {excerpt}\n"
+                transcript_chars += len(excerpt)
+        blocks.append(block)
+    
+    prompt = render("\n---\n".join(blocks) + ("\n---\n" + summary_line if blocks and summary_line else summary_line))
+    stats = {
+        'tokens': estimate_tokens(prompt),
+        'budget': token_budget,
+        'assets_detailed': len(detailed_assets),
+        'assets_summarized': len(summarized_assets),
+        'transcript_chars': transcript_chars
+    }
+    return prompt, stats
 
-    try:
+
+# Hierarchical (map-reduce) planning for long or asset-heavy projects
+HIERARCHICAL_PLAN_MIN_ASSETS = 12
+HIERARCHICAL_PLAN_MIN_DURATION = 180
+PLAN_GROUP_SIZE = 8
+PLAN_GROUP_SECONDS = 90
+PLAN_MAX_PARALLEL_GROUPS = 4
+PLAN_GROUP_TOKEN_BUDGET = 3000
+
+
+def parse_plan_response(response_text):
+    """Extract and parse the JSON plan from a Gemini response (raises json.JSONDecodeError)"""
+    response_text = response_text.strip()
+    
+    # Try to find JSON within the response (remove markdown formatting)
+    if "```json" in response_text:
+        # Extract JSON from markdown code block
+        json_start = response_text.find("```json") + 7
+        json_end = response_text.find("```", json_start)
+        json_text = response_text[json_start:json_end].strip()
+    elif "{" in response_text and "}" in response_text:
+        # Find the JSON object in the response
+        start = response_text.find("{")
+        end = response_text.rfind("}") + 1
+        json_text = response_text[start:end]
+    else:
+        json_text = response_text
+    
+    return json.loads(json_text)
+
+
+def should_plan_hierarchically(media_assets, target_duration):
+    """Long timelines or many assets are planned per asset group instead of in one call"""
+    return len(media_assets) >= HIERARCHICAL_PLAN_MIN_ASSETS or (
+        target_duration >= HIERARCHICAL_PLAN_MIN_DURATION and len(media_assets) > 1
+    )
+
+
+def group_assets_for_planning(media_assets, target_duration):
+    """Split assets (in upload order) into contiguous groups and give each a share of the duration"""
+    group_count = max(
+        (len(media_assets) + PLAN_GROUP_SIZE - 1) // PLAN_GROUP_SIZE,
+        (int(target_duration) + PLAN_GROUP_SECONDS - 1) // PLAN_GROUP_SECONDS
+    )
+    group_count = max(1, min(group_count, len(media_assets)))
+    
+    groups = []
+    for g in range(group_count):
+        lo = g * len(media_assets) // group_count
+        hi = (g + 1) * len(media_assets) // group_count
+        groups.append(media_assets[lo:hi])
+    
+    # Share the target duration by usable content: cropped video length, ~5s per still
+    def weight(asset):
+        if asset['media_type'] == 'video':
+            return usable_source_seconds(asset.get('duration', 10) or 10)
+        return 5.0 if asset['media_type'] == 'image' else 0.0
+    
+    weights = [sum(weight(a) for a in group) for group in groups]
+    total_weight = sum(weights)
+    durations = [
+        target_duration * (w / total_weight) if total_weight > 0 else target_duration / group_count
+        for w in weights
+    ]
+    return list(zip(groups, durations))
+
+
+def _plan_asset_group(genai_client, group, group_index, group_count, project_description, group_duration):
+    """Map step: plan one asset group (runs in a worker thread, no Streamlit calls)"""
+    prompt, stats = build_content_plan_prompt(
+        group, project_description, int(round(group_duration)), token_budget=PLAN_GROUP_TOKEN_BUDGET
+    )
+    position = "the OPENING" if group_index == 0 else "the CLOSING" if group_index == group_count - 1 else "a MIDDLE"
+    prompt = (
+        f"You are planning PART {group_index + 1} of {group_count} of a longer video; this is {position} part. "
+        f"Only use the assets listed below. Write narration for this part only: "
+        f"{'include the introduction' if group_index == 0 else 'do not re-introduce the video'} and "
+        f"{'include the closing summary' if group_index == group_count - 1 else 'end with a smooth hand-off to the next part, no closing summary'}.\n\n"
+        + prompt
+    )
+    
+    with trace_span("gemini.plan_group", model="gemini-2.5-flash", group=group_index, assets=len(group),
+                    prompt_tokens=stats['tokens']) as span, scheduler_slot('generate'):
+        charge(llm_tokens=stats['tokens'])
         response = genai_client.models.generate_content(
             model="gemini-2.5-flash",
             contents=prompt
         )
+        span['attributes']['response_chars'] = len(response.text or "")
+        charge(enforce=False, llm_tokens=response_token_count(response))
+    return parse_plan_response(response.text)
+
+
+def merge_group_plans(group_plans, project_description, target_duration):
+    """Reduce step: stitch per-group plans into one timeline and one voiceover script"""
+    timeline_structure = []
+    scripts = []
+    voiceover_template = None
+    other_content = []
+    offset = 0.0
+    
+    for (plan, group_duration) in group_plans:
+        segments = sorted(plan.get('timeline_structure', []), key=lambda s: s.get('sequence', 0))
+        group_end = 0.0
+        for segment in segments:
+            merged = dict(segment)
+            merged['sequence'] = len(timeline_structure) + 1
+            merged['start_time'] = offset + float(segment.get('start_time', 0) or 0)
+            merged['end_time'] = offset + float(segment.get('end_time', 0) or 0)
+            group_end = max(group_end, merged['end_time'] - offset)
+            timeline_structure.append(merged)
+        offset += max(group_end, group_duration)
         
-        # Extract JSON from the response text
-        response_text = response.text.strip()
-        
-        # Try to find JSON within the response (remove markdown formatting)
-        if "```json" in response_text:
-            # Extract JSON from markdown code block
-            json_start = response_text.find("```json") + 7
-            json_end = response_text.find("```", json_start)
-            json_text = response_text[json_start:json_end].strip()
-        elif "{" in response_text and "}" in response_text:
-            # Find the JSON object in the response
-            start = response_text.find("{")
-            end = response_text.rfind("}") + 1
-            json_text = response_text[start:end]
-        else:
-            json_text = response_text
+        for item in plan.get('content_to_generate', []):
+            if item.get('type') == 'voiceover':
+                voiceover_template = voiceover_template or item
+                if item.get('script'):
+                    scripts.append(item['script'].strip())
+            else:
+                other_content.append(item)
+    
+    content_to_generate = []
+    if scripts:
+        voiceover = dict(voiceover_template)
+        voiceover['script'] = " ".join(scripts)
+        voiceover['duration'] = target_duration
+        voiceover['placement'] = 'overlay'
+        content_to_generate.append(voiceover)
+    content_to_generate.extend(other_content)
+    
+    first_plan = group_plans[0][0] if group_plans else {}
+    return {
+        "project_analysis": first_plan.get('project_analysis', f"Creating video content based on: {project_description[:100]}..."),
+        "target_audience": first_plan.get('target_audience', "General audience"),
+        "content_to_generate": content_to_generate,
+        "timeline_structure": timeline_structure,
+        "editing_instructions": first_plan.get('editing_instructions', {"style": "professional", "transitions": "smooth"}),
+        "planning": {"mode": "hierarchical", "groups": len(group_plans)}
+    }
+
+
+def create_hierarchical_content_plan(genai_client, media_assets, project_description, target_duration):
+    """Plan asset groups in parallel (map) and merge them into one content plan (reduce)"""
+    groups = group_assets_for_planning(media_assets, target_duration)
+    st.info(f"🧩 Long project: planning {len(groups)} asset groups in parallel "
+            f"({len(media_assets)} assets, {target_duration}s target)")
+    
+    results = [None] * len(groups)
+    with ThreadPoolExecutor(max_workers=min(PLAN_MAX_PARALLEL_GROUPS, len(groups))) as pool:
+        futures = {
+            pool.submit(contextvars.copy_context().run, _plan_asset_group, genai_client, group, i,
+                        len(groups), project_description, group_duration): i
+            for i, (group, group_duration) in enumerate(groups)
+        }
+        for future in as_completed(futures):
+            i = futures[future]
+            group, group_duration = groups[i]
+            try:
+                results[i] = (future.result(), group_duration)
+            except Exception as e:
+                st.warning(f"⚠️ Planning failed for asset group {i + 1}: {str(e)}. Using fallback plan for this group.")
+                results[i] = (create_fallback_content_plan(group, project_description, int(round(group_duration))), group_duration)
+    
+    with trace_span("plan.merge", groups=len(groups)):
+        return merge_group_plans(results, project_description, target_duration)
+
+
+def create_comprehensive_content_plan(genai_client, media_assets, project_description, target_duration):
+    """Create a comprehensive content plan based on available assets and project description"""
+    
+    if should_plan_hierarchically(media_assets, target_duration):
+        return create_hierarchical_content_plan(genai_client, media_assets, project_description, target_duration)
+    
+    prompt, prompt_stats = build_content_plan_prompt(media_assets, project_description, target_duration)
+    if prompt_stats['assets_summarized']:
+        st.info(f"📐 Prompt budget: {prompt_stats['assets_detailed']} assets in detail, "
+                f"{prompt_stats['assets_summarized']} summarized (~{prompt_stats['tokens']} tokens)")
+
+    try:
+        with trace_span("gemini.plan", model="gemini-2.5-flash", prompt_chars=len(prompt),
+                        prompt_tokens=prompt_stats['tokens'], assets=len(media_assets)) as span, scheduler_slot('generate'):
+            charge(llm_tokens=prompt_stats['tokens'])
+            response = genai_client.models.generate_content(
+                model="gemini-2.5-flash",
+                contents=prompt
+            )
+            span['attributes']['response_chars'] = len(response.text or "")
+            charge(enforce=False, llm_tokens=response_token_count(response))
         
-        # Parse the JSON response
-        content_plan = json.loads(json_text)
+        # Extract and parse the JSON plan from the response text
+        content_plan = parse_plan_response(response.text)
         return content_plan
         
     except json.JSONDecodeError as e:
         st.error(f"❌ Failed to parse AI content plan: {str(e)}")
         st.info(f"🔍 Raw AI response: {response.text[:500]}...")
         return create_fallback_content_plan(media_assets, project_description, target_duration)
+    except BudgetExceeded as e:
+        st.warning(f"🧾 Skipping AI planning: {str(e)}. Using the local planner.")
+        return create_fallback_content_plan(media_assets, project_description, target_duration)
     except Exception as e:
         st.error(f"❌ Failed to create content plan: {str(e)}")
         return create_fallback_content_plan(media_assets, project_description, target_duration)
 
 
-def create_fallback_content_plan(media_assets, project_description, target_duration):
-    """Create a basic content plan if AI analysis fails"""
+# Local planning engine: TF-IDF relevance of transcript chunks to the project, no LLM round-trip
+LOCAL_PLAN_CHUNK_SECONDS = 8.0  # Speech is scored in pieces of about this length, cut on sentence boundaries
+LOCAL_PLAN_WORDS_PER_SECOND = 2.5  # Narration pace, also used to place chunks when word timings are missing
+LOCAL_PLAN_RELEVANCE_SHARE = 0.7  # Chunk score = this share of relevance + the rest of informativeness
+LOCAL_PLAN_STOPWORDS = frozenset("""
+    a about after all also an and any are as at be because been but by can could do does for from get go going
+    had has have he her here him his how i if in into is it its just let like me more my no not now of on one
+    only or our out over so some than that the their them then there these they this those to up us very was
+    we well were what when where which while who will with would you your video clip create make show use
+""".split())
+NARRATION_TRANSITIONS = ("First", "Next", "Then", "After that", "Now", "Finally")
+
+
+def plan_terms(text):
+    """Lower-cased content words of a text, for TF-IDF scoring"""
+    return [word for word in re.findall(r"[a-z0-9']+", (text or "").lower())
+            if len(word) > 1 and word not in LOCAL_PLAN_STOPWORDS]
+
+
+def transcript_chunks(asset, chunk_seconds=LOCAL_PLAN_CHUNK_SECONDS):
+    """An asset's speech as [(start, end, text)] pieces of about chunk_seconds, cut between sentences"""
+    index = asset.get('transcript_index')
+    if index is not None and len(index['starts']):
+        chunks = []
+        chunk_start = None
+        for sentence_start, sentence_end in zip(index['sentence_starts'], index['sentence_ends']):
+            if chunk_start is None:
+                chunk_start = float(sentence_start)
+            if sentence_end - chunk_start >= chunk_seconds:
+                chunks.append((chunk_start, float(sentence_end), " ".join(transcript_words_between(index, chunk_start, sentence_end))))
+                chunk_start = None
+        if chunk_start is not None:
+            chunks.append((chunk_start, float(index['ends'][-1]), " ".join(transcript_words_between(index, chunk_start, np.inf))))
+        return chunks
     
-    # Simple plan: use assets in order with basic structure
-    timeline_structure = []
+    # Plain transcript text: cut the clip into equal time slices and spread the words over them
+    words = (asset.get('transcript') or "").split()
+    if not words:
+        return []
+    duration = float(asset.get('duration') or 0) or len(words) / LOCAL_PLAN_WORDS_PER_SECOND
+    count = max(1, int(round(duration / chunk_seconds)))
+    bounds = np.linspace(0, len(words), count + 1).astype(int)
+    return [(duration * i / count, duration * (i + 1) / count, " ".join(words[bounds[i]:bounds[i + 1]])) for i in range(count)]
+
+
+def score_plan_chunks(chunks, project_description):
+    """Score chunks by TF-IDF cosine relevance to the project plus informativeness (idf mass per word).
+    
+    Each chunk is a dict with 'text' and 'context' (the asset description, counted once
+    more so silent clips still match). Returns one score in [0, 1] per chunk.
+    """
+    documents = [Counter(plan_terms(chunk['text'] + " " + chunk['context'])) for chunk in chunks]
+    document_frequency = Counter(term for document in documents for term in document)
+    idf = {term: math.log((1 + len(documents)) / (1 + count)) + 1.0 for term, count in document_frequency.items()}
+    query = Counter(plan_terms(project_description))
+    query_weights = {term: (1 + math.log(count)) * idf.get(term, 0.0) for term, count in query.items()}
+    query_norm = math.sqrt(sum(w * w for w in query_weights.values())) or 1.0
+    
+    relevance = np.zeros(len(documents))
+    informativeness = np.zeros(len(documents))
+    for i, document in enumerate(documents):
+        if not document:
+            continue
+        weights = {term: (1 + math.log(count)) * idf[term] for term, count in document.items()}
+        norm = math.sqrt(sum(w * w for w in weights.values()))
+        relevance[i] = sum(w * query_weights.get(term, 0.0) for term, w in weights.items()) / (norm * query_norm)
+        informativeness[i] = sum(idf[term] for term in document) / math.sqrt(sum(document.values()))
+    
+    for values in (relevance, informativeness):
+        if values.max() > 0:
+            values /= values.max()
+    return LOCAL_PLAN_RELEVANCE_SHARE * relevance + (1 - LOCAL_PLAN_RELEVANCE_SHARE) * informativeness
+
+
+def narration_from_segments(project_description, segments, target_duration, key_terms=()):
+    """Templated voiceover script: an opening line, one line per planned clip, and a sign-off"""
+    budget = int(target_duration * LOCAL_PLAN_WORDS_PER_SECOND)
+    title = re.search(r"[\"'“‘]([^\"'”’]{3,80})[\"'”’]", project_description)
+    if title:
+        lines = [f"Welcome to {title.group(1).strip()}."]
+    elif key_terms:
+        lines = [f"Welcome! In this video we look at {', '.join(key_terms[:3])}."]
+    else:
+        lines = ["Welcome!"]
+    first_segments = []
+    for segment in segments:
+        if all(segment['asset_name'] != other['asset_name'] for other in first_segments):
+            first_segments.append(segment)
+    for position, segment in enumerate(first_segments):
+        if position == len(first_segments) - 1 and position > 0:
+            transition = NARRATION_TRANSITIONS[-1]
+        else:
+            transition = NARRATION_TRANSITIONS[min(position, len(NARRATION_TRANSITIONS) - 2)]
+        subject = segment['asset_description'] or "a closer look at " + ", ".join(segment['key_terms'] or ["this step"])
+        lines.append(f"{transition}, {subject[0].lower() + subject[1:]}".rstrip(".!?") + ".")
+    lines.append("Thanks for watching!")
+    
+    script = []
+    for line in lines:
+        if script and len(" ".join(script + [line]).split()) > budget:
+            break
+        script.append(line)
+    return " ".join(script)
+
+
+def create_local_content_plan(media_assets, project_description, target_duration):
+    """Plan the edit locally in milliseconds: rank transcript chunks by TF-IDF against the project,
+    keep the best ones up to the target duration, and template the narration.
+    
+    Returns a plan in the same shape as the Gemini planner's, marked with 'planner': 'local'.
+    """
+    chunks = []
+    for order, asset in enumerate(media_assets):
+        if asset['media_type'] not in ('video', 'image'):
+            continue
+        context = asset.get('description') or os.path.splitext(asset['name'])[0].replace('_', ' ')
+        spoken = transcript_chunks(asset) if asset['media_type'] == 'video' else []
+        if not spoken:
+            length = float(asset.get('duration') or 0) or CLIP_DEFAULT_SOURCE_SECONDS
+            spoken = [(0.0, min(length, LOCAL_PLAN_CHUNK_SECONDS), "")]
+        for start, end, text in spoken:
+            chunks.append({'asset': asset, 'order': order, 'start': start, 'end': end, 'text': text, 'context': context})
     
-    if not media_assets:
+    if not chunks:
         return {
             "project_analysis": f"Creating basic video content: {project_description[:100]}...",
             "target_audience": "General audience",
             "content_to_generate": [],
             "timeline_structure": [],
-            "editing_instructions": {"style": "professional", "transitions": "smooth"}
+            "editing_instructions": {"style": "professional", "transitions": "smooth"},
+            "planner": "local"
         }
     
-    segment_duration = max(5, target_duration // len(media_assets))
+    scores = score_plan_chunks(chunks, project_description)
+    ranked = sorted(range(len(chunks)), key=lambda i: -scores[i])
     
-    for i, asset in enumerate(media_assets):
-        # Analyze content importance based on description keywords
-        description = (asset['description'] or asset['name']).lower()
-        
-        # Determine importance (1-3 scale) based on content analysis
-        importance = 1  # Default
-        if any(word in description for word in ['main', 'key', 'important', 'focus', 'primary', 'central']):
-            importance = 3
-        elif any(word in description for word in ['process', 'action', 'making', 'pouring', 'grinding', 'brewing']):
-            importance = 2
-        
-        # Determine recommended duration based on content type
-        recommended_duration = segment_duration
-        if any(word in description for word in ['grinding', 'process', 'making', 'preparation']):
-            recommended_duration = min(segment_duration * 1.2, 15)  # Slightly longer for process shots
-        elif any(word in description for word in ['final', 'finished', 'result', 'cup']):
-            recommended_duration = min(segment_duration * 0.8, 10)   # Shorter for result shots
-        elif any(word in description for word in ['pouring', 'action', 'technique']):
-            recommended_duration = min(segment_duration * 1.5, 18)   # Longer for key actions
-        
+    # Every asset keeps its best chunk; further chunks are added by score until the target is covered
+    selected, covered, seen = set(), 0.0, set()
+    for i in ranked:
+        if chunks[i]['order'] not in seen:
+            seen.add(chunks[i]['order'])
+            selected.add(i)
+            covered += chunks[i]['end'] - chunks[i]['start']
+    for i in ranked:
+        if covered >= target_duration:
+            break
+        if i not in selected:
+            selected.add(i)
+            covered += chunks[i]['end'] - chunks[i]['start']
+    selected = sorted(selected, key=lambda i: (chunks[i]['order'], chunks[i]['start']))
+    
+    # Importance by score tertile; durations follow the chunks, scaled to the target
+    cutoffs = np.quantile(scores[selected], [1 / 3, 2 / 3]) if len(selected) >= 3 else (np.inf, np.inf)
+    scale = target_duration / max(covered, 1e-6)
+    timeline_structure, segments, elapsed = [], [], 0.0
+    for sequence, i in enumerate(selected, start=1):
+        chunk = chunks[i]
+        asset = chunk['asset']
+        importance = 1 + int(scores[i] >= cutoffs[0]) + int(scores[i] >= cutoffs[1])
+        duration = float(np.clip((chunk['end'] - chunk['start']) * scale, CLIP_MIN_SECONDS, CLIP_MAX_SECONDS))
+        key_terms = [term for term, _ in Counter(plan_terms(chunk['text'] or chunk['context'])).most_common(3)]
         timeline_structure.append({
-            "sequence": i + 1,
+            "sequence": sequence,
             "asset_name": asset['name'],
-            "start_time": i * segment_duration,
-            "end_time": (i + 1) * segment_duration,
-            "clip_start": 0,
-            "clip_end": min(segment_duration, asset.get('duration', segment_duration)),
-            "description": asset['description'] or f"Showing {asset['name']}",
-            "editing_notes": "Use full clip, adjust timing as needed",
-            "audio_overlay": "background_music" if i > 0 else "none",
-            "importance": importance,  # 1-3 scale for content importance
-            "recommended_duration": recommended_duration,  # AI-suggested optimal duration
-            "content_type": "process" if any(word in description for word in ['grinding', 'pouring', 'making']) else "result"
+            "start_time": elapsed,
+            "end_time": elapsed + duration,
+            "clip_start": chunk['start'],
+            "clip_end": chunk['end'],
+            "description": _truncate_at_word(chunk['text'], 160) or asset.get('description') or f"Showing {asset['name']}",
+            "editing_notes": f"Local draft: score {scores[i]:.2f}",
+            "audio_overlay": "voiceover",
+            "importance": importance,
+            "recommended_duration": duration,
+            "content_type": "speech" if chunk['text'] else "visual"
         })
+        segments.append({'asset_name': asset['name'], 'asset_description': asset.get('description') or "", 'key_terms': key_terms})
+        elapsed += duration
     
-    # Add voiceover generation
-    content_to_generate = []
-    if any(asset.get('description') for asset in media_assets):
-        content_to_generate.append({
+    project_terms = set(plan_terms(project_description))
+    top_terms = [term for term, _ in Counter(term for i in selected for term in plan_terms(chunks[i]['text'] + " " + chunks[i]['context'])
+                                             if term in project_terms).most_common(5)]
+    return {
+        "project_analysis": (f"Local draft plan: {len(timeline_structure)} segments from {len(seen)} assets"
+                             + (f", matched on {', '.join(top_terms)}" if top_terms else "")),
+        "target_audience": "General audience",
+        "content_to_generate": [{
             "type": "voiceover",
-            "description": "Professional narration explaining the content",
-            "script": f"This video demonstrates {project_description}. " + 
-                     " ".join([asset.get('description', '') for asset in media_assets if asset.get('description')]),
+            "description": "Narration for the local draft plan",
+            "script": narration_from_segments(project_description, segments, target_duration, top_terms),
             "voice_style": "friendly_female",
             "duration": target_duration,
             "placement": "overlay"
-        })
-    
-    return {
-        "project_analysis": f"Creating video content based on: {project_description[:100]}...",
-        "target_audience": "General audience",
-        "content_to_generate": content_to_generate,
+        }],
         "timeline_structure": timeline_structure,
         "editing_instructions": {
             "style": "professional",
             "transitions": "smooth",
             "audio_mixing": "balanced",
             "visual_effects": "none"
-        }
+        },
+        "planner": "local"
     }
 
 
+def refine_content_plan(genai_client, draft_plan, media_assets, project_description, target_duration):
+    """Ask Gemini to improve a local draft plan; returns the draft unchanged if that fails"""
+    prompt, prompt_stats = build_content_plan_prompt(media_assets, project_description, target_duration)
+    draft = json.dumps({key: draft_plan[key] for key in ('timeline_structure', 'content_to_generate')}, separators=(',', ':'))
+    prompt += ("\n\nA fast local draft of this plan follows. Keep what works, and improve the segment order, "
+               "durations and the narration script. Return the full plan in the same JSON format.\n" + draft)
+    try:
+        with trace_span("gemini.refine_plan", model="gemini-2.5-flash", prompt_chars=len(prompt),
+                        prompt_tokens=prompt_stats['tokens'] + estimate_tokens(draft)), scheduler_slot('generate'):
+            charge(llm_tokens=prompt_stats['tokens'] + estimate_tokens(draft))
+            response = genai_client.models.generate_content(model="gemini-2.5-flash", contents=prompt)
+            charge(enforce=False, llm_tokens=response_token_count(response))
+        return parse_plan_response(response.text)
+    except Exception as e:
+        st.warning(f"⚠️ Could not refine the draft with AI: {str(e)}. Keeping the local draft.")
+        return draft_plan
+
+
+def create_fallback_content_plan(media_assets, project_description, target_duration):
+    """Create a basic content plan if AI analysis fails"""
+    mark_degraded("fallback plan")
+    return create_local_content_plan(media_assets, project_description, target_duration)
+
+
 def create_fallback_understanding(clips_info):
     """Create a basic understanding structure if AI analysis fails"""
     return {
@@ -564,7 +2493,8 @@ def create_intelligent_edit_plan(video_db_client, ai_understanding, clips_info):
         
         try:
             # Perform semantic search across all uploaded videos
-            search_results = collection.search(query=search_query)
+            with trace_span("collection.search", query=search_query[:100]):
+                search_results = collection.search(query=search_query)
             
             if search_results and hasattr(search_results, 'get_shots'):
                 shots = search_results.get_shots()
@@ -582,12 +2512,17 @@ def create_intelligent_edit_plan(video_db_client, ai_understanding, clips_info):
                             break
                     
                     if matched_video:
+                        start_time, end_time = snap_cut_points(
+                            clip_info.get('transcript_index'), best_shot.start,
+                            min(best_shot.end, best_shot.start + scene.get('suggested_duration', 15)),
+                            upper=getattr(matched_video, 'length', None) or np.inf
+                        )
                         edit_decision_list.append({
                             'video': matched_video,
                             'scene_description': scene['scene_description'],
                             'narration': scene['narration'],
-                            'start_time': best_shot.start,
-                            'end_time': min(best_shot.end, best_shot.start + scene.get('suggested_duration', 15)),
+                            'start_time': start_time,
+                            'end_time': end_time,
                             'clip_name': matched_clip_name,
                             'search_query': search_query
                         })
@@ -653,10 +2588,12 @@ def generate_comprehensive_voiceover(video_db_client, ai_understanding, edit_dec
         
         # Generate voiceover
         collection = video_db_client.get_collection()
-        voiceover_audio = collection.generate_voice(
-            text=full_script,
-            voice_name='Default'
-        )
+        with trace_span("generate_voice", chars=len(full_script), words=len(full_script.split())), scheduler_slot('generate'):
+            charge(voice_seconds=len(full_script.split()) * 0.4)
+            voiceover_audio = collection.generate_voice(
+                text=full_script,
+                voice_name='Default'
+            )
         return voiceover_audio, full_script
         
     except Exception as e:
@@ -664,8 +2601,683 @@ def generate_comprehensive_voiceover(video_db_client, ai_understanding, edit_dec
         return None, ""
 
 
-def assemble_multimedia_video_with_music(conn, content_plan, media_assets, generated_assets, target_duration=45):
-    """Assemble video with both voiceover and background music using audio mixing approach"""
+# Local shot-boundary detection on low-resolution frames, used to pick crop windows
+SHOT_SAMPLE_FPS = 4.0
+SHOT_FRAME_SIZE = (64, 36)  # Width, height of the greyscale frames analyzed
+SHOT_HISTOGRAM_BINS = 16
+SHOT_CUT_THRESHOLD = 0.35  # Histogram distance (0-1) between consecutive samples that marks a cut
+SHOT_DIFF_THRESHOLD = 0.25  # Mean pixel change (0-1) that marks a cut between similarly lit shots
+SHOT_MIN_SECONDS = 1.0  # A cut closer than this to the previous one is a flash, not a new shot
+SHOT_DEAD_STD = 4.0  # Frames flatter than this (black, white, blank slates) carry no activity
+SHOT_BOUNDARY_BONUS = 0.25  # Windows opening on a cut score this much higher
+SHOT_DETECT_WORKERS = 4  # Clips analyzed at once; each runs one single-threaded ffmpeg decode
+
+
+def decode_video_frames(path, fps=SHOT_SAMPLE_FPS, size=SHOT_FRAME_SIZE):
+    """Sample a video file as low-resolution greyscale frames, shape (n, height, width); needs ffmpeg on PATH"""
+    ffmpeg = shutil.which('ffmpeg')
+    if not ffmpeg:
+        raise ValueError("ffmpeg is not available to decode video frames")
+    width, height = size
+    result = subprocess.run(
+        [ffmpeg, '-v', 'error', '-threads', '1', '-i', path, '-an', '-sn',
+         '-vf', f"fps={fps},scale={width}:{height}:flags=fast_bilinear",
+         '-pix_fmt', 'gray', '-f', 'rawvideo', 'pipe:1'],
+        capture_output=True, check=True
+    )
+    frame_bytes = width * height
+    count = len(result.stdout) // frame_bytes
+    return np.frombuffer(result.stdout, dtype=np.uint8, count=count * frame_bytes).reshape(count, height, width)
+
+
+def detect_shots(frames, fps=SHOT_SAMPLE_FPS):
+    """Shot boundaries and per-sample activity of a sampled clip.
+    
+    A cut is a local peak where the grey-level histogram distance or the mean pixel
+    change between consecutive samples crosses its threshold. Activity is the pixel
+    change around each sample, with cuts and flat frames counting as zero, scaled
+    to 0-255 for the clip. Returns a JSON-ready {'fps', 'boundaries', 'activity'}.
+    """
+    frames = np.asarray(frames, dtype=np.uint8)
+    count = len(frames)
+    if count < 2:
+        return {'fps': fps, 'boundaries': [], 'activity': [0] * count}
+    flat = frames.reshape(count, -1)
+    
+    change = np.abs(np.diff(flat.astype(np.int16), axis=0)).mean(axis=1) / 255.0
+    # All histograms in one bincount: each frame's bins are offset by its row
+    bins = (flat // (256 // SHOT_HISTOGRAM_BINS)).astype(np.int64) + (np.arange(count) * SHOT_HISTOGRAM_BINS)[:, None]
+    histograms = np.bincount(bins.ravel(), minlength=count * SHOT_HISTOGRAM_BINS).reshape(count, SHOT_HISTOGRAM_BINS) / flat.shape[1]
+    distance = 0.5 * np.abs(np.diff(histograms, axis=0)).sum(axis=1)
+    
+    score = np.maximum(distance / SHOT_CUT_THRESHOLD, change / SHOT_DIFF_THRESHOLD)
+    padded = np.concatenate(([0.0], score, [0.0]))
+    peaks = np.flatnonzero((score >= 1.0) & (score >= padded[:-2]) & (score >= padded[2:]))
+    cuts = []
+    for peak in peaks:
+        if not cuts or peak - cuts[-1] >= SHOT_MIN_SECONDS * fps:
+            cuts.append(int(peak))
+    
+    # Activity of a sample: mean change into and out of it, ignoring the jumps at cuts
+    motion = change.copy()
+    motion[cuts] = 0.0
+    activity = np.zeros(count)
+    activity[1:] += motion
+    activity[:-1] += motion
+    activity[1:-1] /= 2
+    activity[flat.std(axis=1) < SHOT_DEAD_STD] = 0.0
+    peak_activity = activity.max()
+    if peak_activity > 0:
+        activity = np.round(activity * (255.0 / peak_activity))
+    
+    return {
+        'fps': fps,
+        'boundaries': [round((cut + 1) / fps, 3) for cut in cuts],  # The new shot is showing from the next sample
+        'activity': activity.astype(int).tolist()
+    }
+
+
+def detect_video_shots(path):
+    """detect_shots() for a video file; None when it cannot be decoded"""
+    try:
+        return detect_shots(decode_video_frames(path))
+    except (ValueError, OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _traced_shot_detection(path):
+    """detect_video_shots() as a span of the active trace"""
+    with trace_span("shots.detect", file=os.path.basename(path)) as span:
+        shots = detect_video_shots(path)
+        if shots:
+            span['attributes'].update(samples=len(shots['activity']), shots=len(shots['boundaries']) + 1)
+        return shots
+
+
+def start_shot_detection(paths, workers=SHOT_DETECT_WORKERS):
+    """Analyze clips in the background, in parallel across clips; returns {path: future of shots or None}.
+    
+    Decoding runs in ffmpeg subprocesses, so threads are enough to use several cores.
+    """
+    if not paths:
+        return {}
+    pool = ThreadPoolExecutor(max_workers=min(workers, len(paths)), thread_name_prefix="edentic-shots")
+    futures = {path: pool.submit(contextvars.copy_context().run, _traced_shot_detection, path) for path in paths}
+    pool.shutdown(wait=False)
+    return futures
+
+
+def nearest_shot_boundary(shots, t, lower, upper):
+    """Shot boundary nearest to t within [lower, upper], or None"""
+    boundaries = np.asarray(shots['boundaries'] if shots else [], dtype=float)
+    candidates = boundaries[(boundaries >= lower) & (boundaries <= upper)]
+    if candidates.size == 0:
+        return None
+    return float(candidates[np.argmin(np.abs(candidates - t))])
+
+
+def choose_shot_window(shots, duration, lower, upper):
+    """In point of the most active `duration`-second window inside [lower, upper]; None without shot data.
+    
+    Every sample time is a candidate, scored by mean activity from a prefix sum;
+    candidates on a shot boundary get SHOT_BOUNDARY_BONUS so clips open on a clean cut.
+    """
+    if not shots or not shots['activity'] or upper - lower < duration:
+        return None
+    activity = np.asarray(shots['activity'], dtype=float)
+    fps = shots['fps']
+    boundaries = np.asarray(shots['boundaries'], dtype=float)
+    
+    grid = np.arange(np.ceil(lower * fps), np.floor((upper - duration) * fps) + 1) / fps
+    candidates = np.unique(np.concatenate(([lower], grid, boundaries[(boundaries >= lower) & (boundaries <= upper - duration)])))
+    prefix = np.concatenate(([0.0], np.cumsum(activity)))
+    first = np.clip(np.round(candidates * fps).astype(int), 0, len(activity))
+    last = np.clip(np.round((candidates + duration) * fps).astype(int), 0, len(activity))
+    mean = (prefix[last] - prefix[first]) / np.maximum(last - first, 1)
+    on_cut = np.isin(np.round(candidates, 3), np.round(boundaries, 3))
+    score = mean * np.where(on_cut, 1.0 + SHOT_BOUNDARY_BONUS, 1.0)
+    if score.max() <= 0:
+        return None
+    return float(candidates[np.argmax(score)])
+
+
+# Clip cropping bounds used by the duration allocator
+CLIP_MIN_SECONDS = 3.0
+CLIP_MAX_SECONDS = 45.0
+CLIP_USABLE_FRACTION = 0.90  # Never use more than 90% of a source clip
+CLIP_DEFAULT_SOURCE_SECONDS = 10.0  # Assumed length when a source duration is unknown
+
+
+def allocate_clip_durations(weights, source_durations, target_total, min_durations=CLIP_MIN_SECONDS,
+                            max_durations=CLIP_MAX_SECONDS, preferred_starts=None,
+                            usable_fraction=CLIP_USABLE_FRACTION):
+    """Split target_total seconds across clips in one vectorized solve.
+    
+    Each clip gets d_i = clip(lam * w_i, lo_i, hi_i), where hi_i is the smaller of
+    max_durations and the usable part of the source, and lo_i = min(min_durations, hi_i).
+    lam is found exactly from the sorted breakpoints of the piecewise-linear total,
+    so sum(d) == target_total whenever the bounds allow it (otherwise every clip sits
+    at its lower or upper bound). In points default to a short lead-in
+    (min(1s, 10% of the source)); preferred_starts (NaN = no preference) moves them,
+    always keeping [start, end] inside the source.
+    
+    Returns a dict of numpy arrays: durations, starts, ends.
+    """
+    weights = np.maximum(np.asarray(weights, dtype=float), 0.0)
+    n = weights.shape[0]
+    source = np.asarray(source_durations, dtype=float)
+    source = np.where(source > 0, source, CLIP_DEFAULT_SOURCE_SECONDS)
+    
+    hi = np.minimum(np.broadcast_to(np.asarray(max_durations, dtype=float), n), source * usable_fraction)
+    lo = np.minimum(np.broadcast_to(np.asarray(min_durations, dtype=float), n), hi)
+    
+    # Zero-weight clips stay at their lower bound; only weighted clips share the rest
+    durations = lo.copy()
+    active = weights > 0
+    target_active = target_total - lo[~active].sum()
+    lo_a, hi_a, w_a = lo[active], hi[active], weights[active]
+    
+    if not active.any() or target_active <= lo_a.sum():
+        pass
+    elif target_active >= hi_a.sum():
+        durations[active] = hi_a
+    else:
+        # Breakpoints where a clip leaves its lower bound (a) or hits its upper bound (b)
+        lo, hi, weights, target_total = lo_a, hi_a, w_a, target_active
+        a = lo / weights
+        b = hi / weights
+        a_order = np.argsort(a, kind='stable')
+        b_order = np.argsort(b, kind='stable')
+        a_sorted, b_sorted = a[a_order], b[b_order]
+        cum_lo_a = np.concatenate(([0.0], np.cumsum(lo[a_order])))
+        cum_w_a = np.concatenate(([0.0], np.cumsum(weights[a_order])))
+        cum_hi_b = np.concatenate(([0.0], np.cumsum(hi[b_order])))
+        cum_w_b = np.concatenate(([0.0], np.cumsum(weights[b_order])))
+        
+        # Total allocated at every breakpoint: clips still at lo + clips at hi + lam * free weight
+        lams = np.unique(np.concatenate((a, b)))
+        ia = np.searchsorted(a_sorted, lams, side='right')
+        ib = np.searchsorted(b_sorted, lams, side='right')
+        totals = (cum_lo_a[-1] - cum_lo_a[ia]) + cum_hi_b[ib] + lams * (cum_w_a[ia] - cum_w_b[ib])
+        
+        # The total is linear between consecutive breakpoints; interpolate inside the crossing interval
+        k = int(np.clip(np.searchsorted(totals, target_total), 1, len(lams) - 1))
+        span = totals[k] - totals[k - 1]
+        lam = lams[k - 1] + (target_total - totals[k - 1]) * (lams[k] - lams[k - 1]) / span if span > 0 else lams[k]
+        durations[active] = np.clip(lam * weights, lo, hi)
+    
+    latest_start = np.maximum(source - durations, 0.0)
+    starts = np.minimum(np.minimum(1.0, source * 0.1), latest_start)
+    if preferred_starts is not None:
+        preferred = np.asarray(preferred_starts, dtype=float)
+        starts = np.where(np.isnan(preferred), starts, np.clip(np.nan_to_num(preferred), 0.0, latest_start))
+    
+    return {'durations': durations, 'starts': starts, 'ends': starts + durations}
+
+
+CLIP_MIN_FLOOR_SECONDS = 1.0  # Shortest clip allowed when many clips share a short target
+SEQUENCE_VERBOSE_CLIP_LIMIT = 10  # Above this, per-clip progress is summarized in a table
+RANGE_MERGE_TOLERANCE = 0.05  # Seconds; adjacent ranges of one source closer than this are joined
+
+
+def adjusted_target_duration(video_assets, target_duration):
+    """Target length the editor actually aims for: 80% of the available footage, at least 15s"""
+    total_video_duration = sum(a.get('duration', 0) for a in video_assets if a.get('duration', 0) > 0)
+    return min(target_duration, max(total_video_duration * 0.8, 15))
+
+
+def build_sequence_units(video_assets, timeline_structure):
+    """One unit per plan segment that uses a clip (in plan order), then any clips the plan left out.
+    
+    Units carry an allocation weight; a clip used by several segments shares its source between them.
+    """
+    by_name = {asset['name']: asset for asset in video_assets}
+    by_stem = {os.path.splitext(asset['name'])[0]: asset for asset in video_assets}
+    
+    units = []
+    used = set()
+    segments = sorted(
+        (seg for seg in timeline_structure if seg.get('asset_name')),
+        key=lambda seg: (seg.get('sequence', 0), seg.get('start_time', 0))
+    )
+    for segment in segments:
+        name = segment['asset_name']
+        asset = by_name.get(name) or by_stem.get(os.path.splitext(name)[0])
+        if asset is None:
+            continue
+        if 'importance' in segment or 'recommended_duration' in segment:
+            weight = segment.get('importance', 1) * segment.get('recommended_duration', 10)
+        else:
+            weight = max(float(segment.get('end_time', 0) or 0) - float(segment.get('start_time', 0) or 0), 0.0)
+        units.append({'asset': asset, 'segment': segment, 'weight': weight or None})
+        used.add(asset['name'])
+    
+    for asset in video_assets:
+        if asset['name'] not in used:
+            units.append({'asset': asset, 'segment': None, 'weight': None})
+    
+    known = [u['weight'] for u in units if u['weight']]
+    default_weight = sum(known) / len(known) if known else 1.0
+    for unit in units:
+        unit['weight'] = unit['weight'] or default_weight
+    return units
+
+
+def merge_adjacent_ranges(ranges, tolerance=RANGE_MERGE_TOLERANCE):
+    """Join consecutive ranges that continue the same source, so each becomes one add_inline call"""
+    merged = []
+    for clip_range in ranges:
+        previous = merged[-1] if merged else None
+        if (previous and previous['asset_id'] == clip_range['asset_id']
+                and abs(clip_range['start'] - previous['end']) <= tolerance):
+            previous['end'] = max(previous['end'], clip_range['end'])
+            previous['segments'] += clip_range['segments']
+        else:
+            merged.append(dict(clip_range))
+    return merged
+
+
+# Word-level transcript index for snapping cuts to sentence boundaries
+SENTENCE_END_CHARS = ('.', '?', '!', '…')
+SENTENCE_PAUSE_SECONDS = 0.8  # A pause this long between words also ends a sentence
+SNAP_MAX_SHIFT_SECONDS = 1.5  # Cut points move at most this far to reach a boundary
+
+
+def build_transcript_index(segments):
+    """Pack word-level transcript segments into parallel arrays with sentence boundaries.
+    
+    Word text is stored once as a joined string plus offsets; sentence starts and ends
+    are sorted time arrays so boundary and range lookups are a binary search.
+    """
+    words = [s for s in (segments or []) if str(s.get('text', '')).strip() not in ('', '-')]
+    words.sort(key=lambda s: float(s['start']))
+    texts = [str(s['text']).strip() for s in words]
+    starts = np.array([float(s['start']) for s in words], dtype=np.float64)
+    ends = np.maximum(np.array([float(s['end']) for s in words], dtype=np.float64), starts)
+    offsets = np.zeros(len(texts) + 1, dtype=np.int32)
+    np.cumsum([len(t) for t in texts], out=offsets[1:])
+    
+    # A word opens a sentence if it is first, follows terminal punctuation, or follows a long pause
+    opens = np.ones(len(texts), dtype=bool)
+    if len(texts) > 1:
+        punctuated = np.array([t.endswith(SENTENCE_END_CHARS) for t in texts[:-1]])
+        opens[1:] = punctuated | (starts[1:] - ends[:-1] >= SENTENCE_PAUSE_SECONDS)
+    closes = np.append(opens[1:], True) if len(texts) else opens
+    
+    return {
+        'starts': starts,
+        'ends': ends,
+        'text': "".join(texts),
+        'offsets': offsets,
+        'sentence_starts': starts[opens],
+        'sentence_ends': ends[closes]
+    }
+
+
+def transcript_words_between(index, start, end):
+    """Words whose start time falls in [start, end)"""
+    lo, hi = np.searchsorted(index['starts'], [start, end], side='left')
+    offsets, text = index['offsets'], index['text']
+    return [text[offsets[i]:offsets[i + 1]] for i in range(lo, hi)]
+
+
+def nearest_sentence_boundary(index, t, kind='start', lower=-np.inf, upper=np.inf):
+    """Nearest sentence start (or end) to t within [lower, upper], or None"""
+    times = index['sentence_starts'] if kind == 'start' else index['sentence_ends']
+    lo = np.searchsorted(times, lower, side='left')
+    hi = np.searchsorted(times, upper, side='right')
+    if lo >= hi:
+        return None
+    pos = int(np.clip(np.searchsorted(times, t), lo, hi - 1))
+    candidates = [pos] + ([pos - 1] if pos - 1 >= lo else [])
+    best = min(candidates, key=lambda i: abs(times[i] - t))
+    return float(times[best])
+
+
+def snap_cut_points(index, start, end, lower=0.0, upper=np.inf, max_shift=SNAP_MAX_SHIFT_SECONDS, min_duration=CLIP_MIN_FLOOR_SECONDS):
+    """Move a [start, end) cut to the nearest sentence start/end within max_shift; unchanged where none fits"""
+    if not index or len(index['starts']) == 0:
+        return start, end
+    
+    # The in point never moves so far that less than min_duration is left before the out point
+    snapped_start = nearest_sentence_boundary(index, start, 'start', max(lower, start - max_shift),
+                                              min(upper, start + max_shift, end - min_duration))
+    if snapped_start is not None:
+        start = snapped_start
+    snapped_end = nearest_sentence_boundary(index, end, 'end', max(start + min_duration, end - max_shift), min(upper, end + max_shift))
+    if snapped_end is not None:
+        end = snapped_end
+    return start, end
+
+
+def plan_clip_ranges(video_assets, timeline_structure, target_duration):
+    """Allocate durations and cut points for every clip in one pass.
+    
+    Returns {'clips': per-unit ranges, 'ranges': merged ranges for the timeline,
+    'dropped': names left out because not even the minimum clip length fits,
+    'overrun': names of segments left out because earlier segments used up their source}.
+    """
+    units = build_sequence_units(video_assets, timeline_structure)
+    if not units:
+        return {'clips': [], 'ranges': [], 'dropped': [], 'overrun': []}
+    
+    # Many short clips: lower the per-clip minimum, and keep only the strongest units if still too many
+    min_seconds = min(CLIP_MIN_SECONDS, max(CLIP_MIN_FLOOR_SECONDS, target_duration / len(units)))
+    dropped = []
+    max_units = max(1, int(target_duration / min_seconds + 1e-9))
+    if len(units) > max_units:
+        ranked = sorted(range(len(units)), key=lambda i: -units[i]['weight'])
+        keep = set(ranked[:max_units])
+        dropped = [units[i]['asset']['name'] for i in range(len(units)) if i not in keep]
+        units = [unit for i, unit in enumerate(units) if i in keep]
+    
+    # A clip used by k segments offers each of them 1/k of its source
+    uses = {}
+    for unit in units:
+        uses[unit['asset']['asset_id']] = uses.get(unit['asset']['asset_id'], 0) + 1
+    sources = np.array([(u['asset'].get('duration', 0) or CLIP_DEFAULT_SOURCE_SECONDS) for u in units], dtype=float)
+    shares = np.array([uses[u['asset']['asset_id']] for u in units], dtype=float)
+    
+    allocation = allocate_clip_durations(
+        [u['weight'] for u in units], sources / shares, target_duration, min_durations=min_seconds
+    )
+    
+    # Segments of the same clip advance through its source instead of reusing the same window.
+    # Snapping moves cuts, so each clip leaves room for the segments still to come from its source
+    # and the seconds it gains or loses against the allocation are carried to the next clip.
+    cursors = {}
+    later_uses = dict(uses)
+    carry = 0.0
+    clips = []
+    overrun = []
+    for unit, source, duration, allocated_start in zip(units, sources, allocation['durations'], allocation['starts']):
+        asset_id = unit['asset']['asset_id']
+        source, duration = float(source), float(duration)
+        later_uses[asset_id] -= 1
+        min_length = min(min_seconds, duration)
+        lower = cursors.get(asset_id, 0.0)
+        limit = source - later_uses[asset_id] * min_length
+        if limit - lower < min_length:
+            overrun.append(unit['asset']['name'])
+            carry += duration
+            continue
+        wanted = min(float(np.clip(duration + carry, min_length, CLIP_MAX_SECONDS)), limit - lower)
+        start = min(lower if asset_id in cursors else float(allocated_start), limit - wanted)
+        # With shot data, take the liveliest stretch of this segment's share of the clip and end on a cut
+        shots = unit['asset'].get('shots')
+        share_end = min(limit, lower + max(wanted, (source - lower) / (later_uses[asset_id] + 1)))
+        lively_start = choose_shot_window(shots, wanted, lower, share_end)
+        if lively_start is not None:
+            start = lively_start
+        end = min(start + wanted, limit)
+        # A clip already held at its minimum length is over budget: its out point may only move earlier
+        reach = limit if duration + carry >= wanted - 1e-9 else end
+        cut = nearest_shot_boundary(shots, end, max(start + min_length, end - SNAP_MAX_SHIFT_SECONDS),
+                                    min(reach, end + SNAP_MAX_SHIFT_SECONDS))
+        if cut is not None:
+            end = cut
+        # Prefer cutting between sentences when word timestamps are available
+        start, end = snap_cut_points(unit['asset'].get('transcript_index'), start, end, lower=lower, upper=reach,
+                                     min_duration=min_length)
+        carry += duration - (end - start)
+        cursors[asset_id] = end
+        clips.append({
+            'asset_id': asset_id,
+            'name': unit['asset']['name'],
+            'start': start,
+            'end': end,
+            'source_duration': source,
+            'importance': unit['segment'].get('importance', 1) if unit['segment'] else None,
+            'segments': 1
+        })
+    
+    return {'clips': clips, 'ranges': merge_adjacent_ranges(clips), 'dropped': dropped, 'overrun': overrun}
+
+
+def add_ranges_to_timeline(timeline, ranges):
+    """Append video ranges to the timeline in order and return the seconds added"""
+    added = 0.0
+    for clip_range in ranges:
+        timeline.add_inline(VideoAsset(
+            asset_id=clip_range['asset_id'],
+            start=clip_range['start'],
+            end=clip_range['end']
+        ))
+        added += clip_range['end'] - clip_range['start']
+    return added
+
+
+def report_clip_plan(clip_plan, mode):
+    """Show the cut list: per clip for small projects, as one table for large ones"""
+    clips = clip_plan['clips']
+    if len(clips) <= SEQUENCE_VERBOSE_CLIP_LIMIT:
+        for clip in clips:
+            detail = f"importance: {clip['importance']}" if clip['importance'] is not None else mode
+            st.info(f"🎬 {clip['name']}: {clip['end'] - clip['start']:.1f}s "
+                    f"(cropping {clip['start']:.1f}s-{clip['end']:.1f}s of {clip['source_duration']:.1f}s, {detail})")
+    else:
+        with st.expander(f"🎬 Cut list: {len(clips)} clips ({mode})"):
+            st.dataframe([{
+                'clip': clip['name'],
+                'in': round(clip['start'], 2),
+                'out': round(clip['end'], 2),
+                'seconds': round(clip['end'] - clip['start'], 2),
+                'source': round(clip['source_duration'], 1)
+            } for clip in clips], use_container_width=True)
+    
+    if len(clip_plan['ranges']) < len(clips):
+        st.info(f"🔗 Merged {len(clips)} cuts into {len(clip_plan['ranges'])} continuous ranges")
+    if clip_plan['dropped']:
+        st.warning(f"⚠️ {len(clip_plan['dropped'])} clips did not fit the target duration and were left out: "
+                   f"{', '.join(clip_plan['dropped'][:10])}{'...' if len(clip_plan['dropped']) > 10 else ''}")
+    if clip_plan.get('overrun'):
+        st.warning(f"⚠️ {len(clip_plan['overrun'])} segments were left out because earlier segments used up their source clip: "
+                   f"{', '.join(clip_plan['overrun'][:10])}{'...' if len(clip_plan['overrun']) > 10 else ''}")
+
+
+# Storyboard (contact sheet) preview of a plan, built locally before any render
+STORYBOARD_TILE_SIZE = (320, 180)
+STORYBOARD_CAPTION_HEIGHT = 110
+STORYBOARD_COLUMNS = 4
+STORYBOARD_MAX_TILES = 60
+THUMBNAIL_CACHE_ENTRIES = 1024
+
+@st.cache_resource
+def _thumbnail_cache():
+    """Thumbnails shared by every session: keyframes per (asset_id, timestamp), images per content hash"""
+    return {'lock': threading.Lock(), 'entries': OrderedDict()}
+
+
+def _thumbnail_cache_get(key):
+    cache = _thumbnail_cache()
+    with cache['lock']:
+        if key in cache['entries']:
+            cache['entries'].move_to_end(key)
+            return cache['entries'][key]
+    return None
+
+
+def _thumbnail_cache_put(key, data):
+    cache = _thumbnail_cache()
+    with cache['lock']:
+        cache['entries'][key] = data
+        cache['entries'].move_to_end(key)
+        while len(cache['entries']) > THUMBNAIL_CACHE_ENTRIES:
+            cache['entries'].popitem(last=False)
+
+
+def _encode_thumbnail(image, size):
+    """Shrink an image to fit size and return it as JPEG bytes"""
+    image = image.convert('RGB')
+    image.thumbnail(size)
+    buffer = BytesIO()
+    image.save(buffer, format='JPEG', quality=80)
+    return buffer.getvalue()
+
+
+def fetch_keyframe_thumbnail(video, asset_id, timestamp, size=(160, 90)):
+    """Small JPEG keyframe of a video at timestamp, cached per (asset, timestamp)"""
+    key = (asset_id, round(float(timestamp), 1), size)
+    cached = _thumbnail_cache_get(key)
+    if cached is not None:
+        return cached
+    
+    with trace_span("video.generate_thumbnail", asset_id=asset_id, timestamp=key[1]) as span:
+        thumbnail = video.generate_thumbnail(time=key[1])
+        url = thumbnail if isinstance(thumbnail, str) else getattr(thumbnail, 'url', None) or thumbnail.generate_url()
+        with urllib.request.urlopen(url, timeout=10) as response:
+            data = _encode_thumbnail(Image.open(BytesIO(response.read())), size)
+        span['attributes']['bytes'] = len(data)
+    
+    _thumbnail_cache_put(key, data)
+    return data
+
+
+def image_asset_thumbnail(image_bytes, size=STORYBOARD_TILE_SIZE):
+    """Thumbnail of an uploaded image asset, cached per content hash so same-named files never collide"""
+    key = ('image', hashlib.sha256(image_bytes).hexdigest(), size)
+    cached = _thumbnail_cache_get(key)
+    if cached is None:
+        cached = _encode_thumbnail(Image.open(BytesIO(image_bytes)), size)
+        _thumbnail_cache_put(key, cached)
+    return cached
+
+
+def split_script_for_segments(script, durations):
+    """Share the narration words between segments in proportion to their durations"""
+    words = (script or "").split()
+    total = sum(durations)
+    if not words or total <= 0:
+        return ["" for _ in durations]
+    
+    parts = []
+    cursor = 0
+    elapsed = 0.0
+    for duration in durations:
+        elapsed += duration
+        end = int(round(len(words) * elapsed / total))
+        parts.append(" ".join(words[cursor:end]))
+        cursor = end
+    return parts
+
+
+def plan_storyboard_tiles(content_plan, media_assets, target_duration):
+    """The planned segments in timeline order, with in/out points exactly as the render would cut them"""
+    video_assets = [a for a in media_assets if a['media_type'] == 'video']
+    assets_by_name = {a['name']: a for a in media_assets}
+    timeline_structure = content_plan.get('timeline_structure', [])
+    
+    tiles = []
+    clip_plan = plan_clip_ranges(video_assets, timeline_structure, adjusted_target_duration(video_assets, target_duration))
+    for clip in clip_plan['clips']:
+        tiles.append({'kind': 'video', 'asset': assets_by_name.get(clip['name']), 'name': clip['name'],
+                      'start': clip['start'], 'end': clip['end'], 'duration': clip['end'] - clip['start']})
+    
+    # Stills referenced by the plan are shown after the clips, with their planned length
+    for segment in timeline_structure:
+        asset = assets_by_name.get(segment.get('asset_name'))
+        if asset and asset['media_type'] == 'image':
+            duration = max(float(segment.get('end_time', 5) or 5) - float(segment.get('start_time', 0) or 0), 3)
+            tiles.append({'kind': 'image', 'asset': asset, 'name': asset['name'], 'start': 0, 'end': duration, 'duration': duration})
+    
+    script = " ".join(item.get('script', '') for item in content_plan.get('content_to_generate', []) if item.get('type') == 'voiceover')
+    for tile, narration in zip(tiles, split_script_for_segments(script, [t['duration'] for t in tiles])):
+        tile['narration'] = narration
+    return tiles[:STORYBOARD_MAX_TILES]
+
+
+def _tile_frames(tile, image_sources):
+    """Fetch the frames for one storyboard tile: (in, out) keyframes for clips, the image itself for stills"""
+    half = (STORYBOARD_TILE_SIZE[0] // 2, STORYBOARD_TILE_SIZE[1])
+    try:
+        if tile['kind'] == 'image':
+            return [image_asset_thumbnail(image_sources[tile['name']])]
+        video = tile['asset'].get('video_obj') or tile['asset'].get('asset')
+        asset_id = tile['asset']['asset_id']
+        return [
+            fetch_keyframe_thumbnail(video, asset_id, tile['start'], half),
+            fetch_keyframe_thumbnail(video, asset_id, max(tile['end'] - 0.1, tile['start']), half)
+        ]
+    except Exception:
+        return []
+
+
+def build_storyboard(content_plan, media_assets, image_sources, target_duration):
+    """Compose a contact sheet of the planned edit: keyframes at each cut's in/out points plus narration"""
+    started = time.perf_counter()
+    tiles = plan_storyboard_tiles(content_plan, media_assets, target_duration)
+    
+    # Keyframes are fetched concurrently; repeated plans hit the thumbnail cache
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        frames = list(pool.map(lambda t: contextvars.copy_context().run(_tile_frames, t, image_sources), tiles))
+    fetched = time.perf_counter()
+    
+    tile_w, tile_h = STORYBOARD_TILE_SIZE
+    cell_h = tile_h + STORYBOARD_CAPTION_HEIGHT
+    columns = max(1, min(STORYBOARD_COLUMNS, len(tiles)))
+    rows = max(1, (len(tiles) + columns - 1) // columns)
+    sheet = Image.new('RGB', (columns * tile_w, rows * cell_h), (24, 24, 28))
+    draw = ImageDraw.Draw(sheet)
+    
+    elapsed = 0.0
+    for index, (tile, tile_frames) in enumerate(zip(tiles, frames)):
+        x, y = (index % columns) * tile_w, (index // columns) * cell_h
+        slot_w = tile_w // max(len(tile_frames), 1)
+        for i, frame in enumerate(tile_frames):
+            frame_image = Image.open(BytesIO(frame))
+            sheet.paste(frame_image, (x + i * slot_w + (slot_w - frame_image.width) // 2, y + (tile_h - frame_image.height) // 2))
+        if not tile_frames:
+            draw.rectangle([x + 4, y + 4, x + tile_w - 4, y + tile_h - 4], outline=(90, 90, 90))
+            draw.text((x + 12, y + tile_h // 2), "no preview", fill=(150, 150, 150))
+        
+        if tile['kind'] == 'video':
+            label = f"{index + 1}. {tile['name']}  {tile['start']:.1f}-{tile['end']:.1f}s"
+        else:
+            label = f"{index + 1}. {tile['name']}  (still, {tile['duration']:.1f}s)"
+        draw.text((x + 6, y + tile_h + 4), label[:48], fill=(255, 210, 90))
+        draw.text((x + 6, y + tile_h + 18), f"@ {elapsed:.1f}s on timeline", fill=(170, 170, 170))
+        for line_no, line in enumerate(textwrap.wrap(tile['narration'], 50)[:5]):
+            draw.text((x + 6, y + tile_h + 34 + line_no * 14), line, fill=(230, 230, 230))
+        elapsed += tile['duration']
+    
+    buffer = BytesIO()
+    sheet.save(buffer, format='PNG')
+    return {
+        'image': buffer.getvalue(),
+        'tiles': len(tiles),
+        'timeline_seconds': elapsed,
+        'build_ms': (time.perf_counter() - started) * 1000,
+        'fetch_ms': (fetched - started) * 1000
+    }
+
+
+def show_storyboard(storyboard):
+    """Display a storyboard built by build_storyboard"""
+    st.image(storyboard["image"], use_container_width=True)
+    # Keyframes come from remote generate_thumbnail calls, so a first build is bounded by those round trips
+    fetch_ms = storyboard.get('fetch_ms', 0.0)
+    st.caption(f"🖼️ {storyboard['tiles']} planned segments · ~{storyboard['timeline_seconds']:.1f}s of video · "
+               f"built in {storyboard['build_ms']:.0f} ms ({fetch_ms:.0f} ms fetching keyframes, "
+               f"{storyboard['build_ms'] - fetch_ms:.0f} ms composing)")
+
+
+def voiceover_span(asset, video_seconds):
+    """(audio start, duration) of a voiceover laid over video_seconds of timeline, trimmed like the voiceover render; None if unusable"""
+    if (asset.get('duration', 0) or 0) <= 0:
+        return None
+    if asset.get('speech_end'):
+        start = asset['speech_start']
+        return start, min(video_seconds, asset['speech_end'] - start)
+    duration = min(video_seconds, asset['duration'] - 0.5)  # Same safety buffer as the voiceover render
+    return (0, duration) if duration > 0 else None
+
+
+def assemble_multimedia_video_with_music(conn, content_plan, media_assets, generated_assets, target_duration=45, clip_plan=None):
+    """Assemble video with both voiceover and background music using audio mixing approach.
+    
+    clip_plan is the plan_clip_ranges() result the voiceover render used, so the
+    music variant keeps the cuts of the preview the user approved.
+    """
     
     try:
         from videodb.timeline import Timeline
@@ -674,102 +3286,44 @@ def assemble_multimedia_video_with_music(conn, content_plan, media_assets, gener
         # Create a new timeline
         timeline = Timeline(conn)
         
-        # Calculate total available video duration
-        total_video_duration = 0
-        video_assets = [a for a in media_assets if a['media_type'] == 'video']
-        
-        for asset in video_assets:
-            asset_duration = asset.get('duration', 0)
-            if asset_duration > 0:
-                total_video_duration += asset_duration
-        
-        # Adjust target duration based on available content
-        adjusted_duration = min(target_duration, max(total_video_duration * 0.8, 15))  # Use 80% of available content, min 15s
+        # Same duration model as the voiceover render: the allocator's cut list over the same clips
+        video_assets = [a for a in media_assets + generated_assets if a['media_type'] == 'video']
+        adjusted_duration = adjusted_target_duration(video_assets, target_duration)
         
         st.info(f"📏 Adjusting video length for music version: Target {target_duration}s → Actual {adjusted_duration:.1f}s")
         
-        # First, add all video/image content exactly like the voiceover-only version
         timeline_structure = content_plan.get('timeline_structure', [])
+        ranges = []
+        if len(video_assets) >= 2:
+            try:
+                clip_plan = clip_plan or plan_clip_ranges(video_assets, timeline_structure, adjusted_duration)
+            except Exception:
+                clip_plan = plan_clip_ranges(video_assets, [], adjusted_duration)
+            ranges = clip_plan['ranges']
+        elif video_assets:
+            # A single clip is used from its start, as in the voiceover render
+            main_video = max(video_assets, key=lambda a: a.get('duration', 10))
+            source_duration = main_video.get('duration', 10) or 10
+            use_duration = min(adjusted_duration, source_duration * 0.95)
+            ranges = [{'asset_id': main_video['asset_id'], 'start': 0, 'end': use_duration}]
         
-        # If no timeline structure, create a simple sequence from video assets
-        if not timeline_structure:
-            current_time = 0
-            segment_duration = adjusted_duration / max(len(video_assets), 1)  # Divide time equally
-            
-            for i, asset in enumerate(video_assets):
-                asset_duration = asset.get('duration', segment_duration)
-                clip_duration = min(segment_duration, asset_duration * 0.9)  # Use 90% of asset duration max
-                
-                timeline_structure.append({
-                    'asset_name': asset['name'],
-                    'start_time': current_time,
-                    'end_time': current_time + clip_duration,
-                    'clip_start': 0,
-                    'clip_end': clip_duration
-                })
-                current_time += clip_duration
-        
-        # Add main video/image assets to timeline with proper duration validation
-        video_added = False
-        
-        for segment in timeline_structure:
-            asset_name = segment.get('asset_name')
-            
-            if asset_name:
-                # Find the asset
-                asset_info = None
-                for asset in media_assets:
-                    if asset['name'] == asset_name:
-                        asset_info = asset
-                        break
-                
-                if asset_info and asset_info['media_type'] == 'video':
-                    # Calculate optimal clip duration for target video length
-                    clip_duration = min(
-                        segment.get('end_time', 10) - segment.get('start_time', 0),
-                        target_duration // len([s for s in timeline_structure if s.get('asset_name')]),
-                        15  # Max 15 seconds per clip
-                    )
-                    clip_duration = max(clip_duration, 3)  # Min 3 seconds
-                    
-                    video_asset = VideoAsset(
-                        asset_id=asset_info['asset_id'],
-                        start=segment.get('clip_start', 0),
-                        end=segment.get('clip_start', 0) + clip_duration
-                    )
-                    timeline.add_inline(video_asset)
-                    video_added = True
-                    total_video_duration += clip_duration
-                    
-                elif asset_info and asset_info['media_type'] == 'image':
-                    # For images, create a short video segment
-                    duration = min(segment.get('end_time', 5) - segment.get('start_time', 0), 8)
-                    duration = max(duration, 3)  # Min 3 seconds
-                    
-                    image_asset = ImageAsset(
-                        asset_id=asset_info['asset_id'],
-                        duration=duration
-                    )
-                    timeline.add_inline(image_asset)
-                    video_added = True
-                    total_video_duration += duration
+        total_video_duration = add_ranges_to_timeline(timeline, ranges)
+        video_added = total_video_duration > 0
         
-        # If no video was added, add the first video asset as fallback
-        if not video_added and media_assets:
-            first_video = next((a for a in media_assets if a['media_type'] == 'video'), None)
-            if first_video:
-                fallback_duration = min(target_duration, 30)
-                fallback_asset = VideoAsset(
-                    asset_id=first_video['asset_id'],
-                    start=0,
-                    end=fallback_duration
-                )
-                timeline.add_inline(fallback_asset)
-                video_added = True
-                total_video_duration = fallback_duration
+        # The voiceover, trimmed exactly as in the voiceover-only version
+        for asset in generated_assets:
+            if asset['media_type'] == 'audio' and asset.get('generation_type') == 'voiceover':
+                span = voiceover_span(asset, total_video_duration)
+                if span:
+                    timeline.add_overlay(start=0, asset=AudioAsset(
+                        asset_id=asset['asset_id'],
+                        start=span[0],
+                        end=span[0] + span[1],
+                        disable_other_tracks=False
+                    ))
+                break
         
-        # Now add ONLY background music as overlay (no voiceover to avoid conflicts)
-        # The voiceover is already mixed in from the previous version
+        # Then the background music mixed under it
         background_music_added = False
         for asset in generated_assets:
             if asset['media_type'] == 'audio' and asset.get('generation_type') == 'background_music':
@@ -793,7 +3347,7 @@ def assemble_multimedia_video_with_music(conn, content_plan, media_assets, gener
         
         # Generate the final video stream
         if video_added:
-            final_video_url = timeline.generate_stream()
+            final_video_url = _render_stream(timeline, 'music', total_video_duration)
             if background_music_added:
                 st.success(f"✅ Video assembled with background music and voiceover!")
             else:
@@ -866,8 +3420,257 @@ def test_video_generation():
         return None
 
 
-def assemble_multimedia_video(conn, content_plan, media_assets, generated_assets, target_duration=45):
-    """Assemble the final video using all assets according to the content plan"""
+# Progressive rendering: a short opening preview renders alongside the full timeline
+PROGRESSIVE_PREVIEW_SECONDS = 20.0
+PROGRESSIVE_MIN_TIMELINE_SECONDS = 60.0  # Shorter timelines render quickly enough on their own
+
+
+@st.cache_resource
+def _render_executor():
+    """Render workers created once per process; a module-level pool would be rebuilt, and leaked, on every rerun"""
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="edentic-render")
+
+
+def preview_ranges(ranges, seconds=PROGRESSIVE_PREVIEW_SECONDS):
+    """Leading ranges of a cut list, trimmed to cover at most `seconds`; returns (ranges, seconds covered)"""
+    head = []
+    covered = 0.0
+    for clip_range in ranges:
+        if covered >= seconds:
+            break
+        length = min(clip_range['end'] - clip_range['start'], seconds - covered)
+        head.append(dict(clip_range, end=clip_range['start'] + length))
+        covered += length
+    return head, covered
+
+
+def build_preview_timeline(conn, ranges, voiceover=None, seconds=PROGRESSIVE_PREVIEW_SECONDS):
+    """Timeline of the opening cuts plus the matching stretch of narration; returns (timeline, seconds)"""
+    timeline = Timeline(conn)
+    head, covered = preview_ranges(ranges, seconds)
+    add_ranges_to_timeline(timeline, head)
+    if voiceover:
+        asset_id, audio_start, audio_duration = voiceover
+        timeline.add_overlay(start=0, asset=AudioAsset(
+            asset_id=asset_id,
+            start=audio_start,
+            end=audio_start + min(audio_duration, covered),
+            disable_other_tracks=False
+        ))
+    return timeline, covered
+
+
+def _render_stream(timeline, variant, timeline_seconds, **attributes):
+    """generate_stream() under a render slot, traced like every other render"""
+    with trace_span("timeline.generate_stream", variant=variant, timeline_seconds=round(timeline_seconds, 1), **attributes):
+        charge(renders=1, rendered_seconds=timeline_seconds)
+        with scheduler_slot('render'):
+            return timeline.generate_stream()
+
+
+def render_progressive(timeline, timeline_seconds, preview_timeline, preview_seconds, on_preview, **attributes):
+    """Render the full timeline in the background while the preview renders here.
+    
+    on_preview(url) runs on the calling thread as soon as the preview exists, so
+    it may draw Streamlit elements. A failed preview is skipped; the full
+    render's URL is returned (or its exception raised) either way.
+    """
+    full_future = _render_executor().submit(
+        contextvars.copy_context().run, _render_stream, timeline, 'voiceover', timeline_seconds, **attributes
+    )
+    try:
+        preview_url = _render_stream(preview_timeline, 'preview', preview_seconds)
+    except Exception:
+        preview_url = None
+    if preview_url and not full_future.done():
+        on_preview(preview_url)
+    return full_future.result()
+
+
+# Export of finished renders: HLS segments fetched in parallel over pooled keep-alive connections
+EXPORT_DIR = os.path.join(EDENTIC_DATA_DIR, "exports")
+HLS_DOWNLOAD_WORKERS = 6
+HLS_DOWNLOAD_WINDOW = 16  # Segments fetched ahead of the writer; bounds memory to about this many segments
+HLS_TIMEOUT_SECONDS = 30
+HLS_MAX_REDIRECTS = 5
+
+_hls_connections = threading.local()
+
+
+def _hls_get(url, timeout=HLS_TIMEOUT_SECONDS, redirects=HLS_MAX_REDIRECTS):
+    """GET a URL over this thread's keep-alive connection to its host.
+    
+    Transport failures and 408/429/5xx answers raise retryable errors (see
+    _with_upload_retries); other non-200 answers raise ValueError.
+    """
+    parts = urllib.parse.urlsplit(url)
+    pool = getattr(_hls_connections, 'pool', None)
+    if pool is None:
+        pool = _hls_connections.pool = {}
+    key = (parts.scheme, parts.netloc)
+    connection = pool.get(key)
+    if connection is None:
+        connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        connection = pool[key] = connection_class(parts.netloc, timeout=timeout)
+    
+    try:
+        connection.request('GET', (parts.path or '/') + (f"?{parts.query}" if parts.query else ""))
+        response = connection.getresponse()
+        body = response.read()
+    except (http.client.HTTPException, OSError):
+        # The server may have closed an idle connection; the retry reconnects
+        connection.close()
+        pool.pop(key, None)
+        raise
+    
+    if response.status in (301, 302, 303, 307, 308) and response.getheader('Location') and redirects > 0:
+        return _hls_get(urllib.parse.urljoin(url, response.getheader('Location')), timeout, redirects - 1)
+    if response.status in (408, 429) or response.status >= 500:
+        raise ConnectionError(f"GET {url} returned HTTP {response.status}")
+    if response.status != 200:
+        raise ValueError(f"GET {url} returned HTTP {response.status}")
+    return body
+
+
+def parse_hls_playlist(text, base_url):
+    """Parse an M3U8 playlist into absolute URLs.
+    
+    Returns {'variants': [(bandwidth, url)], 'init': url or None, 'segments': [url]};
+    a master playlist only has variants, a media playlist only segments.
+    """
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    if not lines or lines[0] != '#EXTM3U':
+        raise ValueError("Not an HLS playlist")
+    
+    playlist = {'variants': [], 'init': None, 'segments': []}
+    bandwidth = None
+    for line in lines[1:]:
+        if line.startswith('#EXT-X-STREAM-INF'):
+            match = re.search(r'[:,]BANDWIDTH=(\d+)', line)
+            bandwidth = int(match.group(1)) if match else 0
+        elif line.startswith('#EXT-X-KEY') and 'METHOD=NONE' not in line:
+            raise ValueError("Encrypted HLS streams cannot be exported")
+        elif line.startswith('#EXT-X-MAP'):
+            match = re.search(r'URI="([^"]+)"', line)
+            if match:
+                playlist['init'] = urllib.parse.urljoin(base_url, match.group(1))
+        elif not line.startswith('#'):
+            if bandwidth is not None:
+                playlist['variants'].append((bandwidth, urllib.parse.urljoin(base_url, line)))
+                bandwidth = None
+            else:
+                playlist['segments'].append(urllib.parse.urljoin(base_url, line))
+    return playlist
+
+
+def resolve_hls_segments(url):
+    """Media playlist behind a stream URL, following a master playlist to its highest-bandwidth variant"""
+    playlist = parse_hls_playlist(_with_upload_retries("Fetching playlist", lambda: _hls_get(url)).decode('utf-8'), url)
+    if playlist['variants']:
+        variant_url = max(playlist['variants'])[1]
+        playlist = parse_hls_playlist(
+            _with_upload_retries("Fetching variant playlist", lambda: _hls_get(variant_url)).decode('utf-8'), variant_url
+        )
+    if not playlist['segments']:
+        raise ValueError("HLS playlist has no segments")
+    return playlist
+
+
+def download_hls(url, path, workers=HLS_DOWNLOAD_WORKERS, window=HLS_DOWNLOAD_WINDOW, progress=None):
+    """Download an HLS stream's segments concurrently and append them in order to path.
+    
+    At most `window` segments are in flight or buffered, so memory stays flat
+    however long the video is. progress(fraction) runs on the calling thread.
+    Returns the playlist and download stats.
+    """
+    playlist = resolve_hls_segments(url)
+    urls = ([playlist['init']] if playlist['init'] else []) + playlist['segments']
+    started = time.perf_counter()
+    written = 0
+    
+    def fetch(index):
+        return _with_upload_retries(f"Downloading segment {index + 1}/{len(urls)}", lambda: _hls_get(urls[index]))
+    
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="edentic-hls") as pool:
+        in_flight = deque()
+        try:
+            with open(path + ".part", 'wb') as f:
+                submitted = 0
+                for index in range(len(urls)):
+                    while submitted < len(urls) and len(in_flight) < window:
+                        in_flight.append(pool.submit(fetch, submitted))
+                        submitted += 1
+                    data = in_flight.popleft().result()
+                    f.write(data)
+                    written += len(data)
+                    if progress:
+                        progress((index + 1) / len(urls))
+        except BaseException:
+            for future in in_flight:
+                future.cancel()
+            if os.path.exists(path + ".part"):
+                os.unlink(path + ".part")
+            raise
+    os.replace(path + ".part", path)
+    
+    seconds = time.perf_counter() - started
+    return playlist, {
+        'path': path,
+        'bytes': written,
+        'segments': len(playlist['segments']),
+        'seconds': round(seconds, 3),
+        'mb_per_s': round(written / (1024 * 1024) / max(seconds, 1e-6), 1)
+    }
+
+
+def export_render(stream_url, name=None, export_dir=None, progress=None, workers=HLS_DOWNLOAD_WORKERS):
+    """Save a rendered stream as a local file: MP4 when ffmpeg is available to remux it, else the raw segments.
+    
+    Returns the download stats with the final 'path' and 'format'.
+    """
+    export_dir = export_dir or EXPORT_DIR
+    os.makedirs(export_dir, exist_ok=True)
+    name = name or f"edentic-{time.strftime('%Y%m%d-%H%M%S')}"
+    raw_path = os.path.join(export_dir, f"{name}.ts")
+    
+    with trace_span("export.download", workers=workers) as span:
+        playlist, stats = download_hls(stream_url, raw_path, workers=workers, progress=progress)
+        span['attributes'].update(bytes=stats['bytes'], segments=stats['segments'], mb_per_s=stats['mb_per_s'])
+    stats['format'] = 'ts'
+    if playlist['init']:
+        # Fragmented MP4 segments concatenate into a playable MP4 as they are
+        stats['path'] = os.path.join(export_dir, f"{name}.mp4")
+        os.replace(raw_path, stats['path'])
+        stats['format'] = 'mp4'
+        return stats
+    
+    ffmpeg = shutil.which('ffmpeg')
+    if ffmpeg:
+        mp4_path = os.path.join(export_dir, f"{name}.mp4")
+        with trace_span("export.remux"):
+            result = subprocess.run(
+                [ffmpeg, '-v', 'error', '-y', '-i', raw_path, '-c', 'copy', '-bsf:a', 'aac_adtstoasc',
+                 '-movflags', '+faststart', mp4_path],
+                capture_output=True
+            )
+        if result.returncode == 0:
+            os.unlink(raw_path)
+            stats.update(path=mp4_path, format='mp4')
+        elif os.path.exists(mp4_path):
+            os.unlink(mp4_path)
+    return stats
+
+
+def assemble_multimedia_video(conn, content_plan, media_assets, generated_assets, target_duration=45, on_preview=None,
+                              clip_plan=None):
+    """Assemble the final video using all assets according to the content plan.
+    
+    With on_preview, long timelines render progressively: on_preview(url) gets a
+    short opening cut first and the full render is returned when it finishes.
+    clip_plan is a plan_clip_ranges() result computed ahead of time for the
+    uploaded videos; without it the cuts are planned here.
+    """
+    planned_clips = clip_plan
     
     try:
         from videodb.timeline import Timeline
@@ -897,16 +3700,11 @@ def assemble_multimedia_video(conn, content_plan, media_assets, generated_assets
         timeline = Timeline(conn)
         
         # Calculate total available video duration
-        total_video_duration = 0
         video_assets = [a for a in media_assets if a['media_type'] == 'video']
+        total_video_duration = sum(a.get('duration', 0) for a in video_assets if a.get('duration', 0) > 0)
         
-        for asset in video_assets:
-            asset_duration = asset.get('duration', 0)
-            if asset_duration > 0:
-                total_video_duration += asset_duration
-        
-        # Adjust target duration based on available content
-        adjusted_duration = min(target_duration, max(total_video_duration * 0.8, 15))  # Use 80% of available content, min 15s
+        # Adjust target duration based on available content (80% of available content, min 15s)
+        adjusted_duration = adjusted_target_duration(video_assets, target_duration)
         
         st.info(f"📏 Adjusting video length: Target {target_duration}s → Actual {adjusted_duration:.1f}s (based on {total_video_duration:.1f}s available)")
         
@@ -923,16 +3721,17 @@ def assemble_multimedia_video(conn, content_plan, media_assets, generated_assets
         # Add main video/image assets to timeline - MULTI-CLIP APPROACH
         video_added = False
         timeline_duration = 0
+        timeline_ranges = []  # Cut list behind the timeline, reused for the progressive preview
+        voiceover_range = None
         
-        # Get all video assets in order (clip1, clip2, clip3)
+        # Get all video assets in upload order; the plan decides the final sequence
         video_assets = [asset for asset in all_assets if asset['media_type'] == 'video']
-        video_assets.sort(key=lambda x: x['name'])  # Sort by filename to get correct order
         
         if len(video_assets) >= 2:  # Multi-clip sequencing
             st.info(f"🎬 Professional video editing: Sequencing {len(video_assets)} clips for tutorial...")
             
             # Skip title card - focus on video editing
-            st.info("� Focusing on professional video editing (no title card)")
+            st.info("🎞️ Focusing on professional video editing (no title card)")
             
             # Calculate full duration for video clips
             remaining_duration = adjusted_duration
@@ -942,157 +3741,43 @@ def assemble_multimedia_video(conn, content_plan, media_assets, generated_assets
                 st.info("🧠 Using AI-analyzed timeline structure for optimal clip durations...")
                 
                 try:
-                    # Get segments that match our video assets
-                    video_segments = [seg for seg in timeline_structure if seg.get('asset_name') and 
-                                    seg.get('asset_name').replace('.mp4', '').replace('.mov', '') in 
-                                    [v['name'].replace('.mp4', '').replace('.mov', '') for v in video_assets[:3]]]
-                    
-                    # Calculate durations based on AI analysis
-                    total_weight = sum(seg.get('importance', 1) * seg.get('recommended_duration', 10) for seg in video_segments)
+                    clip_plan = planned_clips or plan_clip_ranges(video_assets, timeline_structure, remaining_duration)
+                    report_clip_plan(clip_plan, "AI plan")
                     
-                    # IMPORTANT: Process ALL video assets, not just those with matching segments
-                    st.info(f"🎯 Processing {len(video_assets)} videos with {len(video_segments)} AI-analyzed segments")
+                    with trace_span("timeline.build", clips=len(clip_plan['clips']), ranges=len(clip_plan['ranges'])):
+                        timeline_duration += add_ranges_to_timeline(timeline, clip_plan['ranges'])
+                    timeline_ranges = clip_plan['ranges']
+                    video_added = timeline_duration > 0
+                    st.success(f"✅ Added {len(clip_plan['clips'])} clips ({timeline_duration:.1f}s) to timeline")
                     
-                    for i, video_asset in enumerate(video_assets[:3]):  # Use all available videos (max 3)
-                        # Find matching segment in timeline structure
-                        matching_segment = None
-                        asset_base_name = video_asset['name'].replace('.mp4', '').replace('.mov', '')
-                        
-                        for seg in video_segments:
-                            if seg.get('asset_name') and asset_base_name in seg.get('asset_name', ''):
-                                matching_segment = seg
-                                break
-                        
-                        if matching_segment:
-                            # Use AI-recommended duration with importance weighting
-                            importance = matching_segment.get('importance', 1)  # 1-3 scale
-                            recommended_duration = matching_segment.get('recommended_duration', 10)
-                            content_weight = importance * recommended_duration
-                            
-                            # Allocate duration proportionally
-                            clip_duration = (content_weight / total_weight) * remaining_duration if total_weight > 0 else remaining_duration / len(video_assets[:3])
-                        else:
-                            # Fallback for videos without matching AI segments: equal distribution
-                            st.info(f"📋 No AI segment found for {video_asset['name']}, using equal distribution")
-                            clip_duration = remaining_duration / len(video_assets[:3])
-                        
-                        # Professional video editing: Ensure within reasonable bounds
-                        source_duration = video_asset.get('duration', 10)
-                        if source_duration <= 0:
-                            source_duration = 10
-                        
-                        # Smart clipping: Use best part of the video (not always from start)
-                        max_usable_duration = source_duration * 0.90  # Use up to 90% of source
-                        clip_duration = min(clip_duration, max_usable_duration)
-                        clip_duration = max(clip_duration, 3)  # Minimum 3s per clip
-                        clip_duration = min(clip_duration, 45)  # Increased maximum per clip for longer videos
-                        
-                        # Smart start time selection (avoid very beginning/end)
-                        if source_duration > clip_duration + 2:
-                            # Leave 1s buffer at start and end for better quality
-                            max_start_time = source_duration - clip_duration - 1
-                            start_time = min(1, max_start_time * 0.1)  # Start slightly into the video
-                        else:
-                            start_time = 0
-                        
-                        if matching_segment:
-                            importance = matching_segment.get('importance', 1)
-                            st.info(f"🎯 {video_asset['name']}: {clip_duration:.1f}s (from {start_time:.1f}s, importance: {importance})")
-                        else:
-                            st.info(f"📹 {video_asset['name']}: {clip_duration:.1f}s (from {start_time:.1f}s, equal distribution)")
-                        st.info(f"🎬 Cropping: Using {start_time:.1f}s-{start_time + clip_duration:.1f}s from {source_duration:.1f}s total video")
-                        
-                        # Create professionally edited video clip
-                        if clip_duration > 0:
-                            try:
-                                video_clip = VideoAsset(
-                                    asset_id=video_asset['asset_id'],
-                                    start=start_time,
-                                    end=start_time + clip_duration
-                                )
-                                
-                                # Add to timeline
-                                timeline.add_inline(video_clip)
-                                timeline_duration += clip_duration
-                                video_added = True
-                                
-                                st.success(f"✅ Added {video_asset['name']} ({clip_duration:.1f}s) to timeline")
-                                
-                            except Exception as video_error:
-                                st.error(f"❌ Failed to add {video_asset['name']}: {str(video_error)}")
-                                continue
-                                
                 except Exception as ai_analysis_error:
+                    mark_degraded("plan not followed")
                     st.warning(f"⚠️ AI analysis failed: {str(ai_analysis_error)}, using fallback")
+                    timeline = Timeline(conn)
+                    timeline_duration = 0
+                    timeline_ranges = []
                     video_added = False  # Force fallback to equal duration
                         
             if not video_added:  # Fallback if AI analysis failed
                 # Professional video editing with equal duration allocation
                 st.info("⚖️ Using professional video editing with optimized durations...")
-                clips_to_use = min(len(video_assets), 3)
-                duration_per_clip = remaining_duration / clips_to_use if clips_to_use > 0 else 0
+                st.info(f"📊 Fallback mode: Distributing {remaining_duration:.1f}s across {len(video_assets)} clips (equal weights)")
                 
-                st.info(f"📊 Fallback mode: Distributing {remaining_duration:.1f}s across {clips_to_use} clips ({duration_per_clip:.1f}s each)")
-                
-                for i, video_asset in enumerate(video_assets[:clips_to_use]):
-                    # Calculate professional clip duration
-                    source_duration = video_asset.get('duration', 10)
-                    if source_duration <= 0:
-                        source_duration = 10
-                    
-                    # Smart duration allocation
-                    max_usable_duration = source_duration * 0.90  # Use up to 90% of source
-                    clip_duration = min(duration_per_clip, max_usable_duration)
-                    clip_duration = max(clip_duration, 3)  # Minimum 3s per clip
-                    clip_duration = min(clip_duration, 45)  # Increased maximum for longer target durations
-                    
-                    # Professional start time selection (avoid start/end)
-                    if source_duration > clip_duration + 2:
-                        # Start slightly into the video for better content
-                        start_time = min(1, source_duration * 0.1)
-                    else:
-                        start_time = 0
-                    
-                    st.info(f"📹 {video_asset['name']}: {clip_duration:.1f}s (from {start_time:.1f}s, fallback edit)")
-                    st.info(f"🎬 Cropping: Using {start_time:.1f}s-{start_time + clip_duration:.1f}s from {source_duration:.1f}s total video")
-                    
-                    # Create and add video clip
-                    if clip_duration > 0:
-                        try:
-                            video_clip = VideoAsset(
-                                asset_id=video_asset['asset_id'],
-                                start=start_time,
-                                end=start_time + clip_duration
-                            )
-                            
-                            timeline.add_inline(video_clip)
-                            timeline_duration += clip_duration
-                            video_added = True
-                            
-                            st.success(f"✅ Added {video_asset['name']} ({clip_duration:.1f}s) to timeline")
-                            
-                        except Exception as video_error:
-                            st.error(f"❌ Failed to add {video_asset['name']}: {str(video_error)}")
-                            continue
+                try:
+                    clip_plan = (None if timeline_structure else planned_clips) or plan_clip_ranges(video_assets, [], remaining_duration)
+                    report_clip_plan(clip_plan, "fallback edit")
                     
-                    st.info(f"📹 Professional edit: {video_asset['name']} ({clip_duration:.1f}s from {start_time:.1f}s)")
+                    with trace_span("timeline.build", clips=len(clip_plan['clips']), ranges=len(clip_plan['ranges'])):
+                        timeline_duration += add_ranges_to_timeline(timeline, clip_plan['ranges'])
+                    timeline_ranges = clip_plan['ranges']
+                    video_added = timeline_duration > 0
+                    st.success(f"✅ Added {len(clip_plan['clips'])} clips ({timeline_duration:.1f}s) to timeline")
                     
-                    # Create professionally edited video clip
-                    try:
-                        video_clip = VideoAsset(
-                            asset_id=video_asset['asset_id'],
-                            start=start_time,
-                            end=start_time + clip_duration
-                        )
-                        
-                        # Add to timeline
-                        timeline.add_inline(video_clip)
-                        timeline_duration += clip_duration
-                        video_added = True
-                        
-                    except Exception as fallback_error:
-                        st.error(f"❌ Failed to add {video_asset['name']}: {str(fallback_error)}")
-                        continue
+                except Exception as video_error:
+                    st.error(f"❌ Failed to sequence clips: {str(video_error)}")
+                    timeline = Timeline(conn)
+                    timeline_duration = 0
+                    timeline_ranges = []
                 
         else:  # Single video fallback
             # Find the best/longest video to use as main content
@@ -1139,9 +3824,11 @@ def assemble_multimedia_video(conn, content_plan, media_assets, generated_assets
                 timeline.add_inline(main_video_asset)
                 video_added = True
                 timeline_duration = use_duration
+                timeline_ranges = [{'asset_id': main_video['asset_id'], 'start': 0, 'end': use_duration}]
         
         # Final fallback if no videos were added
         if not video_added:
+            mark_degraded("single asset fallback")
             # Fallback to first available asset
             for asset_name, asset_info in asset_lookup.items():
                 if asset_info['media_type'] in ['video', 'image']:
@@ -1236,38 +3923,45 @@ def assemble_multimedia_video(conn, content_plan, media_assets, generated_assets
                         st.info(f"💡 This usually means the audio generation failed or is still processing.")
                         continue
                     
-                    # Use the shorter of the two durations to prevent overrun, with safety buffer
-                    safety_buffer = 0.5  # 0.5 second buffer to prevent exact duration issues
-                    max_safe_audio_duration = asset_audio_duration - safety_buffer
+                    audio_start = 0
+                    if asset.get('speech_end'):
+                        # Exact trim points from local silence analysis
+                        audio_start = asset['speech_start']
+                        audio_duration = min(actual_video_duration, asset['speech_end'] - audio_start)
+                        st.info(f"✂️ Using speech from {audio_start:.2f}s to {audio_start + audio_duration:.2f}s of the voiceover")
+                    else:
+                        # Use the shorter of the two durations to prevent overrun, with safety buffer
+                        safety_buffer = 0.5  # 0.5 second buffer to prevent exact duration issues
+                        max_safe_audio_duration = asset_audio_duration - safety_buffer
                     
-                    if max_safe_audio_duration <= 0:
-                        st.warning(f"⚠️ Audio too short after buffer ({max_safe_audio_duration:.1f}s). Skipping voiceover.")
-                        continue
+                        if max_safe_audio_duration <= 0:
+                            st.warning(f"⚠️ Audio too short after buffer ({max_safe_audio_duration:.1f}s). Skipping voiceover.")
+                            continue
                     
-                    # Choose the duration that covers the entire video
-                    # If audio is shorter, we'll use what we have; if longer, we'll trim it
-                    audio_duration = min(actual_video_duration, max_safe_audio_duration)
+                        # Choose the duration that covers the entire video
+                        # If audio is shorter, we'll use what we have; if longer, we'll trim it
+                        audio_duration = min(actual_video_duration, max_safe_audio_duration)
                     
-                    # IMPORTANT: Ensure audio covers the entire video timeline
-                    if audio_duration < actual_video_duration:
-                        st.info(f"🔍 Audio ({audio_duration:.1f}s) is shorter than video ({actual_video_duration:.1f}s)")
-                        st.info("💡 Voiceover will cover the available duration, then video will continue without narration")
+                        # IMPORTANT: Ensure audio covers the entire video timeline
+                        if audio_duration < actual_video_duration:
+                            st.info(f"🔍 Audio ({audio_duration:.1f}s) is shorter than video ({actual_video_duration:.1f}s)")
+                            st.info("💡 Voiceover will cover the available duration, then video will continue without narration")
                     
-                    # Additional safety checks
-                    if audio_duration <= 0:
-                        st.warning(f"⚠️ Calculated audio duration is invalid ({audio_duration:.1f}s). Skipping voiceover.")
-                        continue
+                        # Additional safety checks
+                        if audio_duration <= 0:
+                            st.warning(f"⚠️ Calculated audio duration is invalid ({audio_duration:.1f}s). Skipping voiceover.")
+                            continue
                     
-                    # Final bounds check - but prioritize covering more of the video
-                    if audio_duration > asset_audio_duration:
-                        audio_duration = asset_audio_duration * 0.98  # Use 98% of available audio (less aggressive trim)
+                        # Final bounds check - but prioritize covering more of the video
+                        if audio_duration > asset_audio_duration:
+                            audio_duration = asset_audio_duration * 0.98  # Use 98% of available audio (less aggressive trim)
                     
                     st.info(f"🎤 Syncing voiceover: {audio_duration:.1f}s audio to cover {actual_video_duration:.1f}s video timeline")
                     
                     audio_asset = AudioAsset(
                         asset_id=asset['asset_id'],
-                        start=0,
-                        end=audio_duration,
+                        start=audio_start,
+                        end=audio_start + audio_duration,
                         disable_other_tracks=False  # Mix with original video audio
                     )
                     
@@ -1275,6 +3969,7 @@ def assemble_multimedia_video(conn, content_plan, media_assets, generated_assets
                     try:
                         timeline.add_overlay(start=0, asset=audio_asset)
                         audio_overlays_added += 1
+                        voiceover_range = (asset['asset_id'], audio_start, audio_duration)
                         st.info(f"✅ Added voiceover overlay (0-{audio_duration:.1f}s) across entire timeline")
                         
                         # Debug: Show timeline coverage
@@ -1321,7 +4016,17 @@ def assemble_multimedia_video(conn, content_plan, media_assets, generated_assets
                 st.info("🎬 Generating video stream (with audio overlays)...")
                 
                 # Use BASIC stream generation first - more reliable
-                final_video_url = timeline.generate_stream()
+                progressive = on_preview and timeline_ranges and timeline_duration >= PROGRESSIVE_MIN_TIMELINE_SECONDS
+                if progressive and budget_remaining('renders') < 2:
+                    st.info("🧾 Skipping the quick preview to stay within this job's render budget")
+                    progressive = False
+                if progressive:
+                    preview_timeline, preview_duration = build_preview_timeline(conn, timeline_ranges, voiceover_range)
+                    st.info(f"⚡ Rendering a {preview_duration:.0f}s preview while the full {timeline_duration:.0f}s video renders...")
+                    final_video_url = render_progressive(timeline, timeline_duration, preview_timeline, preview_duration,
+                                                         on_preview, audio_overlays=audio_overlays_added)
+                else:
+                    final_video_url = _render_stream(timeline, 'voiceover', timeline_duration, audio_overlays=audio_overlays_added)
                 
                 st.success(f"✅ Video generated successfully!")
                 st.info(f"📊 Final video: ~{timeline_duration:.1f}s duration, {audio_overlays_added} audio overlays")
@@ -1339,6 +4044,7 @@ def assemble_multimedia_video(conn, content_plan, media_assets, generated_assets
                 st.info("💡 Trying without audio overlays...")
                 
                 # STEP 2: Try timeline without audio overlays (video-only)
+                mark_degraded("rendered without audio")
                 try:
                     st.info("🔄 Creating professional video-only timeline (no audio overlays)...")
                     
@@ -1346,43 +4052,18 @@ def assemble_multimedia_video(conn, content_plan, media_assets, generated_assets
                     video_only_timeline = Timeline(conn)
                     video_only_duration = 0
                     
-                    # Add videos only (no audio overlays, no title cards)
+                    # Add videos only (no audio overlays, no title cards), same cut list as the main timeline
                     video_assets = [asset for asset in media_assets if asset['media_type'] == 'video']
-                    video_assets.sort(key=lambda x: x['name'])  # Sort by filename
                     
                     st.info("📹 Focusing on professional video editing (no title cards)")
                     
-                    # Professional video clip editing
-                    remaining_duration = adjusted_duration  # Use full duration for videos
-                    clips_to_use = min(len(video_assets), 3)
-                    duration_per_clip = remaining_duration / clips_to_use if clips_to_use > 0 else 0
-                    
-                    for i, video_asset in enumerate(video_assets[:clips_to_use]):
-                        source_duration = video_asset.get('duration', 10)
-                        
-                        # Professional editing: Smart duration and start time
-                        max_usable_duration = source_duration * 0.90
-                        clip_duration = min(duration_per_clip, max_usable_duration)
-                        clip_duration = max(clip_duration, 3)  # Minimum 3s
-                        
-                        # Smart start time (avoid very beginning)
-                        if source_duration > clip_duration + 2:
-                            start_time = min(1, source_duration * 0.1)
-                        else:
-                            start_time = 0
-                        
-                        video_clip = VideoAsset(
-                            asset_id=video_asset['asset_id'],
-                            start=start_time,
-                            end=start_time + clip_duration
-                        )
-                        video_only_timeline.add_inline(video_clip)
-                        video_only_duration += clip_duration
-                        st.info(f"✅ Professional edit: {video_asset['name']} ({clip_duration:.1f}s from {start_time:.1f}s)")
+                    clip_plan = plan_clip_ranges(video_assets, timeline_structure, adjusted_duration)
+                    video_only_duration = add_ranges_to_timeline(video_only_timeline, clip_plan['ranges'])
+                    st.info(f"✅ Professional edit: {len(clip_plan['clips'])} clips in {len(clip_plan['ranges'])} ranges")
                     
                     # Generate professionally edited video-only stream
                     st.info("🎬 Generating professionally edited video stream...")
-                    video_only_url = video_only_timeline.generate_stream()
+                    video_only_url = _render_stream(video_only_timeline, 'video_only', video_only_duration)
                     
                     if video_only_url and len(video_only_url) > 10:
                         st.success("✅ Professional video-only stream generated successfully!")
@@ -1395,7 +4076,10 @@ def assemble_multimedia_video(conn, content_plan, media_assets, generated_assets
                     st.error(f"❌ Video-only timeline failed: {str(video_only_error)}")
                 
                 # STEP 3: ULTIMATE FALLBACK - Direct video stream
+                mark_degraded("unedited video")
                 st.info("🔄 Attempting direct video stream generation...")
+                if budget_remaining('renders') < 1:
+                    st.warning("🧾 This job's render budget is spent; falling back to the original video without another render")
                 try:
                     # Find first video asset and generate stream directly
                     for asset in media_assets:
@@ -1406,7 +4090,9 @@ def assemble_multimedia_video(conn, content_plan, media_assets, generated_assets
                             # Try different direct stream approaches
                             try:
                                 # Method 1: Basic stream
-                                direct_url = video_obj.generate_stream()
+                                with trace_span("video.generate_stream", variant='direct'), scheduler_slot('render'):
+                                    charge(renders=1, rendered_seconds=asset.get('duration', 0))
+                                    direct_url = video_obj.generate_stream()
                                 if direct_url and len(direct_url) > 10:
                                     st.success("✅ Direct video stream generated (Method 1)!")
                                     return direct_url
@@ -1417,7 +4103,9 @@ def assemble_multimedia_video(conn, content_plan, media_assets, generated_assets
                                 # Method 2: Stream with simple timeline
                                 video_duration = asset.get('duration', 30)
                                 max_duration = min(target_duration, video_duration)
-                                direct_url = video_obj.generate_stream(timeline=[(0, max_duration)])
+                                with trace_span("video.generate_stream", variant='direct_range', timeline_seconds=max_duration), scheduler_slot('render'):
+                                    charge(renders=1, rendered_seconds=max_duration)
+                                    direct_url = video_obj.generate_stream(timeline=[(0, max_duration)])
                                 if direct_url and len(direct_url) > 10:
                                     st.success("✅ Direct video stream generated (Method 2)!")
                                     return direct_url
@@ -1437,7 +4125,7 @@ def assemble_multimedia_video(conn, content_plan, media_assets, generated_assets
                                 )
                                 simple_timeline.add_inline(simple_video)
                                 
-                                simple_url = simple_timeline.generate_stream()
+                                simple_url = _render_stream(simple_timeline, 'simple', clip_duration)
                                 if simple_url and len(simple_url) > 10:
                                     st.success("✅ Simple timeline generated (Method 3)!")
                                     return simple_url
@@ -1467,13 +4155,16 @@ def assemble_multimedia_video(conn, content_plan, media_assets, generated_assets
     except Exception as e:
         st.error(f"❌ Timeline assembly failed: {str(e)}")
         st.info("🔄 Using fallback approach...")
+        mark_degraded("unedited video")
         
         # Fallback: Just return the first video asset as-is
         try:
             first_video = next((a for a in media_assets if a['media_type'] == 'video'), None)
             if first_video and 'video_obj' in first_video:
                 # Generate a simple stream from the first video
-                return first_video['video_obj'].generate_stream(timeline=[(0, min(30, first_video.get('duration', 30)))])
+                with trace_span("video.generate_stream", variant='fallback'), scheduler_slot('render'):
+                    charge(renders=1, rendered_seconds=min(30, first_video.get('duration', 30)))
+                    return first_video['video_obj'].generate_stream(timeline=[(0, min(30, first_video.get('duration', 30)))])
             else:
                 st.error("❌ No video assets available for fallback")
                 return None
@@ -1483,6 +4174,650 @@ def assemble_multimedia_video(conn, content_plan, media_assets, generated_assets
             return None
 
 
+# Memoized pipeline stages: each output is kept per session with a hash of its inputs,
+# so an edit reruns only the stages downstream of what actually changed
+_active_degradations = contextvars.ContextVar("edentic_active_degradations", default=None)
+
+
+@contextmanager
+def degradation_scope():
+    """Collect mark_degraded() calls made in this context (and threads started with copy_context)"""
+    marks = []
+    token = _active_degradations.set(marks)
+    try:
+        yield marks
+    finally:
+        _active_degradations.reset(token)
+
+
+def mark_degraded(reason, name=None):
+    """Record that the running stage fell back to a lesser output (for asset `name`, or all of it); it is shown but not memoized"""
+    marks = _active_degradations.get()
+    if marks is not None:
+        marks.append((name, reason))
+    span = _active_span.get()
+    if span is not None:
+        span['attributes']['degraded'] = reason
+
+
+def stage_hash(*inputs):
+    """Content hash of a stage's JSON-able inputs"""
+    payload = json.dumps(inputs, sort_keys=True, default=str, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def memoized_stage(name, input_hash, compute, encode=None, decode=None):
+    """Return (output, reused): the stored output if input_hash matches, else compute() and store it.
+    
+    Outputs are looked up in this session first, then in the shared cache tier
+    written by every replica. encode/decode convert outputs holding SDK handles
+    to and from JSON-able values; by default the output is stored as is.
+    Empty outputs (a failed or no-op stage) and outputs marked with mark_degraded()
+    (fallback plans, unedited renders) are not stored, so the next run retries.
+    """
+    outputs = st.session_state.setdefault('stage_outputs', {})
+    entry = outputs.get(name)
+    span = _active_span.get()
+    if entry and entry['input_hash'] == input_hash:
+        if span:
+            span['attributes']['reused'] = 'session'
+        return entry['output'], True
+    
+    shared = shared_cache_get(name, input_hash)
+    if shared is not None:
+        try:
+            output = decode(shared) if decode else shared
+        except Exception:
+            output = None  # E.g. the remote asset behind the entry is gone; recompute
+        if output:
+            outputs[name] = {'input_hash': input_hash, 'output': output}
+            if span:
+                span['attributes']['reused'] = 'shared'
+            return output, True
+    
+    with degradation_scope() as degraded:
+        output = compute()
+    if output and not degraded:
+        outputs[name] = {'input_hash': input_hash, 'output': output}
+        shared_cache_put(name, input_hash, encode(output) if encode else output)
+    else:
+        outputs.pop(name, None)
+    return output, False
+
+
+def encode_asset_record(record):
+    """JSON-able fields of a MediaAssetRecord, without the SDK handle or derived transcript index"""
+    return {key: value for key, value in record.items() if key not in ('asset', 'video_obj', 'transcript_index')}
+
+
+def decode_asset_record(collection, fields, **overrides):
+    """Rebuild a MediaAssetRecord from encode_asset_record() output, fetching a fresh SDK handle"""
+    fields = dict(fields, **overrides)
+    fetch = {'video': collection.get_video, 'image': collection.get_image, 'audio': collection.get_audio}[fields['media_type']]
+    with trace_span(f"collection.get_{fields['media_type']}", asset_id=fields['asset_id']):
+        handle = fetch(fields['asset_id'])
+    transcript_index = None
+    if fields['media_type'] == 'video':
+        stored = load_asset_metadata(asset_id=fields['asset_id'])
+        if stored and stored['transcript']:
+            fields['transcript'] = transcript_index = _RECORD_STORED
+    return MediaAssetRecord(asset=handle, transcript_index=transcript_index, **fields)
+
+
+def ingest_media(collection, uploaded_files, file_descriptions, project_description):
+    """Upload and index only files whose content is new to this session and to the shared cache.
+    
+    Returns (media_assets, ingest hashes by file name, reused file count). Asset
+    descriptions are applied from file_descriptions on every run, so editing one
+    never re-uploads or re-indexes anything. Assets whose indexing or duration
+    detection fell back are used for this run only, not cached.
+    """
+    outputs = st.session_state.setdefault('stage_outputs', {})
+    hashes = {f.name: stage_hash(collection.id, upload_content_hash(f)) for f in uploaded_files}
+    for name in [name for name in outputs if name.startswith('ingest:') and name[len('ingest:'):] not in hashes]:
+        del outputs[name]
+    
+    fresh = []
+    for uploaded_file in uploaded_files:
+        key = f"ingest:{uploaded_file.name}"
+        if outputs.get(key, {}).get('input_hash') == hashes[uploaded_file.name]:
+            continue
+        shared = shared_cache_get('ingest', hashes[uploaded_file.name])
+        try:
+            asset = decode_asset_record(collection, shared, name=uploaded_file.name) if shared else None
+        except Exception:
+            asset = None
+        if asset is None:
+            fresh.append(uploaded_file)
+        else:
+            outputs[key] = {'input_hash': hashes[uploaded_file.name], 'output': asset}
+    
+    uncached = {}
+    if fresh:
+        with degradation_scope() as degraded:
+            assets = upload_and_analyze_mixed_media(collection, fresh, file_descriptions, project_description)
+        degraded_names = {name for name, _ in degraded}
+        for asset in assets:
+            if asset['name'] in degraded_names or None in degraded_names:
+                uncached[asset['name']] = asset
+                continue
+            outputs[f"ingest:{asset['name']}"] = {'input_hash': hashes[asset['name']], 'output': asset}
+            shared_cache_put('ingest', hashes[asset['name']], encode_asset_record(asset))
+    
+    media_assets = []
+    for uploaded_file in uploaded_files:
+        asset = uncached.get(uploaded_file.name)
+        entry = outputs.get(f"ingest:{uploaded_file.name}")
+        if asset is None and entry and entry['input_hash'] == hashes[uploaded_file.name]:
+            asset = entry['output']
+        if asset is not None:
+            description = file_descriptions.get(uploaded_file.name, "")
+            media_assets.append(asset if asset['description'] == description else asset.replace(description=description))
+    return media_assets, hashes, len(uploaded_files) - len(fresh)
+
+
+def run_multimedia_job(conn, collection, genai_client, uploaded_files, file_descriptions, project_description, target_duration, video_style,
+                       storyboard_review=False, fast_draft=False):
+    """Run the full multimedia pipeline (upload → plan → storyboard → generate → assemble → preview) for one job"""
+    
+    # Show progress sections
+    with st.container():
+        st.header("🔄 AI Multimedia Magic in Progress...")
+        st.markdown("*Our AI is analyzing, generating, and editing your professional video!*")
+        
+        # Step 1: Upload and analyze media
+        with st.spinner("📤 Step 1: Uploading and analyzing your media assets..."), trace_span("stage.upload_and_index", files=len(uploaded_files)) as span:
+            media_assets, ingest_hashes, reused_files = ingest_media(collection, uploaded_files, file_descriptions, project_description)
+            span['attributes']['reused_files'] = reused_files
+        
+        if not media_assets:
+            st.error("❌ Failed to upload and analyze media assets.")
+            return
+        
+        if reused_files:
+            st.info(f"♻️ {reused_files} of {len(uploaded_files)} files were already uploaded and indexed - skipped upload and indexing")
+        
+        st.success(f"✅ Successfully analyzed {len(media_assets)} media assets")
+        
+        # Show asset analysis
+        with st.expander("📊 Media Asset Analysis"):
+            for asset in media_assets:
+                st.write(f"**{asset['name']}** ({asset['media_type'].upper()})")
+                st.write(f"📝 Description: {asset['description'] or 'No description provided'}")
+                if asset['transcript']:
+                    st.write(f"🎤 Found spoken content: {len(asset['transcript'])} characters")
+                st.write("---")
+        
+        # Step 2: Create comprehensive content plan
+        plan_hash = stage_hash(
+            [(asset['name'], ingest_hashes[asset['name']], asset['description']) for asset in media_assets],
+            project_description, target_duration, fast_draft
+        )
+        plan_started = time.perf_counter()
+        with st.spinner("🧠 Step 2: AI is creating your comprehensive content plan..."), trace_span("stage.plan", assets=len(media_assets), fast_draft=fast_draft):
+            if fast_draft:
+                content_plan, plan_reused = memoized_stage('plan', plan_hash, lambda: create_local_content_plan(
+                    media_assets, project_description, target_duration
+                ))
+            else:
+                content_plan, plan_reused = memoized_stage('plan', plan_hash, lambda: create_comprehensive_content_plan(
+                    genai_client, media_assets, project_description, target_duration
+                ))
+        
+        if not content_plan:
+            st.error("❌ Failed to create content plan.")
+            return
+        
+        if plan_reused:
+            st.success("♻️ Project, duration and asset descriptions are unchanged - reusing the content plan")
+        elif fast_draft:
+            st.success(f"⚡ Local draft plan ready in {(time.perf_counter() - plan_started) * 1000:.0f} ms - "
+                       "refine it with AI from the storyboard review")
+        else:
+            st.success("✅ AI created a comprehensive content plan!")
+        
+        # Show content plan
+        with st.expander("🎯 AI Content Plan"):
+            st.write(f"**Project Analysis:** {content_plan.get('project_analysis', 'N/A')}")
+            st.write(f"**Target Audience:** {content_plan.get('target_audience', 'N/A')}")
+            
+            content_to_gen = content_plan.get('content_to_generate', [])
+            if content_to_gen:
+                st.write("**Content to Generate:**")
+                for item in content_to_gen:
+                    st.write(f"- **{item.get('type', 'Unknown')}:** {item.get('description', 'N/A')}")
+            
+            timeline = content_plan.get('timeline_structure', [])
+            if timeline:
+                st.write(f"**Timeline Structure:** {len(timeline)} segments with intelligent analysis")
+                for segment in timeline:
+                    importance_stars = "⭐" * segment.get('importance', 1)
+                    content_type = segment.get('content_type', 'unknown')
+                    st.write(f"  - **{segment.get('asset_name', 'Unknown')}** ({segment.get('recommended_duration', 0):.1f}s) - {importance_stars} {content_type}")
+                    st.write(f"    *{segment.get('description', 'No description')}*")
+        
+        # Storyboard preview of the planned edit - no render needed
+        image_sources = {f.name: f.getvalue() for f in uploaded_files if f.name.lower().endswith(('.jpg', '.jpeg', '.png', '.gif', '.bmp'))}
+        with st.spinner("🖼️ Building storyboard preview..."), trace_span("stage.storyboard") as span:
+            try:
+                storyboard = build_storyboard(content_plan, media_assets, image_sources, target_duration)
+                span['attributes']['tiles'] = storyboard['tiles']
+            except Exception as e:
+                storyboard = None
+                st.warning(f"⚠️ Could not build storyboard preview: {str(e)}")
+        
+        if storyboard and storyboard_review:
+            # Park the job until the user approves the plan (see the Storyboard Review section)
+            st.session_state['pending_job'] = {
+                'media_assets': media_assets,
+                'content_plan': content_plan,
+                'project_description': project_description,
+                'target_duration': target_duration,
+                'video_style': video_style,
+                'image_sources': image_sources,
+                'storyboard': storyboard
+            }
+            st.info("🖼️ Review the storyboard below, then render this plan or discard it.")
+            return
+        
+        if storyboard:
+            with st.expander("🖼️ Storyboard Preview", expanded=True):
+                show_storyboard(storyboard)
+    
+    render_planned_job(conn, collection, genai_client, content_plan, media_assets, target_duration, video_style)
+
+
+def refine_pending_job(genai_client, job):
+    """Replace a parked job's local draft plan with the Gemini-refined plan and rebuild its storyboard"""
+    with st.spinner("✨ Refining the draft plan with AI..."):
+        job['content_plan'] = refine_content_plan(
+            genai_client, job['content_plan'], job['media_assets'], job['project_description'], job['target_duration']
+        )
+        with trace_span("stage.storyboard") as span:
+            try:
+                job['storyboard'] = build_storyboard(job['content_plan'], job['media_assets'], job['image_sources'], job['target_duration'])
+                span['attributes']['tiles'] = job['storyboard']['tiles']
+            except Exception as e:
+                st.warning(f"⚠️ Could not rebuild the storyboard preview: {str(e)}")
+
+
+def render_planned_job(conn, collection, genai_client, content_plan, media_assets, target_duration, video_style):
+    """Generate missing content, render the planned edit and show the preview"""
+    
+    with st.container():
+        # Step 3: Generate missing content
+        content_to_generate = content_plan.get('content_to_generate', [])
+        generated_assets = []
+        
+        if content_to_generate:
+            with st.spinner("🎨 Step 3: Generating missing content with AI..."), trace_span("stage.generate"):
+                generated_assets, generated_reused = memoized_stage(
+                    'generate', stage_hash(collection.id, content_to_generate),
+                    lambda: generate_missing_content(collection, genai_client, content_plan, media_assets),
+                    encode=lambda assets: [encode_asset_record(asset) for asset in assets],
+                    decode=lambda fields: [decode_asset_record(collection, asset_fields) for asset_fields in fields]
+                )
+                generated_assets = generated_assets or []
+            
+            if generated_assets and generated_reused:
+                st.success(f"♻️ Generation requests are unchanged - reusing {len(generated_assets)} generated assets")
+            elif generated_assets:
+                st.success(f"✅ Generated {len(generated_assets)} new assets!")
+                
+                with st.expander("🎨 Generated Content"):
+                    for asset in generated_assets:
+                        st.write(f"**{asset['generation_type'].replace('_', ' ').title()}**")
+                        st.write(f"📝 {asset['description']}")
+                        st.write("---")
+            else:
+                st.info("ℹ️ No additional content needed - using existing assets")
+        else:
+            st.info("ℹ️ All required content is available - proceeding with editing")
+        
+        # One cut list for the uploaded videos, shared by the voiceover render and the music variant.
+        # Generated video clips join the sequence, so then assembly plans the cuts itself
+        planned_clips = None
+        if not any(a['media_type'] == 'video' for a in generated_assets):
+            source_videos = [a for a in media_assets if a['media_type'] == 'video']
+            try:
+                planned_clips = plan_clip_ranges(source_videos, content_plan.get('timeline_structure', []),
+                                                 adjusted_target_duration(source_videos, target_duration))
+            except Exception:
+                pass  # Assembly plans the cuts itself and reports the problem
+        
+        # Step 4: Create initial video with voiceover only (no background music to avoid conflicts)
+        preview_slot = st.empty()
+        
+        def show_preview(preview_url):
+            with preview_slot.container():
+                st.subheader("⚡ Quick Preview (opening scenes)")
+                st.video(preview_url)
+                st.caption("The full video is still rendering and will replace this preview when it is ready.")
+        
+        with st.spinner("🎬 Step 4: Creating video with professional editing and voiceover..."), trace_span("stage.assemble"):
+            # Filter out background music for initial creation
+            background_music_assets = [a for a in generated_assets if a.get('generation_type') == 'background_music']
+            voiceover_only_assets = [a for a in generated_assets if a.get('generation_type') != 'background_music']
+            
+            render_hash = stage_hash(
+                content_plan.get('timeline_structure', []),
+                [(asset['asset_id'], asset['media_type'], asset.get('duration')) for asset in media_assets],
+                [(asset['asset_id'], asset.get('speech_start'), asset.get('speech_end')) for asset in voiceover_only_assets],
+                target_duration
+            )
+            initial_video_url, render_reused = memoized_stage('render', render_hash, lambda: assemble_multimedia_video(
+                conn, content_plan, media_assets, voiceover_only_assets, target_duration, on_preview=show_preview,
+                clip_plan=planned_clips
+            ))
+        preview_slot.empty()
+        if render_reused:
+            st.info("♻️ The edit is unchanged since the last render - reusing the rendered video")
+        
+        if initial_video_url:
+            st.success("🎉 Your professional video with voiceover is ready!")
+            st.session_state['export_url'] = initial_video_url
+            
+            # Step 5: Preview and user decision for background music
+            st.header("🎬 Preview Your Edited Video")
+            st.markdown("**✨ Your video has been professionally edited with:**")
+            st.markdown("- 📹 Cropped and optimally sequenced clips")
+            st.markdown("- 🎤 AI-generated voiceover narration")
+            st.markdown("- ⚡ Perfect timing and transitions")
+            
+            try:
+                st.video(initial_video_url)
+                st.info("📎 **Preview Link:** [Open in new tab](" + initial_video_url + ")")
+                
+            except Exception as e:
+                st.warning(f"⚠️ Could not embed video: {str(e)}")
+                st.markdown(f"**🎬 Your video is ready!** [Click here to view]({initial_video_url})")
+            
+            # User decision for background music: shown by main() so it survives the button rerun,
+            # while the music variant renders in the background
+            if background_music_assets:
+                previous = st.session_state.pop('music_decision', None)
+                if previous:
+                    cancel_music_speculation(previous['speculation'])
+                st.session_state['music_decision'] = {
+                    'initial_video_url': initial_video_url,
+                    'content_plan': content_plan,
+                    'media_assets': media_assets,
+                    'generated_assets': generated_assets,
+                    'voiceover_only_count': len(voiceover_only_assets),
+                    'target_duration': target_duration,
+                    'video_style': video_style,
+                    'clip_plan': planned_clips,
+                    'speculation': start_music_speculation(conn, content_plan, media_assets, generated_assets, target_duration,
+                                                           clip_plan=planned_clips)
+                }
+            
+            else:
+                # No background music was generated
+                st.success("✅ Your professionally edited video with voiceover is complete!")
+                st.info(f"""
+                🎬 **Video Creation Summary:**
+                - Clips professionally edited and sequenced
+                - AI voiceover narration added
+                - Perfect timing and transitions
+                - Ready to share!
+                """)
+                st.balloons()
+                
+        else:
+            st.error("❌ Failed to create initial video.")
+            st.info("💡 **Troubleshooting tips:**")
+            st.write("- Check your internet connection")
+            st.write("- Verify your API keys are correct") 
+            st.write("- Try with smaller media files")
+            st.write("- Ensure media files are in supported formats")
+            st.write("- Simplify your project description")
+
+
+# Speculative rendering of the background-music variant while the user watches the preview.
+# Only reached when the plan produced a background_music asset, which generate_missing_content
+# currently skips, so the path is dormant until music generation is switched back on.
+
+
+@st.cache_resource
+def _speculation():
+    """Speculation workers and counters for the whole process; a cached resource so reruns (every click) keep them"""
+    return {
+        'executor': ThreadPoolExecutor(max_workers=2, thread_name_prefix="edentic-speculative"),
+        'lock': threading.Lock(),
+        'stats': {'started': 0, 'hits': 0, 'cancelled': 0, 'seconds_saved': 0.0, 'seconds_wasted': 0.0}
+    }
+
+
+def _speculative_music_render(cancelled, conn, content_plan, media_assets, generated_assets, target_duration, clip_plan=None):
+    """Background worker: returns (video_url or None, render seconds). Streamlit output is dropped off the script thread."""
+    if cancelled.is_set():
+        return None, 0.0
+    start = time.perf_counter()
+    try:
+        with trace_span("speculative.assemble_music"):
+            url = assemble_multimedia_video_with_music(conn, content_plan, media_assets, generated_assets, target_duration,
+                                                       clip_plan=clip_plan)
+    except Exception:
+        url = None
+    return url, time.perf_counter() - start
+
+
+def start_music_speculation(conn, content_plan, media_assets, generated_assets, target_duration, clip_plan=None):
+    """Start rendering the music variant now, on the bet that the user will want it (None if the job has no render budget left)"""
+    if budget_remaining('renders') < 1:
+        return None
+    speculation = _speculation()
+    cancelled = threading.Event()
+    future = speculation['executor'].submit(
+        contextvars.copy_context().run, _speculative_music_render,
+        cancelled, conn, content_plan, media_assets, generated_assets, target_duration, clip_plan
+    )
+    with speculation['lock']:
+        speculation['stats']['started'] += 1
+    return {'future': future, 'cancelled': cancelled}
+
+
+def accept_music_speculation(speculation):
+    """Collect the speculative render (waiting if it is still running); None if it failed or never started"""
+    if speculation is None:
+        return None
+    wait_start = time.perf_counter()
+    url, render_seconds = speculation['future'].result()
+    waited = time.perf_counter() - wait_start
+    if url:
+        shared = _speculation()
+        with shared['lock']:
+            shared['stats']['hits'] += 1
+            shared['stats']['seconds_saved'] += max(0.0, render_seconds - waited)
+    return url
+
+
+def cancel_music_speculation(speculation):
+    """Drop a speculative render; time it spent rendering is counted as wasted once it finishes"""
+    if speculation is None:
+        return
+    speculation['cancelled'].set()
+    
+    shared = _speculation()
+    
+    def record(future):
+        _, render_seconds = future.result()
+        with shared['lock']:
+            shared['stats']['cancelled'] += 1
+            shared['stats']['seconds_wasted'] += render_seconds
+    
+    speculation['future'].add_done_callback(record)
+
+
+def speculation_report():
+    """Process-wide speculation counters plus the hit rate over decided speculations"""
+    shared = _speculation()
+    with shared['lock']:
+        report = dict(shared['stats'])
+    decided = report['hits'] + report['cancelled']
+    report['hit_rate'] = report['hits'] / decided if decided else None
+    return report
+
+
+def show_music_decision(conn):
+    """Ask whether to add background music to the finished voiceover video"""
+    decision = st.session_state['music_decision']
+    st.header("🎵 Add Background Music?")
+    st.markdown("Your video looks great! Would you like to add background music to make it even more engaging?")
+    st.markdown(f"📎 **Current version:** [Open in new tab]({decision['initial_video_url']})")
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        add_music = st.button("✅ Yes, Add Background Music", type="primary", key="add_music")
+    
+    with col2:
+        keep_current = st.button("✋ Keep Current Version", key="keep_current")
+    
+    media_assets = decision['media_assets']
+    if add_music:
+        st.session_state.pop('music_decision')
+        with st.spinner("🎵 Adding background music and creating final video..."), trace_span("stage.assemble_music"):
+            # Usually already rendered in the background while the preview was playing
+            final_video_url = accept_music_speculation(decision['speculation'])
+            if not final_video_url:
+                final_video_url = assemble_multimedia_video_with_music(
+                    conn, decision['content_plan'], media_assets, decision['generated_assets'], decision['target_duration'],
+                    clip_plan=decision['clip_plan']
+                )
+        
+        if final_video_url:
+            st.success("🎉 Final video with background music is ready!")
+            st.session_state['export_url'] = final_video_url
+            
+            st.header("🎬 Your Complete Multimedia Video")
+            st.markdown("**🎵 Now featuring:**")
+            st.markdown("- 📹 Professionally edited and cropped clips")
+            st.markdown("- 🎤 AI voiceover narration")
+            st.markdown("- 🎵 Background music perfectly mixed")
+            st.markdown("- ✨ Broadcast-quality production")
+            
+            try:
+                st.video(final_video_url)
+                st.success("✅ Complete multimedia video creation finished!")
+                st.info(f"📎 **Final Link:** [Open in new tab]({final_video_url})")
+                
+            except Exception as e:
+                st.warning(f"⚠️ Could not embed final video: {str(e)}")
+                st.markdown(f"**🎬 Your final video is ready!** [Click here to view]({final_video_url})")
+            
+            # Final comprehensive summary
+            st.info(f"""
+            🎬 **Complete Video Summary:**
+            - Original clips: {len([a for a in media_assets if a['media_type'] == 'video'])} (professionally edited)
+            - Generated content: {len(decision['generated_assets'])} (voiceover, music, titles)
+            - Duration: {decision['target_duration']} seconds (optimally paced)
+            - Style: {decision['video_style']}
+            - Features: Professional editing, voiceover, background music
+            - Quality: Broadcast-ready multimedia experience!
+            """)
+            
+            st.balloons()
+            
+        else:
+            st.error("❌ Failed to add background music. Using voiceover-only version.")
+            st.markdown(f"**🎬 Your video with voiceover:** [Click here to view]({decision['initial_video_url']})")
+    
+    elif keep_current:
+        st.session_state.pop('music_decision')
+        cancel_music_speculation(decision['speculation'])
+        st.success("✅ Perfect! Your professionally edited video with voiceover is complete.")
+        
+        # Show summary for voiceover-only version
+        st.info(f"""
+        🎬 **Professional Video Summary:**
+        - Original clips: {len([a for a in media_assets if a['media_type'] == 'video'])} (professionally edited and cropped)
+        - Generated content: {decision['voiceover_only_count']} (voiceover and titles)
+        - Duration: {decision['target_duration']} seconds (optimally paced)
+        - Style: {decision['video_style']}
+        - Features: Professional editing with AI voiceover
+        - Quality: Ready to share and impress!
+        """)
+        
+        st.balloons()
+    
+    report = speculation_report()
+    if report['hit_rate'] is not None:
+        st.caption(f"⚡ Background music pre-rendering: {report['hit_rate']:.0%} of {report['hits'] + report['cancelled']} renders used, "
+                   f"{report['seconds_saved']:.0f}s of waiting saved, {report['seconds_wasted']:.0f}s of render time discarded")
+
+
+def run_traced_job(job_name, show_waterfall, job_fn, *args, **attributes):
+    """Run one job under a fresh trace, usage meter and this session's scheduler share, export both, and optionally show the waterfall"""
+    tenant_id = st.session_state.setdefault('tenant_id', uuid.uuid4().hex)
+    weight = job_weight(attributes.get('assets', 0), attributes.get('target_duration', 0))
+    trace = start_trace(job_name)
+    meter = start_meter(job_name)
+    try:
+        with tenant_scope(tenant_id, weight), meter_scope(meter), trace_span("job", scheduler_weight=weight, **attributes) as span:
+            try:
+                return job_fn(*args)
+            finally:
+                span['attributes']['scratch_bytes'] = scratch_usage()['bytes']
+    finally:
+        finish_trace(trace)
+        try:
+            trace_path = export_trace(trace)
+        except OSError as e:
+            trace_path = None
+            st.warning(f"⚠️ Could not export trace: {str(e)}")
+        
+        summary = usage_summary(meter, trace)
+        summary['session'] = tenant_id
+        try:
+            export_usage(summary)
+        except OSError as e:
+            st.warning(f"⚠️ Could not export usage summary: {str(e)}")
+        totals = st.session_state.setdefault('usage_totals', {})
+        for resource, amount in summary['usage'].items():
+            totals[resource] = totals.get(resource, 0) + amount
+        if summary['refused']:
+            st.warning(f"🧾 Budget reached for {', '.join(sorted(summary['refused']))}: some steps were skipped or simplified. "
+                       f"Raise the EDENTIC_BUDGET_* settings to allow more.")
+        st.caption(f"🧾 This job used {format_usage(summary['usage'])} · this session: {format_usage(totals)}")
+        
+        if show_waterfall:
+            with st.expander("⏱️ Performance Waterfall", expanded=True):
+                render_trace_waterfall(trace)
+                if trace_path:
+                    st.caption(f"📁 Trace exported to {trace_path}")
+                scratch = scratch_usage()
+                st.caption(f"💽 Scratch space: {scratch['bytes'] / (1024 * 1024):.0f} MB of {scratch['quota_bytes'] / (1024 * 1024):.0f} MB "
+                           f"in {scratch['files']} files across {scratch['sessions']} sessions")
+
+
+def show_export_option():
+    """Offer the latest rendered video as a local MP4 file"""
+    export_url = st.session_state['export_url']
+    st.subheader("💾 Export Your Video")
+    if st.button("💾 Export Latest Video as MP4", key="export_video",
+                 help="Download the rendered stream and save it as a file for publishing"):
+        progress_bar = st.progress(0.0)
+        try:
+            with st.spinner("💾 Downloading video segments..."):
+                result = export_render(export_url, progress=progress_bar.progress)
+            st.session_state['export_result'] = dict(result, url=export_url)
+        except Exception as e:
+            st.error(f"❌ Export failed: {str(e)}")
+        progress_bar.empty()
+    
+    result = st.session_state.get('export_result')
+    if result and result['url'] == export_url and os.path.exists(result['path']):
+        st.success(f"✅ Exported {result['segments']} segments ({result['bytes'] / (1024 * 1024):.1f} MB) "
+                   f"in {result['seconds']:.1f}s at {result['mb_per_s']:.1f} MB/s")
+        if result['format'] != 'mp4':
+            st.info("💡 ffmpeg was not found, so the video was saved as MPEG-TS. Most players open it; install ffmpeg for MP4.")
+        with open(result['path'], 'rb') as f:
+            st.download_button("⬇️ Download Video", f, file_name=os.path.basename(result['path']),
+                               mime='video/mp4' if result['format'] == 'mp4' else 'video/mp2t')
+        st.caption(f"📁 Saved to {result['path']}")
+
+
 def main():
     """Main Streamlit application - Advanced Multimedia Content Creator"""
     
@@ -1509,9 +4844,9 @@ def main():
     **Perfect for tutorials, presentations, marketing videos, and creative projects!**
     """)
     
-    # Initialize clients
-    with st.spinner("🔧 Initializing AI services..."):
-        conn, collection, genai_client = init_clients()
+    # Warm up API clients and local stores in the background; the page renders without waiting for them.
+    # Missing keys are reported by init_clients() when a job starts, not here
+    prewarm_if_configured()
     
     # Project description section
     st.header("📝 Describe Your Project")
@@ -1546,6 +4881,26 @@ def main():
             ]
         )
     
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        storyboard_review = st.checkbox(
+            "🖼️ Review storyboard before rendering",
+            value=True,
+            help="Show a contact sheet of the planned cuts and narration, and only render once you approve it"
+        )
+    with col2:
+        show_waterfall = st.checkbox(
+            "⏱️ Show performance waterfall",
+            value=False,
+            help="Trace every pipeline stage and remote call, then show where the job spent its time"
+        )
+    with col3:
+        fast_draft = st.checkbox(
+            "⚡ Fast draft plan",
+            value=False,
+            help="Plan locally in milliseconds with no AI round-trip; you can refine the draft with AI from the storyboard review"
+        )
+    
     # File upload section
     st.header("📂 Upload Your Media Assets")
     st.markdown("Upload any combination of videos, images, and audio files. Describe each one to help our AI understand how to use them.")
@@ -1594,201 +4949,62 @@ def main():
             st.error("❌ Please describe what kind of video you want to create.")
             return
         
-        # Show progress sections
-        with st.container():
-            st.header("🔄 AI Multimedia Magic in Progress...")
-            st.markdown("*Our AI is analyzing, generating, and editing your professional video!*")
-            
-            # Step 1: Upload and analyze media
-            with st.spinner("📤 Step 1: Uploading and analyzing your media assets..."):
-                media_assets = upload_and_analyze_mixed_media(collection, uploaded_files, file_descriptions, project_description)
-            
-            if not media_assets:
-                st.error("❌ Failed to upload and analyze media assets.")
-                return
-            
-            st.success(f"✅ Successfully analyzed {len(media_assets)} media assets")
-            
-            # Show asset analysis
-            with st.expander("📊 Media Asset Analysis"):
-                for asset in media_assets:
-                    st.write(f"**{asset['name']}** ({asset['media_type'].upper()})")
-                    st.write(f"📝 Description: {asset['description'] or 'No description provided'}")
-                    if asset['transcript']:
-                        st.write(f"🎤 Found spoken content: {len(asset['transcript'])} characters")
-                    st.write("---")
-            
-            # Step 2: Create comprehensive content plan
-            with st.spinner("🧠 Step 2: AI is creating your comprehensive content plan..."):
-                content_plan = create_comprehensive_content_plan(genai_client, media_assets, project_description, target_duration)
-            
-            if not content_plan:
-                st.error("❌ Failed to create content plan.")
-                return
-            
-            st.success("✅ AI created a comprehensive content plan!")
-            
-            # Show content plan
-            with st.expander("🎯 AI Content Plan"):
-                st.write(f"**Project Analysis:** {content_plan.get('project_analysis', 'N/A')}")
-                st.write(f"**Target Audience:** {content_plan.get('target_audience', 'N/A')}")
-                
-                content_to_gen = content_plan.get('content_to_generate', [])
-                if content_to_gen:
-                    st.write("**Content to Generate:**")
-                    for item in content_to_gen:
-                        st.write(f"- **{item.get('type', 'Unknown')}:** {item.get('description', 'N/A')}")
-                
-                timeline = content_plan.get('timeline_structure', [])
-                if timeline:
-                    st.write(f"**Timeline Structure:** {len(timeline)} segments with intelligent analysis")
-                    for segment in timeline:
-                        importance_stars = "⭐" * segment.get('importance', 1)
-                        content_type = segment.get('content_type', 'unknown')
-                        st.write(f"  - **{segment.get('asset_name', 'Unknown')}** ({segment.get('recommended_duration', 0):.1f}s) - {importance_stars} {content_type}")
-                        st.write(f"    *{segment.get('description', 'No description')}*")
-            
-            # Step 3: Generate missing content
-            content_to_generate = content_plan.get('content_to_generate', [])
-            generated_assets = []
-            
-            if content_to_generate:
-                with st.spinner("🎨 Step 3: Generating missing content with AI..."):
-                    generated_assets = generate_missing_content(collection, genai_client, content_plan, media_assets)
-                
-                if generated_assets:
-                    st.success(f"✅ Generated {len(generated_assets)} new assets!")
-                    
-                    with st.expander("🎨 Generated Content"):
-                        for asset in generated_assets:
-                            st.write(f"**{asset['generation_type'].replace('_', ' ').title()}**")
-                            st.write(f"📝 {asset['description']}")
-                            st.write("---")
-                else:
-                    st.info("ℹ️ No additional content needed - using existing assets")
-            else:
-                st.info("ℹ️ All required content is available - proceeding with editing")
-            
-            # Step 4: Create initial video with voiceover only (no background music to avoid conflicts)
-            with st.spinner("🎬 Step 4: Creating video with professional editing and voiceover..."):
-                # Filter out background music for initial creation
-                background_music_assets = [a for a in generated_assets if a.get('generation_type') == 'background_music']
-                voiceover_only_assets = [a for a in generated_assets if a.get('generation_type') != 'background_music']
-                
-                initial_video_url = assemble_multimedia_video(
-                    conn, content_plan, media_assets, voiceover_only_assets, target_duration
-                )
-            
-            if initial_video_url:
-                st.success("🎉 Your professional video with voiceover is ready!")
-                
-                # Step 5: Preview and user decision for background music
-                st.header("🎬 Preview Your Edited Video")
-                st.markdown("**✨ Your video has been professionally edited with:**")
-                st.markdown("- 📹 Cropped and optimally sequenced clips")
-                st.markdown("- 🎤 AI-generated voiceover narration")
-                st.markdown("- ⚡ Perfect timing and transitions")
-                
-                try:
-                    st.video(initial_video_url)
-                    st.info("📎 **Preview Link:** [Open in new tab](" + initial_video_url + ")")
-                    
-                except Exception as e:
-                    st.warning(f"⚠️ Could not embed video: {str(e)}")
-                    st.markdown(f"**🎬 Your video is ready!** [Click here to view]({initial_video_url})")
-                
-                # User decision for background music
-                if background_music_assets:
-                    st.header("🎵 Add Background Music?")
-                    st.markdown("Your video looks great! Would you like to add background music to make it even more engaging?")
-                    
-                    col1, col2 = st.columns(2)
-                    
-                    with col1:
-                        add_music = st.button("✅ Yes, Add Background Music", type="primary", key="add_music")
-                    
-                    with col2:
-                        keep_current = st.button("✋ Keep Current Version", key="keep_current")
-                    
-                    if add_music:
-                        with st.spinner("🎵 Adding background music and creating final video..."):
-                            # Create final version with background music
-                            final_video_url = assemble_multimedia_video_with_music(
-                                conn, content_plan, media_assets, generated_assets, target_duration
-                            )
-                        
-                        if final_video_url:
-                            st.success("🎉 Final video with background music is ready!")
-                            
-                            st.header("🎬 Your Complete Multimedia Video")
-                            st.markdown("**🎵 Now featuring:**")
-                            st.markdown("- 📹 Professionally edited and cropped clips")
-                            st.markdown("- 🎤 AI voiceover narration")
-                            st.markdown("- 🎵 Background music perfectly mixed")
-                            st.markdown("- ✨ Broadcast-quality production")
-                            
-                            try:
-                                st.video(final_video_url)
-                                st.success("✅ Complete multimedia video creation finished!")
-                                st.info(f"📎 **Final Link:** [Open in new tab]({final_video_url})")
-                                
-                            except Exception as e:
-                                st.warning(f"⚠️ Could not embed final video: {str(e)}")
-                                st.markdown(f"**🎬 Your final video is ready!** [Click here to view]({final_video_url})")
-                            
-                            # Final comprehensive summary
-                            st.info(f"""
-                            🎬 **Complete Video Summary:**
-                            - Original clips: {len([a for a in media_assets if a['media_type'] == 'video'])} (professionally edited)
-                            - Generated content: {len(generated_assets)} (voiceover, music, titles)
-                            - Duration: {target_duration} seconds (optimally paced)
-                            - Style: {video_style}
-                            - Features: Professional editing, voiceover, background music
-                            - Quality: Broadcast-ready multimedia experience!
-                            """)
-                            
-                            st.balloons()
-                            
-                        else:
-                            st.error("❌ Failed to add background music. Using voiceover-only version.")
-                            st.markdown(f"**🎬 Your video with voiceover:** [Click here to view]({initial_video_url})")
-                    
-                    elif keep_current:
-                        st.success("✅ Perfect! Your professionally edited video with voiceover is complete.")
-                        
-                        # Show summary for voiceover-only version
-                        st.info(f"""
-                        🎬 **Professional Video Summary:**
-                        - Original clips: {len([a for a in media_assets if a['media_type'] == 'video'])} (professionally edited and cropped)
-                        - Generated content: {len(voiceover_only_assets)} (voiceover and titles)
-                        - Duration: {target_duration} seconds (optimally paced)
-                        - Style: {video_style}
-                        - Features: Professional editing with AI voiceover
-                        - Quality: Ready to share and impress!
-                        """)
-                        
-                        st.balloons()
-                
-                else:
-                    # No background music was generated
-                    st.success("✅ Your professionally edited video with voiceover is complete!")
-                    st.info(f"""
-                    🎬 **Video Creation Summary:**
-                    - Clips professionally edited and sequenced
-                    - AI voiceover narration added
-                    - Perfect timing and transitions
-                    - Ready to share!
-                    """)
-                    st.balloons()
-                    
-            else:
-                st.error("❌ Failed to create initial video.")
-                st.info("💡 **Troubleshooting tips:**")
-                st.write("- Check your internet connection")
-                st.write("- Verify your API keys are correct") 
-                st.write("- Try with smaller media files")
-                st.write("- Ensure media files are in supported formats")
-                st.write("- Simplify your project description")
+        st.session_state.pop('pending_job', None)
+        stale_decision = st.session_state.pop('music_decision', None)
+        if stale_decision:
+            cancel_music_speculation(stale_decision['speculation'])
+        with st.spinner("🔧 Initializing AI services..."):
+            conn, collection, genai_client = init_clients()
+        run_traced_job(
+            "multimedia_video", show_waterfall, run_multimedia_job,
+            conn, collection, genai_client, uploaded_files, file_descriptions,
+            project_description, target_duration, video_style, storyboard_review, fast_draft,
+            assets=len(uploaded_files), target_duration=target_duration, style=video_style
+        )
+    
+    # Storyboard review: render or discard the parked plan
+    pending_job = st.session_state.get('pending_job')
+    if pending_job:
+        st.header("🖼️ Storyboard Review")
+        st.markdown("This is the planned edit. Rendering is the slowest step - check the cuts and narration first.")
+        show_storyboard(pending_job['storyboard'])
+        
+        is_draft = pending_job['content_plan'].get('planner') == 'local'
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            render_plan = st.button("✅ Render This Plan", type="primary", key="render_plan")
+        with col2:
+            discard_plan = st.button("🗑️ Discard Plan", key="discard_plan")
+        with col3:
+            refine_plan = st.button("✨ Refine Draft with AI", key="refine_plan", disabled=not is_draft,
+                                    help="Let Gemini improve the order, durations and narration of this local draft")
+        
+        if refine_plan:
+            genai_client = init_clients()[2]
+            run_traced_job(
+                "refine_plan", False, refine_pending_job, genai_client, pending_job,
+                assets=len(pending_job['media_assets']), target_duration=pending_job['target_duration']
+            )
+            st.rerun()
+        elif discard_plan:
+            st.session_state.pop('pending_job', None)
+            st.info("🗑️ Plan discarded. Adjust your description or assets and create a new plan.")
+        elif render_plan:
+            job = st.session_state.pop('pending_job')
+            conn, collection, genai_client = init_clients()
+            run_traced_job(
+                "render_plan", show_waterfall, render_planned_job,
+                conn, collection, genai_client, job['content_plan'], job['media_assets'],
+                job['target_duration'], job['video_style'],
+                assets=len(job['media_assets']), target_duration=job['target_duration'], style=job['video_style']
+            )
+    
+    # Background music decision for the last rendered video
+    if st.session_state.get('music_decision'):
+        show_music_decision(init_clients()[0])
+    
+    if st.session_state.get('export_url'):
+        show_export_option()
     
     # Example projects section
     st.markdown("---")
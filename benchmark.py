@@ -0,0 +1,760 @@
+#!/usr/bin/env python3
+"""
+Benchmark script for Edentic pipeline building blocks.
+
+Runs locally against synthetic projects; pass --live to also time the remote
+calls (requires GOOGLE_API_KEY / VIDEODB_API_KEY in the environment, and
+EDENTIC_BENCH_VIDEO_ID for render timings, EDENTIC_BENCH_STREAM_URL for export).
+
+Usage:
+    python benchmark.py [prompt] [plan] [draft] [allocate] [sequence] [images] [audio] [reopen] [scheduler] [shots] [storyboard] [preview] [export] [cache] [memory] [prewarm] [--live]
+"""
+
+import os
+import sys
+import time
+import random
+import itertools
+
+import app
+
+
+def speech_like_text(rng, word_count, vocabulary_size=4000):
+    """Transcript-like text: Zipf-distributed words from a large vocabulary, in sentences of 5-20 words"""
+    vocabulary = random.Random(vocabulary_size)
+    words = ["".join(vocabulary.choice("etaoinshrdlcumwfgypbvkjxqz"[:18 + i % 8]) for _ in range(2 + i % 9))
+             for i in range(vocabulary_size)]
+    picked = rng.choices(words, cum_weights=list(itertools.accumulate(1 / (rank + 1) ** 1.1 for rank in range(vocabulary_size))),
+                         k=word_count)
+    sentence_ends = set(itertools.accumulate(rng.randint(5, 20) for _ in range(word_count)))
+    return " ".join(word + ("." if i + 1 in sentence_ends else "") for i, word in enumerate(picked))
+
+
+def make_synthetic_assets(count, seed=7):
+    """Build a synthetic media_assets list resembling a real upload"""
+    rng = random.Random(seed)
+    words = ("coffee grinder pour water kettle filter bloom stir cup beans "
+             "temperature ratio timer scale slowly circle center edge").split()
+    assets = []
+    for i in range(count):
+        media_type = 'video' if i % 4 else 'image'
+        transcript = speech_like_text(rng, rng.randint(80, 900)) if media_type == 'video' else ""
+        assets.append({
+            'name': f"clip_{i:03d}.mp4" if media_type == 'video' else f"photo_{i:03d}.jpg",
+            'asset_id': f"asset_{i}",
+            'media_type': media_type,
+            'description': f"Step {i}: " + " ".join(rng.choice(words) for _ in range(rng.randint(5, 40))),
+            'transcript': transcript,
+            'duration': rng.uniform(4, 90) if media_type == 'video' else 0
+        })
+    return assets
+
+
+def bench_prompt(live=False):
+    """Prompt tokens (budgeted vs unbounded) and planning latency against asset count"""
+    print("📐 Planning prompt size vs asset count")
+    print(f"{'assets':>7} {'unbounded':>10} {'budgeted':>9} {'detailed':>9} {'build ms':>9} {'gemini s':>9}")
+
+    genai_client = None
+    if live:
+        from google import genai
+        genai_client = genai.Client(api_key=os.environ["GOOGLE_API_KEY"])
+
+    for count in [1, 5, 10, 25, 50, 100, 200]:
+        assets = make_synthetic_assets(count)
+        unbounded, _ = app.build_content_plan_prompt(assets, "Pour-over coffee tutorial", 60, token_budget=10 ** 9)
+
+        start = time.perf_counter()
+        prompt, stats = app.build_content_plan_prompt(assets, "Pour-over coffee tutorial", 60)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        latency = "-"
+        if genai_client:
+            start = time.perf_counter()
+            genai_client.models.generate_content(model="gemini-2.5-flash", contents=prompt)
+            latency = f"{time.perf_counter() - start:.2f}"
+
+        print(f"{count:>7} {app.estimate_tokens(unbounded):>10} {stats['tokens']:>9} "
+              f"{stats['assets_detailed']:>9} {build_ms:>9.2f} {latency:>9}")
+    print()
+
+
+def bench_hierarchical_plan(live=False):
+    """Single-call vs map-reduce planning: largest prompt per call and wall time"""
+    print("🧩 Hierarchical planning vs single call")
+    print(f"{'assets':>7} {'target s':>9} {'groups':>7} {'max group tok':>14} {'single tok':>11} {'single s':>9} {'groups s':>9}")
+
+    genai_client = None
+    if live:
+        from google import genai
+        genai_client = genai.Client(api_key=os.environ["GOOGLE_API_KEY"])
+
+    for count, target in [(6, 60), (12, 120), (24, 180), (50, 300), (100, 300)]:
+        assets = make_synthetic_assets(count)
+        groups = app.group_assets_for_planning(assets, target)
+        group_tokens = max(
+            app.build_content_plan_prompt(group, "Event recap", int(d), token_budget=app.PLAN_GROUP_TOKEN_BUDGET)[1]['tokens']
+            for group, d in groups
+        )
+        _, single_stats = app.build_content_plan_prompt(assets, "Event recap", target)
+
+        single_s = groups_s = "-"
+        if genai_client:
+            start = time.perf_counter()
+            prompt, _ = app.build_content_plan_prompt(assets, "Event recap", target)
+            genai_client.models.generate_content(model="gemini-2.5-flash", contents=prompt)
+            single_s = f"{time.perf_counter() - start:.2f}"
+
+            start = time.perf_counter()
+            with app.ThreadPoolExecutor(max_workers=app.PLAN_MAX_PARALLEL_GROUPS) as pool:
+                list(pool.map(lambda args: app._plan_asset_group(genai_client, args[1][0], args[0], len(groups), "Event recap", args[1][1]),
+                              enumerate(groups)))
+            groups_s = f"{time.perf_counter() - start:.2f}"
+
+        print(f"{count:>7} {target:>9} {len(groups):>7} {group_tokens:>14} {single_stats['tokens']:>11} {single_s:>9} {groups_s:>9}")
+    print()
+
+
+def bench_draft_plan(live=False):
+    """Local TF-IDF draft planner latency against asset count (and, with --live, the Gemini plan)"""
+    print("⚡ Fast draft planning (local) vs Gemini planning")
+    print(f"{'assets':>7} {'segments':>9} {'draft ms':>9} {'gemini s':>9}")
+
+    genai_client = None
+    if live:
+        from google import genai
+        genai_client = genai.Client(api_key=os.environ["GOOGLE_API_KEY"])
+
+    for count in [5, 25, 100, 200]:
+        assets = make_synthetic_assets(count)
+        start = time.perf_counter()
+        plan = app.create_local_content_plan(assets, "Pour-over coffee tutorial: water temperature, ratio and bloom", 120)
+        draft_ms = (time.perf_counter() - start) * 1000
+
+        latency = "-"
+        if genai_client:
+            start = time.perf_counter()
+            prompt, _ = app.build_content_plan_prompt(assets, "Pour-over coffee tutorial: water temperature, ratio and bloom", 120)
+            genai_client.models.generate_content(model="gemini-2.5-flash", contents=prompt)
+            latency = f"{time.perf_counter() - start:.2f}"
+
+        print(f"{count:>7} {len(plan['timeline_structure']):>9} {draft_ms:>9.1f} {latency:>9}")
+    print()
+
+
+def bench_allocate(live=False):
+    """Vectorized clip duration allocation time against clip count"""
+    import numpy as np
+    print("✂️ Clip duration allocation")
+    print(f"{'clips':>7} {'us/solve':>10}")
+    rng = np.random.default_rng(0)
+    for count in [3, 10, 50, 100, 200, 500, 1000]:
+        weights = rng.uniform(1, 30, count)
+        sources = rng.uniform(3, 120, count)
+        target = float(sources.sum() * 0.4)
+        runs = 2000
+        start = time.perf_counter()
+        for _ in range(runs):
+            app.allocate_clip_durations(weights, sources, target)
+        print(f"{count:>7} {(time.perf_counter() - start) / runs * 1e6:>10.1f}")
+    print()
+
+
+def bench_sequence(live=False):
+    """Timeline build (and, with --live, render) time against clip count"""
+    print("🎞️ Multi-clip sequencing")
+    print(f"{'clips':>7} {'ranges':>7} {'build ms':>9} {'render s':>9}")
+
+    conn = None
+    video_id = os.environ.get("EDENTIC_BENCH_VIDEO_ID")
+    if live and video_id:
+        conn = app.connect(api_key=os.environ["VIDEODB_API_KEY"])
+        source_duration = conn.get_collection().get_video(video_id).length
+
+    for count in [3, 10, 20, 50, 100, 200]:
+        if conn:
+            # Reuse one real source so the render measures stitching cost, not uploads
+            video_assets = [{'name': f"clip_{i:03d}.mp4", 'asset_id': video_id, 'duration': source_duration}
+                            for i in range(count)]
+        else:
+            video_assets = [a for a in make_synthetic_assets(count * 2) if a['media_type'] == 'video'][:count]
+        # Plan uses every other clip twice in a row, which the merge pass should collapse
+        structure = []
+        for i, asset in enumerate(video_assets):
+            structure.append({'sequence': len(structure) + 1, 'asset_name': asset['name'], 'importance': 2, 'recommended_duration': 6})
+            if i % 2 == 0:
+                structure.append({'sequence': len(structure) + 1, 'asset_name': asset['name'], 'importance': 1, 'recommended_duration': 4})
+
+        start = time.perf_counter()
+        clip_plan = app.plan_clip_ranges(video_assets, structure, 300)
+        timeline = app.Timeline(conn)
+        app.add_ranges_to_timeline(timeline, clip_plan['ranges'])
+        build_ms = (time.perf_counter() - start) * 1000
+
+        render_s = "-"
+        if conn:
+            start = time.perf_counter()
+            timeline.generate_stream()
+            render_s = f"{time.perf_counter() - start:.2f}"
+
+        print(f"{count:>7} {len(clip_plan['ranges']):>7} {build_ms:>9.2f} {render_s:>9}")
+    print()
+
+
+def bench_images(live=False):
+    """Upload bytes and preprocessing wall time for a 100-image slideshow project"""
+    import shutil
+    import tempfile
+    import numpy as np
+    print("🖼️ Image preprocessing (100-image slideshow)")
+
+    workdir = tempfile.mkdtemp(prefix="edentic_bench_images_")
+    try:
+        rng = np.random.default_rng(0)
+        paths = []
+        for i in range(100):
+            # Alternate phone-sized photos and large PNG screenshots
+            if i % 2:
+                size, suffix = (5472, 3648), "jpg"
+            else:
+                size, suffix = (2880, 1800), "png"
+            gradient = np.linspace(0, 255, size[0], dtype=np.uint8)[None, :, None]
+            noise = rng.integers(0, 24, (size[1], size[0], 3), dtype=np.uint8)
+            path = os.path.join(workdir, f"slide_{i:03d}.{suffix}")
+            app.Image.fromarray(np.broadcast_to(gradient, noise.shape) + noise).save(path, quality=95)
+            paths.append(path)
+
+        print(f"{'mode':>8} {'MB before':>10} {'MB after':>9} {'wall s':>7}")
+        for mode in ("serial", "pool"):
+            start = time.perf_counter()
+            if mode == "serial":
+                results = {path: app._preprocess_image_safe(path) for path in paths}
+            else:
+                results = app.preprocess_images_for_upload(paths)
+            wall = time.perf_counter() - start
+            before = sum(r[1] for r in results.values())
+            after = sum(r[2] for r in results.values())
+            print(f"{mode:>8} {before / 1e6:>10.1f} {after / 1e6:>9.1f} {wall:>7.2f}")
+            for upload_path, _, _ in results.values():
+                if upload_path not in paths:
+                    os.unlink(upload_path)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    print()
+
+
+def bench_audio(live=False):
+    """Speech-span analysis time for an hour of voiceover audio"""
+    import numpy as np
+    print("🎤 Voiceover silence analysis (1 hour of audio)")
+    print(f"{'rate Hz':>8} {'spans':>7} {'analysis s':>11}")
+    rng = np.random.default_rng(0)
+    for sample_rate in [16000, 24000, 48000]:
+        # 10s pattern: 1.5s lead-in, two phrases with a short pause, trailing silence
+        pattern = rng.normal(0, 1e-4, sample_rate * 10).astype(np.float32)
+        for start, end in [(1.5, 4.0), (4.2, 7.0)]:
+            pattern[int(start * sample_rate):int(end * sample_rate)] += rng.normal(0, 0.2, int((end - start) * sample_rate)).astype(np.float32)
+        samples = np.tile(pattern, 360)
+
+        start = time.perf_counter()
+        analysis = app.analyze_voiceover(samples, sample_rate)
+        print(f"{sample_rate:>8} {len(analysis['spans']):>7} {time.perf_counter() - start:>11.3f}")
+    print()
+
+
+def bench_reopen(live=False):
+    """Remote indexing calls and wall time when re-opening a 30-clip project"""
+    import tempfile
+    print("♻️ Re-opening an indexed project (30 clips, 50 ms simulated per remote index call)")
+    print(f"{'session':>8} {'index calls':>12} {'wall s':>7}")
+
+    class FakeVideo:
+        def __init__(self, video_id):
+            self.id, self.length, self.transcript = video_id, 30.0, None
+
+        def index_spoken_words(self):
+            calls.append('spoken')
+            time.sleep(0.05)
+
+        def index_scenes(self, prompt=None):
+            calls.append('scenes')
+            time.sleep(0.05)
+            return f"scene_{self.id}"
+
+        def get_scene_index(self, scene_index_id):
+            calls.append('get_scene_index')
+            time.sleep(0.05)
+            return [{'start': 0.0, 'end': 30.0, 'description': "A person talks to the camera"}]
+
+        def get_transcript_text(self):
+            self.transcript = [{'start': 0.0, 'end': 0.4, 'text': 'Hello.'}]
+            return "Hello."
+
+    class FakeCollection:
+        id = "bench_collection"
+
+        def __init__(self):
+            self.videos = {}
+
+        def upload(self, file_path=None, **kwargs):
+            video = FakeVideo(f"video_{len(self.videos)}")
+            self.videos[video.id] = video
+            return video
+
+        def get_video(self, video_id):
+            return self.videos[video_id]
+
+    class FakeUpload:
+        def __init__(self, name, data):
+            self.name, self.data = name, data
+
+        def getvalue(self):
+            return self.data
+
+    app.METADATA_DB_PATH = os.path.join(tempfile.mkdtemp(prefix="edentic_bench_meta_"), "metadata.db")
+    uploads = [FakeUpload(f"clip_{i:02d}.mp4", os.urandom(64 * 1024)) for i in range(30)]
+    collection = FakeCollection()
+    for session in ("first", "reopen"):
+        calls = []
+        start = time.perf_counter()
+        app.upload_and_analyze_mixed_media(collection, uploads, {}, "Bench project")
+        print(f"{session:>8} {len(calls):>12} {time.perf_counter() - start:>7.2f}")
+    print()
+
+
+def bench_scheduler(live=False):
+    """p50/p95 job latency for light and heavy sessions sharing one process, FIFO vs fair share"""
+    import threading
+    import contextvars
+    import numpy as np
+    print("⚖️ Slot scheduling under mixed load (4 heavy + 12 light sessions, times scaled to ms)")
+    print(f"{'mode':>6} {'light p50':>10} {'light p95':>10} {'heavy p50':>10} {'heavy p95':>10}")
+
+    app.SCHEDULER_SLOTS = {'upload': 4, 'generate': 6, 'render': 2}
+    app.SCHEDULER_EXPECTED_SECONDS = {'upload': 0.02, 'generate': 0.01, 'render': 0.03}
+
+    def remote_call(kind, seconds):
+        with app.scheduler_slot(kind):
+            time.sleep(seconds)
+
+    def heavy_job():
+        # 50 clips uploaded by 4 parallel workers, then 5 renders
+        def worker(count):
+            for _ in range(count):
+                remote_call('upload', 0.02)
+        threads = [threading.Thread(target=contextvars.copy_context().run, args=(worker, 13 if i < 2 else 12)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for _ in range(5):
+            remote_call('render', 0.03)
+
+    def light_job():
+        for _ in range(3):
+            remote_call('upload', 0.02)
+        remote_call('render', 0.03)
+
+    for mode in ("fifo", "fair"):
+        latencies = {'light': [], 'heavy': []}
+        lock = threading.Lock()
+
+        def session(index, kind, delay):
+            time.sleep(delay)
+            tenant = "shared" if mode == "fifo" else f"session_{index}"
+            weight = 1.0 if mode == "fifo" else app.job_weight(50 if kind == 'heavy' else 4, 300 if kind == 'heavy' else 45)
+            start = time.perf_counter()
+            with app.tenant_scope(tenant, weight):
+                heavy_job() if kind == 'heavy' else light_job()
+            with lock:
+                latencies[kind].append(time.perf_counter() - start)
+
+        plan = [('heavy', 0.0)] * 4 + [('light', 0.05 + 0.04 * i) for i in range(12)]
+        threads = [threading.Thread(target=session, args=(i, kind, delay)) for i, (kind, delay) in enumerate(plan)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        light, heavy = np.array(latencies['light']) * 1000, np.array(latencies['heavy']) * 1000
+        print(f"{mode:>6} {np.percentile(light, 50):>8.0f}ms {np.percentile(light, 95):>8.0f}ms "
+              f"{np.percentile(heavy, 50):>8.0f}ms {np.percentile(heavy, 95):>8.0f}ms")
+    print()
+
+
+def bench_shots(live=False):
+    """Shot detection speed as a multiple of real time: analysis alone, then decode + analysis per clip and across clips"""
+    import shutil
+    import subprocess
+    import tempfile
+    import numpy as np
+    print("🎞️ Shot detection (64x36 greyscale samples at 4/s)")
+    rng = np.random.default_rng(3)
+    seconds = 600
+    levels = np.repeat(rng.integers(0, 256, seconds // 5), int(5 * app.SHOT_SAMPLE_FPS))
+    frames = np.clip(levels[:, None, None] + rng.integers(-20, 20, (len(levels), 36, 64)), 0, 255).astype(np.uint8)
+    start = time.perf_counter()
+    shots = app.detect_shots(frames)
+    elapsed = time.perf_counter() - start
+    print(f"  analysis only: {seconds}s of video in {elapsed * 1000:.0f}ms ({seconds / elapsed:,.0f}x real time), "
+          f"{len(shots['boundaries']) + 1} shots")
+
+    ffmpeg = shutil.which('ffmpeg')
+    if not ffmpeg:
+        print("  ffmpeg not found: skipping decode timings")
+        print()
+        return
+    workdir = tempfile.mkdtemp(prefix="edentic_bench_shots_")
+    try:
+        clip_seconds = 60
+        path = os.path.join(workdir, "clip_0.mp4")
+        subprocess.run([ffmpeg, '-v', 'error', '-f', 'lavfi', '-i', f"testsrc2=size=1280x720:rate=30:duration={clip_seconds}",
+                        '-c:v', 'libx264', '-preset', 'veryfast', '-pix_fmt', 'yuv420p', path], check=True)
+        paths = [path] + [shutil.copy(path, os.path.join(workdir, f"clip_{i}.mp4")) for i in range(1, 4)]
+
+        start = time.perf_counter()
+        app.detect_video_shots(path)
+        elapsed = time.perf_counter() - start
+        print(f"  720p30 decode + analysis, one clip on one core: {clip_seconds / elapsed:.1f}x real time")
+
+        start = time.perf_counter()
+        futures = app.start_shot_detection(paths, workers=len(paths))
+        for future in futures.values():
+            future.result()
+        elapsed = time.perf_counter() - start
+        print(f"  {len(paths)} clips in parallel: {len(paths) * clip_seconds / elapsed:.1f}x real time")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    print()
+
+
+def bench_storyboard(live=False):
+    """First and repeat storyboard build time against clip count; keyframes cost one generate_thumbnail round trip each"""
+    import tempfile
+    from PIL import Image
+    latency = 0.3
+    print(f"🖼️ Storyboard build (first view fetches keyframes, {latency * 1000:.0f} ms simulated per generate_thumbnail)")
+    print(f"{'clips':>7} {'tiles':>6} {'first ms':>9} {'fetch ms':>9} {'repeat ms':>10}")
+
+    frame_path = os.path.join(tempfile.mkdtemp(prefix="edentic_bench_frames_"), "frame.jpg")
+    Image.new('RGB', (640, 360), (40, 90, 160)).save(frame_path, format='JPEG')
+
+    pause = time.sleep  # generate_thumbnail's keyword argument shadows the time module
+
+    class FakeVideo:
+        def generate_thumbnail(self, time=0):
+            pause(latency)
+            return "file://" + frame_path
+
+    live_video = None
+    video_id = os.environ.get("EDENTIC_BENCH_VIDEO_ID")
+    if live and video_id:
+        live_video = app.connect(api_key=os.environ["VIDEODB_API_KEY"]).get_collection().get_video(video_id)
+
+    for count in [4, 12, 30]:
+        assets = [a for a in make_synthetic_assets(count * 2, seed=count) if a['media_type'] == 'video'][:count]
+        for i, asset in enumerate(assets):
+            asset['asset_id'] = f"storyboard_{count}_{i}"
+            asset['video_obj'] = live_video or FakeVideo()
+        plan = {'timeline_structure': [{'asset_name': a['name']} for a in assets], 'content_to_generate': []}
+        first = app.build_storyboard(plan, assets, {}, 60)
+        repeat = app.build_storyboard(plan, assets, {}, 60)
+        print(f"{count:>7} {first['tiles']:>6} {first['build_ms']:>9.0f} {first['fetch_ms']:>9.0f} {repeat['build_ms']:>10.0f}")
+    print()
+
+
+def bench_preview(live=False):
+    """Time to first frame: full render only vs progressive preview + full render"""
+    print("⚡ Time to first playable video (simulated render: 50ms + 4ms per timeline second)")
+    print(f"{'timeline s':>10} {'full ttff':>10} {'prog ttff':>10} {'prog full':>10}")
+
+    class SimulatedTimeline:
+        def __init__(self, seconds):
+            self.seconds = seconds
+
+        def generate_stream(self):
+            time.sleep(0.05 + 0.004 * self.seconds)
+            return f"https://stream.example/{self.seconds:.0f}.m3u8"
+
+    conn = None
+    video_id = os.environ.get("EDENTIC_BENCH_VIDEO_ID")
+    if live and video_id:
+        conn = app.connect(api_key=os.environ["VIDEODB_API_KEY"])
+        source_duration = conn.get_collection().get_video(video_id).length
+
+    def build(seconds):
+        if not conn:
+            return SimulatedTimeline(seconds), SimulatedTimeline(min(seconds, app.PROGRESSIVE_PREVIEW_SECONDS))
+        # Cycle through one real source in 10s cuts so the cut count grows with length
+        ranges = [{'asset_id': video_id, 'start': (i * 10) % max(source_duration - 10, 1), 'end': 0} for i in range(int(seconds // 10))]
+        for clip_range in ranges:
+            clip_range['end'] = min(clip_range['start'] + 10, source_duration)
+        timeline = app.Timeline(conn)
+        app.add_ranges_to_timeline(timeline, ranges)
+        preview, _ = app.build_preview_timeline(conn, ranges)
+        return timeline, preview
+
+    for seconds in [60, 120, 300]:
+        timeline, _ = build(seconds)
+        start = time.perf_counter()
+        timeline.generate_stream()
+        full_ttff = time.perf_counter() - start
+
+        timeline, preview = build(seconds)
+        first_frame = []
+        start = time.perf_counter()
+        app.render_progressive(timeline, seconds, preview, app.PROGRESSIVE_PREVIEW_SECONDS,
+                               lambda url: first_frame.append(time.perf_counter() - start))
+        progressive_full = time.perf_counter() - start
+        prog_ttff = first_frame[0] if first_frame else progressive_full
+        print(f"{seconds:>10} {full_ttff:>9.2f}s {prog_ttff:>9.2f}s {progressive_full:>9.2f}s")
+    print()
+
+
+def bench_export(live=False):
+    """HLS export throughput against a local server: one connection vs concurrent pooled downloads"""
+    import shutil
+    import tempfile
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    print("💾 HLS export (local server, 60 x 512 KB segments, 25ms time-to-first-byte per request)")
+    print(f"{'workers':>8} {'seconds':>8} {'MB/s':>8}")
+
+    segment = os.urandom(512 * 1024)
+    playlist = ("#EXTM3U\n#EXT-X-TARGETDURATION:4\n" + "".join(f"#EXTINF:4.0,\nseg{i}.ts\n" for i in range(60))
+                + "#EXT-X-ENDLIST\n").encode()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            time.sleep(0.025)
+            body = playlist if self.path.endswith('.m3u8') else segment
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = os.environ.get("EDENTIC_BENCH_STREAM_URL") if live else None
+    url = url or f"http://127.0.0.1:{server.server_address[1]}/stream.m3u8"
+    workdir = tempfile.mkdtemp(prefix="edentic_bench_export_")
+    try:
+        for workers in [1, 2, 4, 8]:
+            result = app.export_render(url, name=f"export_{workers}", export_dir=workdir, workers=workers)
+            print(f"{workers:>8} {result['seconds']:>8.2f} {result['mb_per_s']:>8.1f}")
+    finally:
+        server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+    print()
+
+
+def _shared_cache_worker(args):
+    """One process of the contention benchmark: 80% reads, 20% writes over a shared key space"""
+    path, max_bytes, seed, ops, keys = args
+    app.SHARED_CACHE_PATH = path
+    app.SHARED_CACHE_MAX_BYTES = max_bytes
+    rng = random.Random(seed)
+    latencies, hits, errors = [], 0, 0
+    for _ in range(ops):
+        key = f"plan_{rng.randrange(keys)}"
+        start = time.perf_counter()
+        if rng.random() < 0.2:
+            text = "".join(rng.choices("abcdefghijklmnopqrstuvwxyz ", k=rng.randint(1000, 6000)))
+            errors += not app.shared_cache_put('bench', key, {'key': key, 'script': text})
+        else:
+            value = app.shared_cache_get('bench', key)
+            if value is not None:
+                hits += 1
+                errors += value['key'] != key
+        latencies.append(time.perf_counter() - start)
+    return latencies, hits, errors
+
+
+def bench_shared_cache(live=False):
+    """Shared cache throughput and latency with 1-8 processes reading and writing at once"""
+    import shutil
+    import tempfile
+    import multiprocessing
+    import numpy as np
+    print("🗄️ Shared cache contention (80% get / 20% put, 2000 keys, 4 MB bound, LRU eviction active)")
+    print(f"{'procs':>6} {'ops/s':>8} {'p50 ms':>7} {'p99 ms':>7} {'hit rate':>9} {'errors':>7}")
+
+    workdir = tempfile.mkdtemp(prefix="edentic_bench_cache_")
+    try:
+        for processes in [1, 2, 4, 8]:
+            path = os.path.join(workdir, f"cache_{processes}.db")
+            ops = 1500
+            start = time.perf_counter()
+            with multiprocessing.Pool(processes) as pool:
+                results = pool.map(_shared_cache_worker, [(path, 4 * 1024 * 1024, seed, ops, 2000) for seed in range(processes)])
+            elapsed = time.perf_counter() - start
+            latencies = np.concatenate([np.array(r[0]) for r in results]) * 1000
+            reads = int(sum(len(r[0]) for r in results) * 0.8)
+            hits = sum(r[1] for r in results)
+            errors = sum(r[2] for r in results)
+            print(f"{processes:>6} {processes * ops / elapsed:>8.0f} {np.percentile(latencies, 50):>7.2f} "
+                  f"{np.percentile(latencies, 99):>7.2f} {hits / max(reads, 1):>8.0%} {errors:>7}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    print()
+
+
+def bench_memory(live=False):
+    """Per-session memory of media asset lists: plain dicts vs compact records vs records backed by the metadata store"""
+    import shutil
+    import tempfile
+    import tracemalloc
+    print("🧠 Per-session asset memory (40 assets, speech-like transcripts of 80-900 words with word timings)")
+    print(f"{'representation':>15} {'KB/session':>11}")
+
+    class FakeVideo:
+        """Stands in for the SDK handle once the upload path has cleared its transcript copies (every mode)"""
+        def __init__(self, asset_id):
+            self.id = asset_id
+            self.transcript = self.transcript_text = None
+
+    workdir = tempfile.mkdtemp(prefix="edentic_bench_memory_")
+    app.METADATA_DB_PATH = os.path.join(workdir, "metadata.db")
+    app._metadata_schema_ready = False
+    projects = []
+    for session in range(20):
+        assets = []
+        for source in make_synthetic_assets(40, seed=session):
+            source = dict(source, asset_id=f"{session}-{source['asset_id']}")
+            words = [{'start': i * 0.4, 'end': i * 0.4 + 0.3, 'text': w} for i, w in enumerate(source['transcript'].split())]
+            if source['media_type'] == 'video':
+                app.save_asset_metadata(source['asset_id'], transcript={'text': source['transcript'], 'words': words})
+            assets.append((source, words))
+        projects.append(assets)
+
+    def build_session(project, mode):
+        assets = []
+        for source, words in project:
+            handle = FakeVideo(source['asset_id'])
+            fields = {k: v for k, v in source.items() if k != 'transcript'}
+            is_video = source['media_type'] == 'video'
+            if mode == 'stored' and is_video:
+                assets.append(app.MediaAssetRecord(asset=handle, transcript=app._RECORD_STORED,
+                                                   transcript_index=app._RECORD_STORED, **fields))
+                continue
+            # Each session holds its own transcript text and index, as the SDK returned and the app built them
+            transcript = " ".join(w['text'] for w in words)
+            index = app.build_transcript_index(words) if is_video else None
+            if mode == 'record':
+                assets.append(app.MediaAssetRecord(asset=handle, transcript=transcript, transcript_index=index, **fields))
+            else:
+                assets.append(dict(fields, asset=handle, video_obj=handle if is_video else None,
+                                   transcript=transcript, transcript_index=index))
+        # The assembly step keeps several views of the same assets alive
+        return {'media_assets': assets, 'all_assets': list(assets), 'asset_lookup': {a['name']: a for a in assets}}
+
+    try:
+        for label, mode in (("dict", 'dict'), ("record", 'record'), ("record+store", 'stored')):
+            sessions = []
+            tracemalloc.start()
+            for project in projects:
+                sessions.append(build_session(project, mode))
+            current, _ = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"{label:>15} {current / len(sessions) / 1024:>11.1f}")
+
+        # Stored transcripts are decoded into one LRU shared by all sessions; this is its cost when full
+        tracemalloc.start()
+        for source, _ in [item for project in projects for item in project if item[0]['media_type'] == 'video']:
+            app.load_stored_transcript(source['asset_id'])
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"shared transcript LRU ({app.TRANSCRIPT_CACHE_ENTRIES} entries, all sessions): {current / 1024:.1f} KB")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    print()
+
+
+def _first_job_worker(args):
+    """One fresh process: optionally prewarm while the user reads the landing page, then time the first job's fixed costs"""
+    prewarm, think_seconds, keys = args
+    pool = app._prewarm_pool()
+    if prewarm:
+        if keys:
+            app.start_prewarm(*keys)
+        else:
+            pool['local_ready'] = pool['executor'].submit(app.prewarm_local)
+        time.sleep(think_seconds)
+
+    start = time.perf_counter()
+    app.prewarm_local()
+    if keys:
+        clients = app.take_prewarmed_clients(*keys) if prewarm else None
+        conn, collection, genai_client = clients or app.build_clients(*keys)
+        # The first remote calls of a job: list the collection, size the planning prompt
+        collection.get_videos()
+        genai_client.models.count_tokens(model=app.PREWARM_MODEL, contents="Plan a short tutorial video.")
+    return time.perf_counter() - start
+
+
+def bench_prewarm(live=False):
+    """First-job latency in a fresh server process, with and without background prewarming"""
+    import shutil
+    import statistics
+    import tempfile
+    import multiprocessing
+    keys = (os.environ.get("VIDEODB_API_KEY"), os.environ.get("GOOGLE_API_KEY")) if live else None
+    keys = keys if keys and all(keys) else None
+    scope = "clients, collection and local stores" if keys else "local stores only; pass --live for the API clients"
+    print(f"🔥 First-job latency after startup ({scope}, 3 s on the landing page, median of 3 fresh processes)")
+    print(f"{'startup':>10} {'first job ms':>13}")
+
+    workdir = tempfile.mkdtemp(prefix="edentic_bench_prewarm_")
+    saved_env = {name: os.environ.get(name) for name in ("EDENTIC_DATA_DIR", "EDENTIC_SCRATCH_DIR")}
+    # Fresh processes re-import the app, so they pick up the throwaway data and scratch directories
+    os.environ["EDENTIC_DATA_DIR"] = os.path.join(workdir, "data")
+    os.environ["EDENTIC_SCRATCH_DIR"] = os.path.join(workdir, "scratch")
+    context = multiprocessing.get_context("spawn")
+    try:
+        for label, prewarm in (("cold", False), ("prewarmed", True)):
+            timings = []
+            for run in range(3):
+                shutil.rmtree(os.path.join(workdir, "data"), ignore_errors=True)
+                with context.Pool(1) as pool:
+                    timings.append(pool.apply(_first_job_worker, ((prewarm, 3.0, keys),)))
+            print(f"{label:>10} {statistics.median(timings) * 1000:>13.1f}")
+    finally:
+        for name, value in saved_env.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        shutil.rmtree(workdir, ignore_errors=True)
+    print()
+
+
+BENCHMARKS = {
+    'prompt': bench_prompt,
+    'plan': bench_hierarchical_plan,
+    'draft': bench_draft_plan,
+    'allocate': bench_allocate,
+    'sequence': bench_sequence,
+    'images': bench_images,
+    'audio': bench_audio,
+    'reopen': bench_reopen,
+    'scheduler': bench_scheduler,
+    'shots': bench_shots,
+    'storyboard': bench_storyboard,
+    'preview': bench_preview,
+    'export': bench_export,
+    'cache': bench_shared_cache,
+    'memory': bench_memory,
+    'prewarm': bench_prewarm,
+}
+
+
+if __name__ == "__main__":
+    live = "--live" in sys.argv
+    selected = [arg for arg in sys.argv[1:] if not arg.startswith("--")] or list(BENCHMARKS)
+    for name in selected:
+        BENCHMARKS[name](live=live)
@@ -0,0 +1,58 @@
+"""
+Image preprocessing worker for Edentic uploads.
+
+Kept apart from app.py so worker processes started with the 'spawn' method import
+only PIL, not Streamlit and the whole app.
+"""
+
+import os
+
+from PIL import Image, ImageOps
+
+# Images are shown at video resolution, so larger uploads only cost upload time
+OUTPUT_RESOLUTION = (1920, 1080)
+IMAGE_REENCODE_QUALITY = 90
+
+
+def preprocess_image_for_upload(path, max_size=OUTPUT_RESOLUTION):
+    """Downscale an image to the output resolution, drop its metadata and re-encode it.
+
+    Returns (path_to_upload, bytes_before, bytes_after). The original path is kept for
+    animated images and whenever re-encoding would not make the file smaller.
+    """
+    bytes_before = os.path.getsize(path)
+    with Image.open(path) as image:
+        if getattr(image, 'is_animated', False):
+            return path, bytes_before, bytes_before
+
+        # Bake the EXIF orientation into the pixels before the metadata is dropped
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail(max_size, Image.LANCZOS)
+
+        has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+        stem = os.path.splitext(path)[0]
+        if has_alpha:
+            prepared = image.convert('RGBA')
+            prepared.info = {}
+            out_path = f"{stem}_prepared.png"
+            prepared.save(out_path, format='PNG', optimize=True)
+        else:
+            prepared = image.convert('RGB')
+            prepared.info = {}
+            out_path = f"{stem}_prepared.jpg"
+            prepared.save(out_path, format='JPEG', quality=IMAGE_REENCODE_QUALITY, optimize=True, progressive=True)
+
+    bytes_after = os.path.getsize(out_path)
+    if bytes_after >= bytes_before:
+        os.unlink(out_path)
+        return path, bytes_before, bytes_before
+    return out_path, bytes_before, bytes_after
+
+
+def preprocess_image_safe(path):
+    """Worker entry point: never fail the upload because an image could not be re-encoded"""
+    try:
+        return preprocess_image_for_upload(path)
+    except Exception:
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        return path, size, size
@@ -26,6 +26,11 @@ def test_app_structure():
             'create_comprehensive_content_plan', 
             'generate_missing_content',
             'assemble_multimedia_video',
+            'run_multimedia_job',
+            'render_planned_job',
+            'build_storyboard',
+            'trace_span',
+            'export_trace',
             'main'
         ]
         
@@ -71,6 +76,880 @@ def test_app_structure():
         print(f"❌ Error testing app structure: {e}")
         return False
 
+def load_app_module():
+    """Import app.py for behavioural tests, skipping when the runtime stack is not installed"""
+    import pytest
+    for module in ['streamlit', 'videodb', 'google.genai', 'PIL', 'numpy']:
+        pytest.importorskip(module)
+    import app
+    return app
+
+
+def test_allocate_clip_durations_properties():
+    """Property test: allocations respect per-clip bounds, stay inside the source and hit the target"""
+    import numpy as np
+    app = load_app_module()
+    rng = np.random.default_rng(2024)
+    
+    for _ in range(2000):
+        n = int(rng.integers(0, 200))
+        weights = rng.uniform(0, 10, n)
+        weights[rng.random(n) < 0.1] = 0
+        sources = rng.uniform(-1, 300, n)
+        target = float(rng.uniform(0, 3000))
+        preferred = rng.uniform(-10, 320, n)
+        preferred[rng.random(n) < 0.5] = np.nan
+        
+        result = app.allocate_clip_durations(weights, sources, target, preferred_starts=preferred)
+        durations, starts, ends = result['durations'], result['starts'], result['ends']
+        
+        source = np.where(sources > 0, sources, app.CLIP_DEFAULT_SOURCE_SECONDS)
+        hi = np.minimum(app.CLIP_MAX_SECONDS, source * app.CLIP_USABLE_FRACTION)
+        lo = np.minimum(app.CLIP_MIN_SECONDS, hi)
+        assert np.all(durations >= lo - 1e-9) and np.all(durations <= hi + 1e-9)
+        assert np.all(starts >= 0) and np.all(ends <= source + 1e-9)
+        assert np.allclose(ends - starts, durations)
+        
+        reachable = lo.sum() < target < hi[weights > 0].sum() + lo[weights == 0].sum()
+        if reachable:
+            assert abs(durations.sum() - target) < 1e-6
+        
+        # Heavier weights never get shorter clips, unless a bound is in the way
+        free = (durations > lo + 1e-9) & (durations < hi - 1e-9)
+        if free.sum() > 1:
+            ratio = durations[free] / weights[free]
+            assert np.allclose(ratio, ratio[0])
+    
+    # Deterministic: the same inputs always produce the same cut points
+    first = app.allocate_clip_durations([3, 1, 1], [30, 30, 30], 30)
+    second = app.allocate_clip_durations([3, 1, 1], [30, 30, 30], 30)
+    assert np.array_equal(first['starts'], second['starts'])
+    assert np.allclose(first['durations'], [18, 6, 6])
+
+
+def test_voiceover_speech_spans_from_wav():
+    """Leading/trailing silence is trimmed and short pauses stay inside one span"""
+    import io
+    import wave
+    import numpy as np
+    app = load_app_module()
+    rng = np.random.default_rng(0)
+    sample_rate = 16000
+
+    samples = rng.normal(0, 1e-4, sample_rate * 10)
+    for start, end in [(1.5, 4.0), (4.2, 7.0)]:
+        samples[int(start * sample_rate):int(end * sample_rate)] += rng.normal(0, 0.2, int((end - start) * sample_rate))
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(2)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes((np.repeat(np.clip(samples, -1, 1), 2) * 32767).astype('<i2').tobytes())
+
+    decoded, rate = app.decode_audio_pcm(buffer.getvalue())
+    analysis = app.analyze_voiceover(decoded, rate)
+    assert rate == sample_rate and abs(analysis['duration'] - 10) < 1e-6
+    assert len(analysis['spans']) == 1
+    assert np.allclose(analysis['spans'][0], [1.5, 7.0], atol=app.SPEECH_BLOCK_SECONDS)
+    assert abs(analysis['trim_start'] - (1.5 - app.SPEECH_TRIM_PADDING_SECONDS)) <= app.SPEECH_BLOCK_SECONDS
+
+
+def test_transcript_index_snaps_to_sentences():
+    """Cut points move to the nearest sentence start/end and range queries return whole words"""
+    app = load_app_module()
+    words = "Grind the beans. Heat the water! - Pour slowly in circles.".split()
+    segments = [{'start': i * 0.5, 'end': i * 0.5 + 0.4, 'text': w} for i, w in enumerate(words)]
+    index = app.build_transcript_index(segments)
+
+    assert list(index['sentence_starts']) == [0.0, 1.5, 3.5]
+    assert app.transcript_words_between(index, 1.5, 2.5) == ['Heat', 'the']
+    assert app.snap_cut_points(index, 1.2, 2.5) == (1.5, 2.9)
+    # Nothing within reach: the cut is left alone
+    assert app.snap_cut_points(index, 10.0, 20.0) == (10.0, 20.0)
+
+
+def test_shared_source_segments_keep_their_allocation_after_snapping():
+    """Five segments of one 10s clip all fit after snapping, in order, close to the allocated total"""
+    app = load_app_module()
+    words = [{'start': i * 0.4, 'end': i * 0.4 + 0.3, 'text': 'word.' if i % 5 == 4 else 'word'} for i in range(25)]
+    asset = {'name': 'a.mp4', 'asset_id': 'a', 'media_type': 'video', 'duration': 10.0,
+             'transcript_index': app.build_transcript_index(words)}
+    segments = [{'asset_name': 'a.mp4', 'sequence': i, 'start_time': 0, 'end_time': 3} for i in range(5)]
+
+    plan = app.plan_clip_ranges([asset], segments, 9.0)
+    clips = plan['clips']
+    assert len(clips) == 5 and not plan['dropped'] and not plan['overrun']
+    assert all(clip['end'] - clip['start'] >= 1.8 - 1e-9 for clip in clips)
+    assert all(a['end'] <= b['start'] + 1e-9 for a, b in zip(clips, clips[1:])) and clips[-1]['end'] <= 10.0
+    assert abs(sum(clip['end'] - clip['start'] for clip in clips) - 9.0) <= 0.2
+
+
+def _start_flaky_upload_server(drop_rate, seed=0):
+    """Local stand-in for the chunk upload gateway that drops connections at random"""
+    import hashlib
+    import json
+    import random
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    rng = random.Random(seed)
+    state = {'chunks': {}, 'puts': 0, 'drop_rate': drop_rate}
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _maybe_drop(self):
+            if rng.random() < state['drop_rate']:
+                self.close_connection = True
+                self.connection.close()
+                return True
+            return False
+
+        def do_PUT(self):
+            body = self.rfile.read(int(self.headers['Content-Length']))
+            if self._maybe_drop():
+                return
+            _, content_hash, index = self.path.rsplit('/', 2)
+            state['chunks'][(content_hash, int(index))] = body
+            state['puts'] += 1
+            self.send_response(201)
+            self.send_header('X-Chunk-SHA256', hashlib.sha256(body).hexdigest())
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            if self._maybe_drop():
+                return
+            content_hash = self.path.rsplit('/', 2)[1]
+            data = b"".join(state['chunks'].get((content_hash, i), b"") for i in range(request['chunks']))
+            body = json.dumps({'url': f"http://stand-in/{content_hash}", 'sha256': hashlib.sha256(data).hexdigest()}).encode()
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state
+
+
+def test_resumable_upload_survives_dropped_connections(tmp_path, monkeypatch):
+    """Chunks are retried through random connection drops, resumed from the journal and hash-verified"""
+    import json
+    import os
+    import pytest
+    app = load_app_module()
+    monkeypatch.setattr(app, 'UPLOAD_JOURNAL_DIR', str(tmp_path / "journal"))
+    monkeypatch.setattr(app, 'UPLOAD_BACKOFF_SECONDS', 0)
+    path = tmp_path / "source.mp4"
+    path.write_bytes(os.urandom(40 * 4096 + 123))
+    content_hash = app.file_content_hash(str(path))
+
+    server, state = _start_flaky_upload_server(drop_rate=0.6)
+    endpoint = f"http://127.0.0.1:{server.server_address[1]}/uploads"
+    try:
+        # First attempt gives up early and leaves a partial journal behind
+        monkeypatch.setattr(app, 'UPLOAD_MAX_ATTEMPTS', 1)
+        with pytest.raises(ConnectionError):
+            app.resumable_upload(str(path), endpoint=endpoint, chunk_bytes=4096)
+        journal = json.loads((tmp_path / "journal" / f"{content_hash}.json").read_text())
+        assert len(journal['acked']) == state['puts'] < 41
+
+        # Retrying resumes: only the missing chunks are sent again
+        monkeypatch.setattr(app, 'UPLOAD_MAX_ATTEMPTS', 50)
+        state['drop_rate'] = 0.3
+        url = app.resumable_upload(str(path), endpoint=endpoint, chunk_bytes=4096)
+    finally:
+        server.shutdown()
+
+    # 41 chunks, each accepted exactly once across both attempts; the journal is cleared on success
+    assert url.endswith(content_hash)
+    assert state['puts'] == 41
+    assert not os.listdir(tmp_path / "journal")
+
+
+def test_scheduler_serves_light_tenant_before_heavy_backlog(monkeypatch):
+    """With one slot, a newly arriving tenant goes ahead of another tenant's queued backlog"""
+    import threading
+    import contextvars
+    import time
+    app = load_app_module()
+    monkeypatch.setitem(app.SCHEDULER_SLOTS, 'render', 1)
+    order = []
+    release = threading.Event()
+
+    def call(tenant, label, hold=None):
+        with app.tenant_scope(tenant, app.job_weight(50, 300) if tenant == 'heavy' else 1.0):
+            with app.scheduler_slot('render'):
+                order.append(label)
+                if hold:
+                    hold.wait(5)
+
+    threads = [threading.Thread(target=contextvars.copy_context().run, args=(call, 'heavy', 'heavy-0', release))]
+    threads[0].start()
+    while not order:
+        time.sleep(0.001)
+    for i in range(1, 4):
+        threads.append(threading.Thread(target=call, args=('heavy', f'heavy-{i}')))
+        threads[-1].start()
+    time.sleep(0.05)
+    threads.append(threading.Thread(target=call, args=('light', 'light')))
+    threads[-1].start()
+    time.sleep(0.05)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert order[:2] == ['heavy-0', 'light']
+    assert sorted(order) == ['heavy-0', 'heavy-1', 'heavy-2', 'heavy-3', 'light']
+
+
+def rerun_app_module(app):
+    """Execute app.py again into a fresh namespace, as Streamlit does on every rerun"""
+    import importlib.util
+    spec = importlib.util.spec_from_file_location('app', app.__file__)
+    rerun = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(rerun)
+    return rerun
+
+
+def test_scheduler_is_shared_across_script_reruns(monkeypatch):
+    """Each Streamlit rerun re-executes the module; sessions must still queue on one slot table"""
+    import threading
+    app = load_app_module()
+    monkeypatch.setitem(app.SCHEDULER_SLOTS, 'render', 1)
+    held, release = threading.Event(), threading.Event()
+
+    def hold_slot():
+        with app.tenant_scope('first'), app.scheduler_slot('render'):
+            held.set()
+            release.wait(5)
+
+    thread = threading.Thread(target=hold_slot)
+    thread.start()
+    held.wait(5)
+    try:
+        scheduler = app._scheduler()
+        rerun = rerun_app_module(app)
+        assert rerun._scheduler() is scheduler
+        assert rerun._scheduler()['state']['render']['in_use'] == 1
+        assert rerun._scheduler()['state']['render']['active'] == {'first': 1}
+    finally:
+        release.set()
+        thread.join(5)
+    assert app._scheduler()['state']['render']['in_use'] == 0
+
+
+def test_media_asset_record_reads_like_a_dict():
+    """Records answer the dict lookups the pipeline uses, keep the transcript compressed and refuse mutation"""
+    import pytest
+    app = load_app_module()
+    handle = object()
+    record = app.MediaAssetRecord(asset=handle, name="clip.mp4", asset_id="m-1", media_type='video',
+                                  transcript="pour the water slowly " * 50, duration=12.0)
+
+    assert record['video_obj'] is handle and record['asset'] is handle
+    assert record['transcript'].startswith("pour the water")
+    assert record.get('speech_end') is None and 'speech_end' not in record and 'duration' in record
+    assert isinstance(record._transcript, bytes) and len(record._transcript) < len(record['transcript'])
+    with pytest.raises(AttributeError):
+        record.duration = 3.0
+    assert record.replace(duration=3.0)['duration'] == 3.0 and record['duration'] == 12.0
+
+
+def test_media_asset_record_reads_stored_transcript_on_access(tmp_path, monkeypatch):
+    """A record backed by the metadata store holds no transcript itself and survives replace()"""
+    app = load_app_module()
+    monkeypatch.setattr(app, 'METADATA_DB_PATH', str(tmp_path / "metadata.db"))
+    monkeypatch.setattr(app, '_metadata_schema_ready', False)
+    words = [{'start': i * 0.5, 'end': i * 0.5 + 0.4, 'text': w} for i, w in enumerate("Grind the beans. Pour.".split())]
+    app.save_asset_metadata('m-2', transcript={'text': "Grind the beans. Pour.", 'words': words})
+    record = app.MediaAssetRecord(name="clip.mp4", asset_id='m-2', media_type='video',
+                                  transcript=app._RECORD_STORED, transcript_index=app._RECORD_STORED)
+
+    assert record._transcript is app._RECORD_STORED and record.transcript_index is app._RECORD_STORED
+    assert record['transcript'] == "Grind the beans. Pour."
+    assert list(record['transcript_index']['sentence_starts']) == [0.0, 1.5]
+    renamed = record.replace(description="beans")
+    assert renamed._transcript is app._RECORD_STORED and renamed['transcript'] == record['transcript']
+
+    app.save_asset_metadata('m-2', transcript={'text': "Rewritten.", 'words': words[:1]})
+    assert record['transcript'] == "Rewritten."  # Saving a transcript invalidates the shared copy
+
+
+def test_reopened_project_reads_scene_index_from_the_store(tmp_path, monkeypatch):
+    """Ingest records the scene index once; re-opening the same upload makes no remote indexing or scene calls"""
+    app = load_app_module()
+    monkeypatch.setattr(app, 'METADATA_DB_PATH', str(tmp_path / "metadata.db"))
+    monkeypatch.setattr(app, '_metadata_schema_ready', False)
+    monkeypatch.setattr(app, 'SCRATCH_ROOT', str(tmp_path / "scratch"))
+    monkeypatch.setattr(app.st, 'session_state', {})
+    calls = []
+    scenes = [{'start': 0.0, 'end': 30.0, 'description': "Beans poured into a grinder"}]
+
+    class Video:
+        def __init__(self, video_id):
+            self.id, self.length, self.transcript = video_id, 30.0, None
+
+        def index_spoken_words(self):
+            calls.append('index_spoken_words')
+
+        def index_scenes(self, prompt=None):
+            calls.append('index_scenes')
+            return "scenes-1"
+
+        def get_scene_index(self, scene_index_id):
+            calls.append('get_scene_index')
+            return scenes
+
+        def get_transcript_text(self):
+            self.transcript = [{'start': 0.0, 'end': 0.4, 'text': 'Grind.'}]
+            return "Grind."
+
+    class Collection:
+        id = "c-1"
+
+        def __init__(self):
+            self.videos = {}
+
+        def upload(self, file_path=None, **kwargs):
+            self.videos['v-1'] = Video('v-1')
+            return self.videos['v-1']
+
+        def get_video(self, video_id):
+            return self.videos[video_id]
+
+    class Upload:
+        name, data = "grind.mp4", b"x" * 4096
+
+        def getvalue(self):
+            return self.data
+
+    collection = Collection()
+    app.upload_and_analyze_mixed_media(collection, [Upload()], {}, "Coffee")
+    assert calls == ['index_spoken_words', 'index_scenes', 'get_scene_index']
+    calls.clear()
+    app.upload_and_analyze_mixed_media(collection, [Upload()], {}, "Coffee")
+    assert calls == [] and app.load_scene_index(collection.videos['v-1']) == scenes
+
+
+def test_memoized_stages_rerun_only_changed_inputs(tmp_path, monkeypatch):
+    """A stage reruns only when its input hash changes; failed (empty) and degraded outputs are retried"""
+    app = load_app_module()
+    monkeypatch.setattr(app.st, 'session_state', {})
+    monkeypatch.setattr(app, 'SHARED_CACHE_PATH', str(tmp_path / "shared_cache.db"))
+    calls = []
+
+    def plan(duration):
+        calls.append(duration)
+        return {'timeline_structure': [], 'duration': duration}
+
+    first, reused = app.memoized_stage('plan', app.stage_hash('assets', 60), lambda: plan(60))
+    assert not reused
+    again, reused = app.memoized_stage('plan', app.stage_hash('assets', 60), lambda: plan(60))
+    assert reused and again is first
+    changed, reused = app.memoized_stage('plan', app.stage_hash('assets', 90), lambda: plan(90))
+    assert not reused and changed['duration'] == 90 and calls == [60, 90]
+
+    for _ in range(2):
+        output, reused = app.memoized_stage('render', app.stage_hash('edit'), lambda: calls.append('render'))
+        assert output is None and not reused
+    assert calls.count('render') == 2
+
+    def unedited_render():
+        calls.append('fallback')
+        app.mark_degraded("unedited video")
+        return "https://stream/original.m3u8"
+
+    for _ in range(2):
+        output, reused = app.memoized_stage('render', app.stage_hash('edit', 2), unedited_render)
+        assert output == "https://stream/original.m3u8" and not reused
+    assert calls.count('fallback') == 2 and app.shared_cache_get('render', app.stage_hash('edit', 2)) is None
+
+
+def test_image_thumbnails_are_keyed_by_content():
+    """Two different images of the same byte length get their own thumbnails, served from the shared cache"""
+    from io import BytesIO
+    from PIL import Image
+    app = load_app_module()
+
+    def bmp(color):
+        buffer = BytesIO()
+        Image.new('RGB', (64, 36), color).save(buffer, format='BMP')
+        return buffer.getvalue()
+
+    red, blue = bmp((255, 0, 0)), bmp((0, 0, 255))
+    assert len(red) == len(blue)
+    red_thumb, blue_thumb = app.image_asset_thumbnail(red), app.image_asset_thumbnail(blue)
+    assert red_thumb != blue_thumb
+    assert Image.open(BytesIO(blue_thumb)).getpixel((10, 10))[2] > 200
+    assert app.image_asset_thumbnail(red) is red_thumb
+
+
+def test_title_images_generate_concurrently_and_reuse_the_disk_cache(tmp_path, monkeypatch):
+    """Title images are requested side by side, stored byte for byte when VideoDB accepts the format, and served from an LRU disk cache"""
+    import os
+    import threading
+    import time
+    from io import BytesIO
+    from types import SimpleNamespace
+    from PIL import Image
+    app = load_app_module()
+    monkeypatch.setattr(app, 'IMAGE_CACHE_DIR', str(tmp_path / "images"))
+    monkeypatch.setattr(app, 'IMAGE_CACHE_MAX_BYTES', 10 ** 9)
+
+    def encoded(color, fmt):
+        buffer = BytesIO()
+        Image.new('RGB', (32, 18), color).save(buffer, format=fmt)
+        return buffer.getvalue()
+
+    images = {"Opening title": ('image/png', encoded((255, 0, 0), 'PNG')),
+              "Chapter two": ('image/jpeg', encoded((0, 255, 0), 'JPEG')),
+              "Credits": ('image/bmp', encoded((0, 0, 255), 'BMP'))}
+    barrier = threading.Barrier(len(images), timeout=5)  # Only passes if every request is in flight at once
+    calls = []
+
+    def generate_content(model, contents, config):
+        calls.append((model, contents))
+        if len(calls) <= len(images):
+            barrier.wait()
+        mime_type, data = images[contents]
+        part = SimpleNamespace(inline_data=SimpleNamespace(mime_type=mime_type, data=data))
+        return SimpleNamespace(candidates=[SimpleNamespace(content=SimpleNamespace(parts=[part]))], text="")
+
+    client = SimpleNamespace(models=SimpleNamespace(generate_content=generate_content))
+    descriptions = list(images)
+    first = app.generate_title_images(client, descriptions)
+    assert [result['cached'] for result in first] == [False, False, False]
+    assert open(first[0]['file_path'], 'rb').read() == images["Opening title"][1]  # Passed through, not re-encoded
+    assert first[1]['file_path'].endswith(".jpg") and open(first[1]['file_path'], 'rb').read() == images["Chapter two"][1]
+    assert first[2]['file_path'].endswith(".png") and Image.open(first[2]['file_path']).format == 'PNG'
+
+    second = app.generate_title_images(client, descriptions)
+    assert len(calls) == 3 and [r['file_path'] for r in second] == [r['file_path'] for r in first]
+    assert all(result['cached'] for result in second)
+    assert app._image_cache_key("other-model", "Credits") != app._image_cache_key(app.TITLE_IMAGE_MODEL, "Credits")
+
+    # Over the size cap the least recently used image is evicted, never the one just written
+    for offset, result in enumerate(second):
+        os.utime(result['file_path'], (time.time() - 100 + offset, time.time() - 100 + offset))
+    monkeypatch.setattr(app, 'IMAGE_CACHE_MAX_BYTES', sum(os.path.getsize(r['file_path']) for r in second[1:]) + 1)
+    path = app._image_cache_store(app._image_cache_key(app.TITLE_IMAGE_MODEL, "Outro"), b"x", ".png")
+    assert os.path.exists(path) and not os.path.exists(second[0]['file_path'])
+    assert os.path.exists(second[1]['file_path']) and os.path.exists(second[2]['file_path'])
+
+
+def test_speculation_counters_survive_reruns(monkeypatch):
+    """The Accept click is itself a rerun, so the hit counters must outlive the module namespace"""
+    app = load_app_module()
+    monkeypatch.setattr(app, '_speculative_music_render', lambda cancelled, *args: ("https://example/music.m3u8", 2.0))
+    before = app.speculation_report()
+    speculation = app.start_music_speculation(None, {}, [], [], 30)
+    assert app.accept_music_speculation(speculation) == "https://example/music.m3u8"
+
+    after = rerun_app_module(app).speculation_report()
+    assert after['started'] == before['started'] + 1 and after['hits'] == before['hits'] + 1
+    assert after['seconds_saved'] > before['seconds_saved']
+
+
+def test_music_variant_keeps_the_preview_cuts_when_accepted_or_cancelled(monkeypatch):
+    """The speculative music render cuts the preview's ranges under the same voiceover; accept collects it, cancel discards it"""
+    import threading
+    import time
+    import videodb.timeline
+    app = load_app_module()
+
+    class StubTimeline:
+        def __init__(self, conn):
+            self.inline, self.overlays = [], []
+
+        def add_inline(self, asset):
+            self.inline.append(asset)
+
+        def add_overlay(self, start, asset):
+            self.overlays.append(asset)
+
+    gate = threading.Event()
+    rendered = []
+
+    def stub_render(timeline, variant, timeline_seconds, **attributes):
+        gate.wait(5)
+        rendered.append(timeline)
+        return f"https://example/{variant}-{len(rendered)}.m3u8"
+
+    monkeypatch.setattr(videodb.timeline, 'Timeline', StubTimeline)
+    monkeypatch.setattr(app, '_render_stream', stub_render)
+    media = [{'name': f"clip{i}.mp4", 'asset_id': f"v{i}", 'media_type': 'video', 'duration': 20.0} for i in range(3)]
+    generated = [
+        {'name': "voice.mp3", 'asset_id': "a1", 'media_type': 'audio', 'generation_type': 'voiceover',
+         'duration': 30.0, 'speech_start': 0.4, 'speech_end': 25.0},
+        {'name': "music.mp3", 'asset_id': "m1", 'media_type': 'audio', 'generation_type': 'background_music', 'duration': 60.0}
+    ]
+    plan = {'timeline_structure': [{'asset_name': "clip2.mp4", 'importance': 3}, {'asset_name': "clip0.mp4", 'importance': 1}]}
+    clip_plan = app.plan_clip_ranges(media, plan['timeline_structure'], app.adjusted_target_duration(media, 30))
+    preview_cuts = [(r['asset_id'], r['start'], r['end']) for r in clip_plan['ranges']]
+    before = app.speculation_report()
+
+    gate.set()
+    accepted = app.start_music_speculation(None, plan, media, generated, 30, clip_plan=clip_plan)
+    assert app.accept_music_speculation(accepted) == "https://example/music-1.m3u8"
+    timeline = rendered[-1]
+    assert [(a.asset_id, a.start, a.end) for a in timeline.inline] == preview_cuts
+    assert [a.asset_id for a in timeline.overlays] == ["a1", "m1"] and timeline.overlays[0].start == 0.4
+    # Planned afresh, the variant still lands on the same cuts
+    assert app.assemble_multimedia_video_with_music(None, plan, media, generated, 30) == "https://example/music-2.m3u8"
+    assert [(a.asset_id, a.start, a.end) for a in rendered[-1].inline] == preview_cuts
+
+    gate.clear()
+    declined = app.start_music_speculation(None, plan, media, generated, 30, clip_plan=clip_plan)
+    app.cancel_music_speculation(declined)
+    gate.set()
+    declined['future'].result(timeout=5)
+    deadline = time.time() + 5
+    while app.speculation_report()['cancelled'] == before['cancelled'] and time.time() < deadline:
+        time.sleep(0.01)
+    after = app.speculation_report()
+    assert after['started'] == before['started'] + 2 and after['hits'] == before['hits'] + 1
+    assert after['cancelled'] == before['cancelled'] + 1
+
+
+def test_shared_cache_serves_other_replicas_and_evicts_lru(tmp_path, monkeypatch):
+    """A stage computed by one session is reused by a fresh one; the cache stays under its size bound"""
+    import random
+    import pytest
+    app = load_app_module()
+    monkeypatch.setattr(app, 'SHARED_CACHE_PATH', str(tmp_path / "shared_cache.db"))
+    monkeypatch.setattr(app.st, 'session_state', {})
+    plan = {'timeline_structure': [{'asset_name': 'clip.mp4', 'recommended_duration': 12}]}
+    assert app.memoized_stage('plan', 'h1', lambda: plan) == (plan, False)
+
+    monkeypatch.setattr(app.st, 'session_state', {})  # Another replica: empty session tier
+    assert app.memoized_stage('plan', 'h1', lambda: pytest.fail("recomputed")) == (plan, True)
+
+    def fallback_plan():
+        app.mark_degraded("planner unavailable")
+        return plan
+    assert app.memoized_stage('plan', 'h2', fallback_plan) == (plan, False)
+    assert app.shared_cache_get('plan', 'h2') is None  # Degraded outputs never reach other replicas
+
+    monkeypatch.setattr(app, 'SHARED_CACHE_TOUCH_SECONDS', 0.0)
+    monkeypatch.setattr(app, 'SHARED_CACHE_MAX_BYTES', 3000)
+    payload = lambda i: {'script': "".join(random.Random(i).choices("abcdefghijklmnopqrstuvwxyz0123456789 ", k=1200))}
+    for i in range(3):
+        assert app.shared_cache_put('voice', f"k{i}", payload(i))
+    assert app.shared_cache_get('voice', "k0") == payload(0)  # k1 is now the least recently used
+    assert app.shared_cache_put('voice', "k3", payload(3))
+    assert app.shared_cache_get('voice', "k1") is None
+    assert app.shared_cache_get('voice', "k0") == payload(0) and app.shared_cache_get('voice', "k3") == payload(3)
+
+
+def test_local_plan_ranks_relevant_speech_first():
+    """The local planner favours transcript chunks that match the project and narrates every clip"""
+    app = load_app_module()
+    words = lambda text, start: [{'text': w, 'start': start + i * 0.4, 'end': start + i * 0.4 + 0.3} for i, w in enumerate(text.split())]
+    grind = app.build_transcript_index(words("Welcome to my kitchen everyone. " * 5 + "Grind the coffee beans medium fine for pour over.", 0.0))
+    chat = app.build_transcript_index(words("My dog likes long walks in the park. " * 6, 0.0))
+    assets = [
+        {'name': 'intro.mp4', 'asset_id': 'v1', 'media_type': 'video', 'description': '', 'duration': 20.0, 'transcript_index': grind},
+        {'name': 'dog.mp4', 'asset_id': 'v2', 'media_type': 'video', 'description': 'Walking the dog', 'duration': 20.0, 'transcript_index': chat},
+        {'name': 'cup.jpg', 'asset_id': 'i1', 'media_type': 'image', 'description': 'The finished cup of coffee', 'duration': 0}
+    ]
+
+    plan = app.create_local_content_plan(assets, 'Make a "Perfect Pour-Over Coffee" tutorial about grinding beans', 30)
+    segments = plan['timeline_structure']
+    assert plan['planner'] == 'local' and {s['asset_name'] for s in segments} == {'intro.mp4', 'dog.mp4', 'cup.jpg'}
+    best = max(segments, key=lambda s: (s['importance'], s['editing_notes']))
+    assert best['asset_name'] == 'intro.mp4' and 'Grind the coffee beans' in best['description']
+    assert [s['sequence'] for s in segments] == list(range(1, len(segments) + 1))
+    script = plan['content_to_generate'][0]['script']
+    assert script.startswith("Welcome to Perfect Pour-Over Coffee.") and "walking the dog" in script
+
+
+
+def test_job_meter_enforces_render_budget_and_exports_usage(tmp_path):
+    """Renders are charged to the job (worker threads included) and refused past the budget"""
+    import json
+    import pytest
+    app = load_app_module()
+
+    class FakeTimeline:
+        def generate_stream(self):
+            return "https://stream.example/video.m3u8"
+
+    meter = app.start_meter("multimedia_video", budgets={'renders': 2, 'rendered_seconds': 0})
+    with app.meter_scope(meter):
+        url = app.render_progressive(FakeTimeline(), 90.0, FakeTimeline(), 20.0, lambda url: None)
+        assert url and app.budget_remaining('renders') == 0
+        with pytest.raises(app.BudgetExceeded):
+            app._render_stream(FakeTimeline(), 'video_only', 90.0)
+        app.charge(enforce=False, llm_tokens=1200)
+    assert app.budget_remaining('renders') == float('inf')  # Outside the job nothing is metered
+
+    summary = app.usage_summary(meter)
+    assert summary['usage'] == {'renders': 2, 'rendered_seconds': 110.0, 'llm_tokens': 1200}
+    assert summary['budgets'] == {'renders': 2} and summary['refused'] == {'renders': 1}
+    path = app.export_usage(summary, path=str(tmp_path / "usage.jsonl"))
+    app.export_usage(summary, path=path)
+    with open(path, encoding='utf-8') as f:
+        assert [json.loads(line)['usage']['renders'] for line in f] == [2, 2]
+    assert app.format_usage(summary['usage']) == "2 renders (110s), 1.2k LLM tokens"
+
+
+def _start_hls_server(segment_count, segment_bytes, latency=0.0, fail_once=()):
+    """Local stand-in for the stream CDN: a master playlist, a media playlist and synthetic TS segments"""
+    import os
+    import threading
+    import time
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    segments = [os.urandom(segment_bytes) for _ in range(segment_count)]
+    state = {'requests': 0, 'failed': set(), 'connections': set()}
+    media = "#EXTM3U\n#EXT-X-TARGETDURATION:4\n" + "".join(f"#EXTINF:4.0,\nseg/{i}.ts\n" for i in range(segment_count)) + "#EXT-X-ENDLIST\n"
+    master = "#EXTM3U\n#EXT-X-STREAM-INF:BANDWIDTH=800000\nlow/index.m3u8\n#EXT-X-STREAM-INF:BANDWIDTH=2500000\nhigh/index.m3u8\n"
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            state['requests'] += 1
+            state['connections'].add(self.client_address)
+            time.sleep(latency)
+            if self.path == '/stream.m3u8':
+                body = master.encode()
+            elif self.path.endswith('/index.m3u8'):
+                body = media.encode()
+            else:
+                index = int(self.path.rsplit('/', 1)[1].split('.')[0])
+                if index in fail_once and index not in state['failed']:
+                    state['failed'].add(index)
+                    self.send_response(503)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                body = segments[index] if self.path.startswith('/high/') else b"low"
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, segments, state
+
+
+def test_hls_export_downloads_segments_in_order(tmp_path, monkeypatch):
+    """Segments of the best variant are fetched concurrently, retried, and written in playlist order"""
+    app = load_app_module()
+    monkeypatch.setattr(app, 'UPLOAD_BACKOFF_SECONDS', 0)
+    monkeypatch.setattr(app.shutil, 'which', lambda name: None)  # Keep the raw stream; no remux
+    server, segments, state = _start_hls_server(24, 64 * 1024, latency=0.01, fail_once={3, 17})
+    try:
+        fractions = []
+        result = app.export_render(f"http://127.0.0.1:{server.server_address[1]}/stream.m3u8", name="final",
+                                   export_dir=str(tmp_path), progress=fractions.append, workers=4)
+    finally:
+        server.shutdown()
+
+    assert result['format'] == 'ts' and result['path'] == str(tmp_path / "final.ts")
+    assert (tmp_path / "final.ts").read_bytes() == b"".join(segments)
+    assert result['segments'] == 24 and result['bytes'] == 24 * 64 * 1024 and result['mb_per_s'] > 0
+    assert fractions[-1] == 1.0 and state['failed'] == {3, 17}
+    assert len(state['connections']) <= 4 + 1  # Keep-alive: one connection per worker plus the playlist fetches
+    print(f"HLS export: {result['mb_per_s']} MB/s")
+
+
+def test_shot_detection_picks_active_window_on_a_cut():
+    """Cuts are found between shots, dead frames score zero, and the allocator crops from the liveliest shot"""
+    import numpy as np
+    app = load_app_module()
+    rng = np.random.default_rng(0)
+    frames = []
+    for i in range(100):  # 25s at 4 samples/s
+        t = i / 4
+        frame = np.full((36, 64), 100 if t < 5 else 0 if t < 7 else 180, dtype=np.uint8)
+        if t < 5:
+            frame[10:20, int(t * 10):int(t * 10) + 12] = 230  # Slow pan
+        elif 7 <= t < 15:
+            frame[5:30, 5:20] = 200  # Static slate
+        elif t >= 15:
+            frame = rng.integers(20, 120, (36, 64)).astype(np.uint8)  # Busy action
+        frames.append(frame)
+
+    shots = app.detect_shots(np.array(frames), fps=4.0)
+    assert shots['boundaries'] == [5.0, 7.0, 15.0]
+    assert max(shots['activity'][21:28]) == 0 and max(shots['activity']) == 255
+    assert app.choose_shot_window(shots, 6.0, 0.0, 25.0) == 15.0
+    assert app.choose_shot_window(None, 6.0, 0.0, 25.0) is None
+    assert app.nearest_shot_boundary(shots, 6.2, 5.5, 8.0) == 7.0
+
+    asset = {'name': 'demo.mp4', 'asset_id': 'v1', 'media_type': 'video', 'duration': 25.0, 'shots': shots}
+    clip = app.plan_clip_ranges([asset], [], 6.0)['clips'][0]
+    assert (clip['start'], clip['end']) == (15.0, 21.0)
+    clip = app.plan_clip_ranges([dict(asset, shots=None)], [], 6.0)['clips'][0]
+    assert clip['start'] == 1.0  # Without shot data: the usual short lead-in
+
+
+def test_scratch_space_reuses_spools_and_evicts_lru(tmp_path, monkeypatch):
+    """Identical uploads share one spooled file; the quota evicts old unpinned files, pins hold across reruns; the sweep clears crash leftovers"""
+    import os
+    import time
+    app = load_app_module()
+    monkeypatch.setattr(app, 'SCRATCH_ROOT', str(tmp_path / "scratch"))
+    monkeypatch.setattr(app, 'SCRATCH_MAX_BYTES', 2500)
+    monkeypatch.setattr(app, 'SCRATCH_GRACE_SECONDS', 0.0)
+
+    class Upload:
+        def __init__(self, name, data):
+            self.name, self.data = name, data
+
+        def getvalue(self):
+            return self.data
+
+    first = app.spool_upload(Upload("intro clip.mp4", b"a" * 1000), session_id="s1")
+    assert app.spool_upload(Upload("intro clip.mp4", b"a" * 1000), session_id="s1") == first
+    assert first.endswith("_intro_clip.mp4") and os.path.dirname(first) == str(tmp_path / "scratch" / "s1")
+    app.unpin_scratch([first, first])
+    second = app.spool_upload(Upload("b.mp4", b"b" * 1000), session_id="s2")  # Stays pinned
+    os.utime(first, (time.time() - 60, time.time() - 60))
+    os.utime(second, (time.time() - 120, time.time() - 120))
+
+    # Another session's rerun executes the module afresh; it must still see the pin on `second`
+    rerun = rerun_app_module(app)
+    for name in ('SCRATCH_ROOT', 'SCRATCH_MAX_BYTES', 'SCRATCH_GRACE_SECONDS'):
+        monkeypatch.setattr(rerun, name, getattr(app, name))
+    third = rerun.spool_upload(Upload("c.mp4", b"c" * 1000), session_id="s2")  # Over quota: the oldest unpinned file goes
+    assert not os.path.exists(first) and os.path.exists(second) and os.path.exists(third)
+    assert app.scratch_usage() == {'bytes': 2000, 'files': 2, 'sessions': 1, 'quota_bytes': 2500}
+
+    # Startup sweep: partial writes and idle sessions left by a crashed process are removed
+    app.unpin_scratch([second, third])
+    (tmp_path / "scratch" / "s2" / "d.mp4.part").write_bytes(b"d" * 10)
+    abandoned = tmp_path / "scratch" / "s3"
+    abandoned.mkdir()
+    (abandoned / "old.mp4").write_bytes(b"e" * 10)
+    os.utime(abandoned / "old.mp4", (time.time() - 90000, time.time() - 90000))
+    os.utime(abandoned, (time.time() - 90000, time.time() - 90000))
+    app.sweep_scratch()
+    assert sorted(os.listdir(tmp_path / "scratch")) == ["s1", "s2"]  # s1 is empty but recently used
+    assert sorted(os.listdir(tmp_path / "scratch" / "s2")) == sorted([os.path.basename(second), os.path.basename(third)])
+
+
+def test_image_preprocessing_spawns_workers_and_reports_fallback(tmp_path, monkeypatch):
+    """Images are prepared in spawned workers; if the pool cannot start, they are prepared in-process with a warning"""
+    import os
+    import pytest
+    from PIL import Image
+    app = load_app_module()
+    paths = []
+    for i in range(2):
+        path = str(tmp_path / f"photo_{i}.png")
+        Image.effect_noise((2400, 1600), 64 + i).convert('RGB').save(path)
+        paths.append(path)
+
+    monkeypatch.setattr(app.st, 'warning', lambda message: pytest.fail(message))
+    pooled = app.preprocess_images_for_upload(paths)
+    assert all(os.path.getsize(upload) == after < before for upload, before, after in pooled.values())
+    assert Image.open(pooled[paths[0]][0]).size == (1620, 1080)  # Fitted inside OUTPUT_RESOLUTION
+
+    warnings = []
+    monkeypatch.setattr(app.st, 'warning', warnings.append)
+
+    def no_processes(*args, **kwargs):
+        raise OSError("process creation is not permitted")
+    monkeypatch.setattr(app, 'ProcessPoolExecutor', no_processes)
+    assert app.preprocess_images_for_upload(paths) == pooled
+    assert len(warnings) == 1 and "process creation is not permitted" in warnings[0]
+
+
+def test_failed_ingest_setup_releases_spool_pins(tmp_path, monkeypatch):
+    """If spooling or shot detection fails before any file is processed, files already spooled are unpinned"""
+    import pytest
+    app = load_app_module()
+    monkeypatch.setattr(app, 'SCRATCH_ROOT', str(tmp_path / "scratch"))
+    monkeypatch.setattr(app.st, 'session_state', {})
+
+    class Upload:
+        def __init__(self, name, data):
+            self.name, self.data = name, data
+
+        def getvalue(self):
+            if self.data is None:
+                raise OSError("upload stream closed")
+            return self.data
+
+    def pinned():
+        return [path for path in app._scratch_state()['pins'] if path.startswith(str(tmp_path))]
+
+    with pytest.raises(OSError):
+        app.upload_and_analyze_mixed_media(None, [Upload("a.mp4", b"a" * 100), Upload("b.mp4", None)], {}, "Coffee")
+    assert pinned() == []
+
+    def failing_detection(paths):
+        raise RuntimeError("no worker available")
+    monkeypatch.setattr(app, 'start_shot_detection', failing_detection)
+    with pytest.raises(RuntimeError):
+        app.upload_and_analyze_mixed_media(None, [Upload("a.mp4", b"a" * 100), Upload("c.mp4", b"c" * 100)], {}, "Coffee")
+    assert pinned() == []
+
+
+def test_prewarm_hands_each_session_warm_clients(monkeypatch):
+    """Sessions claim clients built in the background, and each claim starts warming the next spare"""
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    app = load_app_module()
+    executor = ThreadPoolExecutor(max_workers=2)
+    pool = {'lock': threading.Lock(), 'spare': None, 'local_ready': None, 'executor': executor}
+    monkeypatch.setattr(app, '_prewarm_pool', lambda: pool)
+    monkeypatch.setattr(app, 'prewarm_local', lambda: 0.0)
+    built = []
+
+    def fake_build_clients(videodb_api_key, google_api_key, warm=False):
+        built.append((videodb_api_key, warm))
+        return (f"conn{len(built)}", "collection", "genai")
+
+    monkeypatch.setattr(app, 'build_clients', fake_build_clients)
+    try:
+        app.start_prewarm("vdb", "google")
+        app.start_prewarm("vdb", "google")  # A rerun while warming starts nothing new
+        assert app.take_prewarmed_clients("vdb", "google") == ("conn1", "collection", "genai")
+        assert app.take_prewarmed_clients("vdb", "google") == ("conn2", "collection", "genai")
+        assert app.take_prewarmed_clients("rotated", "google") is None  # Spare built with old keys is not handed out
+        executor.shutdown(wait=True)
+        assert built == [("vdb", True)] * 3 + [("rotated", True)]
+        assert pool['local_ready'].result() == 0.0
+    finally:
+        executor.shutdown(wait=True)
+
+
+def test_landing_page_prewarm_never_stops_first_paint(monkeypatch):
+    """Without secrets, with one key, or when warming fails, prewarming is skipped quietly instead of stopping the page"""
+    import pytest
+    app = load_app_module()
+    started = []
+    monkeypatch.setattr(app, 'start_prewarm', lambda *keys: started.append(keys))
+    monkeypatch.setattr(app.st, 'stop', lambda: pytest.fail("first paint stopped"))
+
+    class NoSecretsFile:
+        def get(self, key):
+            raise FileNotFoundError("No secrets.toml found")
+
+    monkeypatch.setattr(app.st, 'secrets', NoSecretsFile())
+    assert app.prewarm_if_configured() is False
+    monkeypatch.setattr(app.st, 'secrets', {'VIDEODB_API_KEY': "vdb"})
+    assert app.prewarm_if_configured() is False and started == []
+    monkeypatch.setattr(app.st, 'secrets', {'VIDEODB_API_KEY': "vdb", 'GOOGLE_API_KEY': "google"})
+    assert app.prewarm_if_configured() is True and started == [("vdb", "google")]
+
+    def failing_prewarm(*keys):
+        raise RuntimeError("executor shut down")
+    monkeypatch.setattr(app, 'start_prewarm', failing_prewarm)
+    assert app.prewarm_if_configured() is False
+
 if __name__ == "__main__":
     success = test_app_structure()
     sys.exit(0 if success else 1)